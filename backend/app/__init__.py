@@ -1,9 +1,11 @@
 from flask import Flask
 from flask_cors import CORS
 from .routes import bp as api_bp   # <-- DO NOT comment this out
+from . import memory
 
 def create_app():
     app = Flask(__name__)
-    CORS(app)
+    CORS(app, expose_headers=["ETag", "X-PrivaSee-Source"])
     app.register_blueprint(api_bp)  # <-- 'api_bp' comes from routes.py
+    memory.start_tracing()          # per-stage heap peaks in /metrics when MEMORY_TRACE is on
     return app
\ No newline at end of file
@@ -0,0 +1,97 @@
+# app/automaton.py
+"""
+Aho–Corasick multi-keyword matcher.
+
+Compiles any number of keywords into one automaton that reports every
+occurrence (overlaps included) in a single left-to-right pass, so the cost of
+a scan depends on the input length, not on how many keywords there are.
+
+Keywords are sequences of hashable symbols: plain strings (matched per
+character) or tuples of tokens (matched per token). Each keyword carries a
+label; one keyword may be added several times with different labels.
+"""
+from collections import deque
+from typing import Any, Dict, Hashable, Iterable, Iterator, List, Sequence, Set, Tuple
+
+
+class KeywordAutomaton:
+    def __init__(self, keywords: Iterable[Tuple[Sequence[Hashable], Any]] = ()):
+        self._goto: List[Dict[Hashable, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[Tuple[Tuple[int, Any], ...]] = [()]
+        self._labels: List[frozenset] = [frozenset()]
+        self.size = 0
+        for keyword, label in keywords:
+            self._add(keyword, label)
+        self._link()
+
+    def _add(self, keyword: Sequence[Hashable], label: Any) -> None:
+        if not keyword:
+            return
+        state = 0
+        for sym in keyword:
+            nxt = self._goto[state].get(sym)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[state][sym] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append(())
+                self._labels.append(frozenset())
+            state = nxt
+        self._out[state] += ((len(keyword), label),)
+        self.size += 1
+
+    def _link(self) -> None:
+        # Breadth-first: a state's fail link is the longest proper suffix that is
+        # also a prefix of some keyword; outputs are inherited along fail links.
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for sym, nxt in self._goto[state].items():
+                queue.append(nxt)
+                f = self._fail[state]
+                while f and sym not in self._goto[f]:
+                    f = self._fail[f]
+                self._fail[nxt] = self._goto[f].get(sym, 0)
+                self._out[nxt] += self._out[self._fail[nxt]]
+        self._labels = [frozenset(label for _, label in out) for out in self._out]
+        # Lazily completed transition table (goto + resolved fail edges)
+        self._delta: List[Dict[Hashable, int]] = [dict(g) for g in self._goto]
+        # A symbol no keyword uses always leads back to the root
+        self._alphabet = {sym for g in self._goto for sym in g}
+
+    def finditer(self, seq: Sequence[Hashable]) -> Iterator[Tuple[int, int, Any]]:
+        """Yield (start, end, label) for every keyword occurrence, ordered by end."""
+        delta, out, step, alphabet = self._delta, self._out, self._step, self._alphabet
+        state = 0
+        for i, sym in enumerate(seq):
+            if sym not in alphabet:
+                state = 0
+                continue
+            nxt = delta[state].get(sym)
+            state = step(state, sym) if nxt is None else nxt
+            for length, label in out[state]:
+                yield i + 1 - length, i + 1, label
+
+    def _step(self, state: int, sym: Hashable) -> int:
+        """Follow fail links for a symbol with no direct edge; memoized as a DFA edge."""
+        goto, fail = self._goto, self._fail
+        s = state
+        while s and sym not in goto[s]:
+            s = fail[s]
+        nxt = goto[s].get(sym, 0)
+        self._delta[state][sym] = nxt
+        return nxt
+
+    def labels(self, seq: Sequence[Hashable]) -> Set[Any]:
+        """Set of labels of all keywords occurring anywhere in `seq`."""
+        delta, labels, step = self._delta, self._labels, self._step
+        found: Set[Any] = set()
+        state = 0
+        for sym in seq:
+            nxt = delta[state].get(sym)
+            state = step(state, sym) if nxt is None else nxt
+            if labels[state]:
+                found |= labels[state]
+        return found
@@ -0,0 +1,151 @@
+# app/cascade.py
+"""
+Confidence-based routing in front of Gemini category scoring.
+
+Many policies are unambiguous ("we sell your data to brokers", a clean
+GDPR-grade policy) and the cheap signals already decide them. Before calling
+Gemini, estimate per-category certainty from:
+  - the heuristic delta (strong penalties/bonuses are decisive),
+  - the spaCy probability (how much the category is actually discussed),
+  - the local distilled model, when CATEGORY_SCORER == "local".
+
+Paths (recorded as result["routing"]["path"]):
+  skip       every category is certain -> no Gemini category call at all
+  partial    Gemini scores only the uncertain categories
+  full       nothing is certain -> the usual single call for all categories
+  escalated  partial/full, then categories where Gemini disagrees with a
+             fairly certain cheap estimate are re-asked of GEMINI_MODEL_LARGE
+
+A certain category's stand-in for Gemini's score must not contain the
+heuristic delta, since compute_score blends that in itself, so only the local
+model can supply one. Without it (CATEGORY_SCORER != "local") no category is
+skipped: certainty then only feeds escalation.
+
+The overview (llm_general_eval) is a separate feature and is not routed: it
+still costs a Gemini call on a "skip" request when return_general is on.
+account() counts a request's calls once they are all made; routing
+"gemini_calls" is that request's total, "gemini_calls_avoided" how many
+category calls (shards included) the unrouted path would have made on top.
+Counters: cascade.calls_made (every Gemini call: category shards, escalation,
+overview), cascade.calls_avoided (category calls skipped),
+cascade.avoided_fraction (avoided / (made + avoided)), cascade.overview_calls,
+cascade.categories_skipped / _llm, cascade.escalations.
+"""
+from typing import Any, Dict, List, Optional, Tuple
+
+from . import config, metrics
+from .distilled import local_summary_categories
+from .summarizer_gemini import llm_summary_categories
+
+CATEGORIES = list(config.CATEGORY_WEIGHTS.keys())
+
+# |heuristic delta| at which the regex signals alone settle a category
+DELTA_DECISIVE = 0.30
+
+
+def _clamp01(x: float) -> float:
+    return 0.0 if x < 0.0 else 1.0 if x > 1.0 else x
+
+
+def estimate(heuristics: Dict[str, Dict[str, Any]], spacy: Dict[str, float],
+             local: Optional[Dict[str, Dict[str, Any]]] = None) -> Dict[str, Dict[str, Any]]:
+    """
+    Cheap per-category {score, certainty, stand_in}. The heuristic estimate
+    centres on a neutral 0.5 and moves by the delta; its certainty grows with
+    |delta| and with how strongly spaCy sees the category discussed.
+    stand_in is the delta-free score to use in Gemini's place: the local
+    model's, or None when there is none.
+    """
+    out: Dict[str, Dict[str, Any]] = {}
+    for cat in CATEGORIES:
+        delta = float(((heuristics or {}).get(cat) or {}).get("delta", 0.0))
+        prob = (spacy or {}).get(cat)
+        support = 0.5 if prob is None else 0.5 + 0.5 * _clamp01(float(prob))
+        stand_in = float(local[cat]["score"]) if local and cat in local else None
+        est: Dict[str, Any] = {
+            "score": _clamp01(0.5 + delta),
+            "certainty": min(1.0, abs(delta) / DELTA_DECISIVE) * support,
+            "stand_in": stand_in,
+        }
+        if local and cat in local and local[cat].get("confidence", 0.0) > est["certainty"]:
+            est = {"score": stand_in, "certainty": float(local[cat]["confidence"]), "stand_in": stand_in}
+        out[cat] = est
+    return out
+
+
+def _category_calls(n_categories: int) -> int:
+    """Gemini calls llm_summary_categories makes for that many categories (GEMINI_CATEGORY_SHARDS)."""
+    if not n_categories:
+        return 0
+    return min(max(1, int(getattr(config, "GEMINI_CATEGORY_SHARDS", 1))), n_categories)
+
+
+def account(routing: Dict[str, Any], overview_calls: int = 0) -> None:
+    """
+    Count one routed request's Gemini calls once all of them are made:
+    score_categories' category and escalation calls plus `overview_calls`.
+    """
+    routing["gemini_calls"] += overview_calls
+    metrics.incr("cascade.overview_calls", overview_calls)
+    metrics.incr("cascade.calls_made", routing["gemini_calls"])
+    metrics.incr("cascade.calls_avoided", routing["gemini_calls_avoided"])
+    made, saved = metrics.get("cascade.calls_made"), metrics.get("cascade.calls_avoided")
+    metrics.set_value("cascade.avoided_fraction", saved / (made + saved) if made + saved else 0.0)
+
+
+def score_categories(
+    text: str,
+    heuristics: Dict[str, Dict[str, Any]],
+    spacy: Dict[str, float],
+) -> Tuple[Dict[str, Dict[str, Any]], Dict[str, Any]]:
+    """
+    Per-category {score, reason} in llm_summary_categories' shape, plus the
+    routing record to pass on to compute_score (and to account(), once any
+    overview call is made too).
+    """
+    local = local_summary_categories(text) if getattr(config, "CATEGORY_SCORER", "gemini") == "local" else None
+    cheap = estimate(heuristics, spacy, local)
+    threshold = config.CASCADE_SKIP_CERTAINTY
+    uncertain = [cat for cat in CATEGORIES
+                 if cheap[cat]["certainty"] < threshold or cheap[cat]["stand_in"] is None]
+
+    # Certain categories: the local model's score takes Gemini's place. An empty
+    # reason lets compute_score fall back to the heuristic flags as the reason.
+    cats: Dict[str, Dict[str, Any]] = {
+        cat: {"score": cheap[cat]["stand_in"], "reason": ""} for cat in CATEGORIES if cat not in uncertain
+    }
+    path = "skip" if not uncertain else "full" if len(uncertain) == len(CATEGORIES) else "partial"
+    escalated: List[str] = []
+    calls = 0
+
+    if uncertain:
+        calls += _category_calls(len(uncertain))
+        llm = llm_summary_categories(text, categories=None if path == "full" else uncertain)
+        cats.update({cat: llm[cat] for cat in uncertain})
+
+        # Disagreement with a fairly certain cheap estimate -> ask the larger model
+        large = getattr(config, "GEMINI_MODEL_LARGE", None)
+        if large:
+            escalated = [
+                cat for cat in uncertain
+                if cheap[cat]["certainty"] >= config.CASCADE_ESCALATE_CERTAINTY
+                and abs(llm[cat]["score"] - cheap[cat]["score"]) >= config.CASCADE_DISAGREEMENT
+            ]
+            if escalated:
+                calls += _category_calls(len(escalated))
+                cats.update(llm_summary_categories(text, categories=escalated, model=large))
+                metrics.incr("cascade.escalations")
+                path = "escalated"
+
+    metrics.incr("cascade.categories_skipped", len(CATEGORIES) - len(uncertain))
+    metrics.incr("cascade.categories_llm", len(uncertain))
+
+    routing = {
+        "path": path,
+        "llm_categories": uncertain,
+        "escalated": escalated,
+        "certainty": {cat: round(cheap[cat]["certainty"], 3) for cat in CATEGORIES},
+        "gemini_calls": calls,
+        "gemini_calls_avoided": _category_calls(len(CATEGORIES)) - _category_calls(len(uncertain)),
+    }
+    return {cat: cats[cat] for cat in CATEGORIES}, routing
@@ -1,3 +1,5 @@
+import os
+
 CATEGORY_WEIGHTS = {
     "Data Collection": 0.15,
     "Third-Party Sharing/Selling": 0.20,
@@ -18,3 +20,124 @@ API_VERSION = "v1"
 DEBUG = True
 HOST = "0.0.0.0"
 PORT = 5001
+
+# Relative paths of the stores below (JOBS_DB_PATH, TRUST_INDEX_PATH, SIGNAL_STORE_PATH,
+# TRENDS_PATH, EVIDENCE_INDEX_PATH, SHADOW_LOG_PATH) are taken under DATA_DIR, not the CWD
+DATA_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))   # backend/
+
+
+def data_path(path):
+    """`path` anchored to DATA_DIR when relative; None stays None."""
+    return os.path.join(DATA_DIR, path) if path and not os.path.isabs(path) else path
+
+
+# Request coalescing (single-flight) for identical in-flight analyses.
+# None = coalesce within each process only; set to a directory shared by all
+# workers on the host to also coordinate across processes (flock-based).
+SINGLEFLIGHT_LOCK_DIR = None
+SINGLEFLIGHT_RESULT_TTL = 10.0  # seconds a finished result stays visible to other processes
+
+# Async job queue for long (page-mode) analyses: POST /analyze {"async": true}
+JOBS_STORE = None                # "package.module.factory" (or a callable) returning a jobs.JobStore;
+                                 # None = SQLiteJobStore at JOBS_DB_PATH
+JOBS_DB_PATH = "privasee_jobs.sqlite3"
+JOBS_WORKERS = 2                 # worker threads per process (0 = enqueue only)
+JOBS_MAX_ATTEMPTS = 3
+JOBS_RETRY_BASE_SECONDS = 2.0    # backoff: base * 2^(attempt-1)
+JOBS_LEASE_SECONDS = 300.0       # a running job is re-claimed if its worker goes silent this long
+JOBS_RESULT_TTL = 3600.0         # finished jobs are reused for dedup, then purged
+JOBS_MAX_WAIT = 30.0             # cap for GET /jobs/<id>?wait=
+
+# Precomputed trust-score index (python -m backend.app.trust_index build ...).
+# None disables lookups; workers re-stat the file every TRUST_INDEX_CHECK_SECONDS
+# and pick up an atomically replaced rebuild without restarting.
+TRUST_INDEX_PATH = None
+TRUST_INDEX_CHECK_SECONDS = 5.0
+
+# Incremental heuristics: scanner state kept per /analyze "session_id" (LRU)
+HEURISTIC_SESSIONS_MAX = 256
+
+# Per-category scorer: "gemini", or "local" for the distilled model
+# (python -m backend.app.distilled train ...), falling back to Gemini when
+# the model's confidence for a text is below LOCAL_SCORER_MIN_CONFIDENCE.
+CATEGORY_SCORER = "gemini"
+LOCAL_SCORER_PATH = None
+LOCAL_SCORER_MIN_CONFIDENCE = 0.6
+
+# LLM cascade: skip or narrow Gemini category scoring when heuristics/spaCy and
+# the local model are already certain (skipping needs CATEGORY_SCORER = "local"). See cascade.py.
+CASCADE_ENABLED = False
+CASCADE_SKIP_CERTAINTY = 0.8       # category certainty needed to skip Gemini for it
+CASCADE_ESCALATE_CERTAINTY = 0.5   # cheap estimate this certain + Gemini disagrees -> escalate
+CASCADE_DISAGREEMENT = 0.4         # |Gemini - cheap estimate| counted as disagreement
+GEMINI_MODEL_LARGE = None          # e.g. "gemini-2.5-pro"; None disables escalation
+
+# Evidence snippets: "matcher" (phrase/token patterns) or "vector" (sentence-embedding
+# retrieval against per-category prototypes, see vector_evidence.py)
+EVIDENCE_RETRIEVAL = "matcher"
+EVIDENCE_MIN_SIMILARITY = 0.35  # vector mode: cosine below this is not evidence
+
+# spaCy parsing/matching runs in a bounded pool shared by a process's request
+# threads (one model per process, see nlp_spacy.py); 0 = on the request thread
+SPACY_THREADS = 4
+
+# Per-request memory (see memory.py). A text whose spaCy Doc would exceed the
+# budget is parsed in pieces that fit. SPACY_BYTES_PER_CHAR is the Doc's peak
+# cost per character of text (~600 for en_core_web_sm); calibrate it for your
+# model with python -m backend.bench.memory. MEMORY_TRACE turns on tracemalloc
+# peaks per stage in /metrics (slows allocation down; RSS growth is always on).
+REQUEST_MEMORY_BUDGET_MB = 64    # None = never chunk
+SPACY_BYTES_PER_CHAR = 600
+MEMORY_TRACE = False
+
+# Shadow evaluation (see shadow.py): re-run a sample of live /analyze requests
+# through candidate rules / spaCy model / Gemini model after the response is
+# sent, and log how the candidate's scores and risk bands diverge.
+SHADOW_SAMPLE_RATE = 0.0        # fraction of requests; 0 = off
+SHADOW_RULES_PATH = None        # candidate rule file; None = production's rules
+SHADOW_SPACY_MODEL_DIR = None   # candidate spaCy model directory; None = production's model
+SHADOW_GEMINI_MODEL = None      # candidate Gemini model (extra billed calls); None = reuse production's scores
+SHADOW_WORKERS = 1
+SHADOW_QUEUE_MAX = 16           # sampled requests beyond this many waiting are dropped
+SHADOW_CPU_BUDGET = 0.10        # share of one core each shadow worker may use, on average
+SHADOW_LOG_MIN_DELTA = 0.05     # log category scores that moved at least this much
+SHADOW_LOG_PATH = None          # also append every comparison here as a JSON line
+
+# Gemini transport: "sdk" (google-generativeai client) or "pooled" (REST over a
+# keep-alive connection pool with per-call deadlines and p95 hedging, see
+# gemini_transport.py). GEMINI_API_BASE can also be set in the environment.
+GEMINI_TRANSPORT = "sdk"
+GEMINI_API_BASE = "https://generativelanguage.googleapis.com"
+GEMINI_TIMEOUT_SECONDS = 30.0    # whole call, hedges included
+GEMINI_POOL_SIZE = 8             # idle keep-alive connections kept per process
+GEMINI_HEDGE = True              # pooled: duplicate a call that runs past the recent p95
+GEMINI_HEDGE_MIN_SECONDS = 0.5   # never hedge sooner than this
+GEMINI_CATEGORY_SHARDS = 1       # >1: score categories in that many parallel prompts
+
+# Rule sets (keyword lexicon, heuristic patterns, spaCy token patterns, preferences,
+# category weights) are loaded from a versioned JSON file and hot-reloaded; see rules.py.
+# CATEGORY_WEIGHTS above fixes the category set and documents the defaults.
+RULES_PATH = None               # None = app/rules/default.json
+RULES_CHECK_SECONDS = 5.0       # how often workers stat the file (0 = never reload)
+SIGNALS_CACHE_SIZE = 256        # recent per-text signals kept per process (0 = off)
+
+# Columnar store of raw per-category signals, for bulk rescoring when weights
+# change (python -m backend.app.signal_store rescore ...); see signal_store.py.
+SIGNAL_STORE_PATH = None        # directory; None = don't record
+SIGNAL_STORE_FLUSH_ROWS = 256   # rows buffered per process before writing a chunk
+SIGNAL_STORE_FLUSH_SECONDS = 60.0   # ... or this often, whichever comes first
+
+# Trend store for dashboards (scores + heuristic flags per served analysis,
+# Parquet queried with DuckDB at GET /trends/...; pip install duckdb); see trends.py.
+TRENDS_PATH = None              # directory; None = don't record
+TRENDS_FLUSH_ROWS = 1000        # analyses per write-behind batch ...
+TRENDS_FLUSH_SECONDS = 10.0     # ... or this often, whichever comes first
+TRENDS_MAX_PENDING = 50_000     # queued analyses per process before dropping (trends.dropped)
+TRENDS_COMPACT_PARTS = 32       # merge a table's small files once it has more than this
+
+# Full-text index of evidence sentences and heuristic hits for GET /search
+# (SQLite FTS5); see evidence_index.py.
+EVIDENCE_INDEX_PATH = None      # SQLite file; None = don't index
+EVIDENCE_INDEX_FLUSH_ROWS = 200     # analyses per write-behind batch ...
+EVIDENCE_INDEX_FLUSH_SECONDS = 5.0  # ... or this often, whichever comes first
+EVIDENCE_INDEX_MAX_PENDING = 1000   # queued analyses (texts included) per process before dropping
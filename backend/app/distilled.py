@@ -0,0 +1,377 @@
+# app/distilled.py
+"""
+Local distilled category scorer: a fast, offline stand-in for Gemini's
+per-category scores (llm_summary_categories).
+
+Model: hashed word unigrams + bigrams (log TF, L2-normalized) -> multi-output
+ridge regression, one output per category. Pure NumPy, CPU only; inference
+is a sparse dot product (single-digit ms for a full policy). Training keeps
+the features sparse (CSR arrays) and solves the primal normal equations by
+conjugate gradients, so memory grows with the corpus' nonzeros, not n^2.
+
+Confidence is per text: how typical the text is of the training corpus
+(Mahalanobis distance of a fixed random projection of its features, ranked
+against the training texts' distances), scaled down for categories whose
+holdout error is large. A policy unlike anything distilled from Gemini falls
+back to Gemini even when the model is good on familiar ones.
+
+Workflow:
+  1) collect  run Gemini over a corpus once and keep its scores as labels
+       python -m backend.app.distilled collect corpus.jsonl labels.jsonl
+  2) train    fit on a train split, report accuracy vs Gemini on the holdout
+       python -m backend.app.distilled train labels.jsonl distilled.npz
+  3) report   re-run the accuracy-vs-Gemini report on any labelled set
+       python -m backend.app.distilled report distilled.npz labels.jsonl
+
+Serving: set CATEGORY_SCORER = "local" and LOCAL_SCORER_PATH in config.py.
+/analyze then scores categories locally and only calls Gemini when the
+model's confidence for the text is below LOCAL_SCORER_MIN_CONFIDENCE.
+"""
+import json
+import math
+import re
+import threading
+import time
+import zlib
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from . import config, metrics
+from .hashing import text_hash
+
+CATEGORIES = list(config.CATEGORY_WEIGHTS.keys())
+N_FEATURES = 1 << 14
+_TOKEN = re.compile(r"[a-z0-9]+")
+
+# Confidence: a category whose holdout MAE is at/above this gets 0
+_MAE_CAP = 0.25
+# Typicality is measured in this many random-projection dimensions
+_PROJ_DIMS = 64
+_PROJ_SEED = 20240611
+_QUANTILES = np.linspace(0.0, 1.0, 101)
+
+
+# ---------------------------
+# Features
+# ---------------------------
+def featurize(text: str) -> Tuple[np.ndarray, np.ndarray]:
+    """Sparse feature vector as (indices, values): hashed unigrams + bigrams."""
+    tokens = _TOKEN.findall(text.lower())
+    counts = Counter(tokens)
+    counts.update(" ".join(pair) for pair in zip(tokens, tokens[1:]))
+    if not counts:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+    acc: Dict[int, float] = {}
+    for term, n in counts.items():
+        idx = zlib.crc32(term.encode("utf-8")) & (N_FEATURES - 1)
+        acc[idx] = acc.get(idx, 0.0) + 1.0 + math.log(n)
+    idx = np.fromiter(acc.keys(), dtype=np.int64, count=len(acc))
+    val = np.fromiter(acc.values(), dtype=np.float32, count=len(acc))
+    val /= np.linalg.norm(val)
+    return idx, val
+
+
+class _Features:
+    """Hashed features of many texts as CSR arrays (n x N_FEATURES, never densified)."""
+
+    def __init__(self, texts: Iterable[str]):
+        rows = [featurize(t) for t in texts]
+        sizes = np.array([len(idx) for idx, _ in rows], dtype=np.int64)
+        self.n = len(rows)
+        self.indptr = np.concatenate(([0], np.cumsum(sizes)))
+        self.indices = np.concatenate([idx for idx, _ in rows])
+        self.data = np.concatenate([val for _, val in rows]).astype(np.float64)
+        self.row = np.repeat(np.arange(self.n), sizes)
+
+    def dot(self, w: np.ndarray) -> np.ndarray:
+        """X @ w for one weight column."""
+        return np.bincount(self.row, weights=self.data * w[self.indices], minlength=self.n)
+
+    def tdot(self, v: np.ndarray) -> np.ndarray:
+        """X.T @ v for one per-row vector."""
+        return np.bincount(self.indices, weights=self.data * v[self.row], minlength=N_FEATURES)
+
+    def project(self, R: np.ndarray) -> np.ndarray:
+        """X @ R, row by row."""
+        bounds = zip(self.indptr[:-1], self.indptr[1:])
+        return np.stack([self.data[a:b] @ R[self.indices[a:b]] for a, b in bounds])
+
+
+def _ridge_cg(X: _Features, y: np.ndarray, l2: float, tol: float = 1e-6, max_iter: int = 1000) -> np.ndarray:
+    """Solve (X.T X + l2 I) w = X.T y by conjugate gradients."""
+    w = np.zeros(N_FEATURES)
+    r = X.tdot(y)
+    p = r.copy()
+    rs = r @ r
+    stop = tol * tol * rs
+    for _ in range(max_iter):
+        if rs <= stop:
+            break
+        Ap = X.tdot(X.dot(p)) + l2 * p
+        step = rs / (p @ Ap)
+        w += step * p
+        r -= step * Ap
+        rs, rs_prev = r @ r, rs
+        p = r + (rs / rs_prev) * p
+    return w
+
+
+def _projection() -> np.ndarray:
+    rng = np.random.default_rng(_PROJ_SEED)
+    return (rng.standard_normal((N_FEATURES, _PROJ_DIMS)) / math.sqrt(_PROJ_DIMS)).astype(np.float32)
+
+
+# ---------------------------
+# Model
+# ---------------------------
+class DistilledScorer:
+    def __init__(self, W: np.ndarray, b: np.ndarray, proj_mean: np.ndarray, proj_prec: np.ndarray,
+                 dist_q: np.ndarray, mae: np.ndarray, meta: Dict[str, Any]):
+        self.W = W.astype(np.float32)                  # (N_FEATURES, C)
+        self.b = b.astype(np.float32)                  # (C,)
+        self.proj_mean = proj_mean.astype(np.float64)  # (_PROJ_DIMS,) training texts' mean projection
+        self.proj_prec = proj_prec.astype(np.float64)  # (_PROJ_DIMS, _PROJ_DIMS) its inverse covariance
+        self.dist_q = dist_q.astype(np.float64)        # (101,) quantiles of the training texts' distances
+        self.mae = mae.astype(np.float32)              # (C,) holdout mean absolute error vs Gemini
+        self.meta = meta
+        self._R = _projection()
+
+    @classmethod
+    def fit(cls, texts: List[str], Y: np.ndarray, l2: float = 1.0) -> "DistilledScorer":
+        """Ridge regression, one conjugate-gradient solve per category."""
+        X = _Features(texts)
+        b = Y.mean(axis=0)
+        W = np.stack([_ridge_cg(X, (Y[:, i] - b[i]).astype(np.float64), l2) for i in range(Y.shape[1])], axis=1)
+
+        Z = X.project(_projection()).astype(np.float64)
+        mean = Z.mean(axis=0)
+        cov = np.cov(Z, rowvar=False) if len(texts) > 1 else np.zeros((_PROJ_DIMS, _PROJ_DIMS))
+        cov += np.eye(_PROJ_DIMS) * max(1e-3 * np.trace(cov) / _PROJ_DIMS, 1e-9)   # shrink: n may be < dims
+        prec = np.linalg.inv(cov)
+        D = Z - mean
+        dist = np.sqrt(np.einsum("ij,jk,ik->i", D, prec, D))
+        return cls(W, b, mean, prec, np.quantile(dist, _QUANTILES), np.zeros(len(CATEGORIES)),
+                   {"l2": l2, "n_train": len(texts)})
+
+    def typicality(self, idx: np.ndarray, val: np.ndarray) -> float:
+        """
+        1.0 for a text no farther from the training corpus' centre than the
+        nearer half of the training texts, falling to 0 beyond the farthest.
+        """
+        if not len(idx):
+            return 0.0
+        d = (val @ self._R[idx]).astype(np.float64) - self.proj_mean
+        dist = math.sqrt(max(0.0, float(d @ self.proj_prec @ d)))
+        farther = 1.0 - float(np.interp(dist, self.dist_q, _QUANTILES, left=0.0, right=1.0))
+        return min(1.0, 2.0 * farther)
+
+    def predict(self, text: str) -> Tuple[np.ndarray, np.ndarray]:
+        """(scores, confidences), each shaped (C,) and in [0,1]."""
+        idx, val = featurize(text)
+        scores = np.clip(val @ self.W[idx] + self.b, 0.0, 1.0) if len(idx) else self.b.copy()
+        conf = self.typicality(idx, val) * np.clip(1.0 - self.mae / _MAE_CAP, 0.0, 1.0)
+        return scores, conf
+
+    def save(self, path: str) -> None:
+        with open(path, "wb") as fh:  # file handle: np.savez would append ".npz" to the name
+            np.savez_compressed(
+                fh, W=self.W, b=self.b, proj_mean=self.proj_mean, proj_prec=self.proj_prec,
+                dist_q=self.dist_q, mae=self.mae,
+                meta=np.frombuffer(json.dumps(dict(self.meta, categories=CATEGORIES)).encode(), dtype=np.uint8),
+            )
+
+    @classmethod
+    def load(cls, path: str) -> "DistilledScorer":
+        with np.load(path) as z:
+            meta = json.loads(z["meta"].tobytes().decode())
+            if meta.get("categories") != CATEGORIES:
+                raise ValueError(f"{path}: trained for different categories")
+            if "dist_q" not in z.files:
+                raise ValueError(f"{path}: written by an older version without typicality data; retrain it")
+            return cls(z["W"], z["b"], z["proj_mean"], z["proj_prec"], z["dist_q"], z["mae"], meta)
+
+
+# ---------------------------
+# Serving
+# ---------------------------
+_scorer: Optional[DistilledScorer] = None
+_scorer_lock = threading.Lock()
+
+
+def _get_scorer() -> Optional[DistilledScorer]:
+    global _scorer
+    if _scorer is None and getattr(config, "LOCAL_SCORER_PATH", None):
+        with _scorer_lock:
+            if _scorer is None:
+                _scorer = DistilledScorer.load(config.LOCAL_SCORER_PATH)
+    return _scorer
+
+
+def local_summary_categories(text: str) -> Optional[Dict[str, Dict[str, Any]]]:
+    """
+    Per-category {score, reason, confidence} from the local model, in the shape
+    llm_summary_categories returns; None when no model is configured.
+    """
+    scorer = _get_scorer()
+    if scorer is None:
+        return None
+    scores, conf = scorer.predict(text)
+    return {
+        cat: {"score": float(scores[i]), "reason": "", "confidence": float(conf[i])}
+        for i, cat in enumerate(CATEGORIES)
+    }
+
+
+def category_scores(text: str, llm_fallback) -> Dict[str, Dict[str, Any]]:
+    """
+    Local scores when CATEGORY_SCORER == "local" and the model is confident
+    enough for every category; otherwise llm_fallback(text) (Gemini).
+    """
+    if getattr(config, "CATEGORY_SCORER", "gemini") == "local":
+        local = local_summary_categories(text)
+        if local is not None and min(v["confidence"] for v in local.values()) >= config.LOCAL_SCORER_MIN_CONFIDENCE:
+            metrics.incr("local_scorer.used")
+            return local
+        metrics.incr("local_scorer.fallback")
+    return llm_fallback(text)
+
+
+# ---------------------------
+# Offline: collect / train / report
+# ---------------------------
+def _read_jsonl(path: str) -> Iterable[Dict[str, Any]]:
+    with open(path, "r", encoding="utf-8") as fh:
+        for line in fh:
+            if line.strip():
+                yield json.loads(line)
+
+
+def collect(corpus_path: str, out_path: str) -> int:
+    """Label corpus texts with Gemini scores; appends, skipping texts already labelled."""
+    from .summarizer_gemini import llm_summary_categories
+
+    done = set()
+    try:
+        done = {row["text_hash"] for row in _read_jsonl(out_path)}
+    except FileNotFoundError:
+        pass
+    n = 0
+    with open(out_path, "a", encoding="utf-8") as out:
+        for row in _read_jsonl(corpus_path):
+            text = (row.get("text") or "").strip()
+            h = text_hash(text)
+            if not text or h in done:
+                continue
+            cats = llm_summary_categories(text)
+            out.write(json.dumps({"text_hash": h, "text": text,
+                                  "scores": {c: cats[c]["score"] for c in CATEGORIES}}) + "\n")
+            out.flush()
+            done.add(h)
+            n += 1
+    return n
+
+
+def _labels(rows: List[Dict[str, Any]]) -> np.ndarray:
+    return np.array([[float(r["scores"].get(c, 0.5)) for c in CATEGORIES] for r in rows], dtype=np.float32)
+
+
+def _band(x: np.ndarray) -> np.ndarray:
+    return np.digitize(x, [0.4, 0.7])
+
+
+def evaluate(scorer: DistilledScorer, rows: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Accuracy vs Gemini labels: per-category errors, band agreement, Trust Score drift, latency."""
+    from .scoring import compute_score
+
+    Y = _labels(rows)
+    preds, latencies = [], []
+    for r in rows:
+        t0 = time.perf_counter()
+        preds.append(scorer.predict(r["text"])[0])
+        latencies.append(time.perf_counter() - t0)
+    P = np.array(preds, dtype=np.float32)
+
+    per_cat = {}
+    for i, cat in enumerate(CATEGORIES):
+        err = P[:, i] - Y[:, i]
+        corr = np.corrcoef(P[:, i], Y[:, i])[0, 1] if len(rows) > 1 and Y[:, i].std() > 0 and P[:, i].std() > 0 else float("nan")
+        per_cat[cat] = {
+            "mae": float(np.abs(err).mean()),
+            "rmse": float(np.sqrt((err ** 2).mean())),
+            "pearson_r": float(corr),
+            "band_agreement": float((_band(P[:, i]) == _band(Y[:, i])).mean()),
+        }
+
+    def trust(scores):
+        llm = {c: {"score": float(scores[i])} for i, c in enumerate(CATEGORIES)}
+        out = compute_score(heuristics={}, llm=llm)
+        return out["trust_score"], out["risk_level"]
+
+    trust_pairs = [(trust(p), trust(y)) for p, y in zip(P, Y)]
+    lat = np.array(latencies) * 1e3
+    return {
+        "n": len(rows),
+        "categories": per_cat,
+        "trust_score_mae": float(np.mean([abs(a[0] - b[0]) for a, b in trust_pairs])),
+        "risk_level_agreement": float(np.mean([a[1] == b[1] for a, b in trust_pairs])),
+        "latency_ms": {"p50": float(np.percentile(lat, 50)), "p95": float(np.percentile(lat, 95))},
+    }
+
+
+def format_report(report: Dict[str, Any]) -> str:
+    lines = [f"Distilled scorer vs Gemini on {report['n']} policies",
+             f"{'category':<42} {'MAE':>6} {'RMSE':>6} {'r':>6} {'band':>6}"]
+    for cat, m in report["categories"].items():
+        lines.append(f"{cat:<42} {m['mae']:>6.3f} {m['rmse']:>6.3f} {m['pearson_r']:>6.2f} {m['band_agreement']:>6.1%}")
+    lines.append(f"Trust Score MAE: {report['trust_score_mae']:.1f} points; "
+                 f"risk level agreement: {report['risk_level_agreement']:.1%}")
+    lines.append(f"Inference: p50 {report['latency_ms']['p50']:.2f} ms, p95 {report['latency_ms']['p95']:.2f} ms")
+    return "\n".join(lines)
+
+
+def train(labels_path: str, model_path: str, holdout: float = 0.2, l2: float = 1.0, seed: int = 13) -> Dict[str, Any]:
+    """Fit on a shuffled train split; the holdout sets per-category MAE (confidence) and the report."""
+    rows = list(_read_jsonl(labels_path))
+    if len(rows) < 10:
+        raise ValueError(f"need at least 10 labelled policies, got {len(rows)}")
+    order = np.random.default_rng(seed).permutation(len(rows))
+    n_hold = max(1, int(len(rows) * holdout))
+    hold = [rows[i] for i in order[:n_hold]]
+    train_rows = [rows[i] for i in order[n_hold:]]
+
+    scorer = DistilledScorer.fit([r["text"] for r in train_rows], _labels(train_rows), l2=l2)
+    report = evaluate(scorer, hold)
+    scorer.mae = np.array([report["categories"][c]["mae"] for c in CATEGORIES], dtype=np.float32)
+    scorer.meta["report"] = report
+    scorer.save(model_path)
+    with open(f"{model_path}.report.json", "w", encoding="utf-8") as fh:
+        json.dump(report, fh, indent=2)
+    return report
+
+
+if __name__ == "__main__":
+    import argparse
+
+    ap = argparse.ArgumentParser(description="Distill Gemini category scores into a local model.")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    c = sub.add_parser("collect", help="label a {\"text\"} JSONL corpus with Gemini")
+    c.add_argument("corpus")
+    c.add_argument("labels")
+    t = sub.add_parser("train", help="fit + write model and accuracy report")
+    t.add_argument("labels")
+    t.add_argument("model")
+    t.add_argument("--holdout", type=float, default=0.2)
+    t.add_argument("--l2", type=float, default=1.0)
+    r = sub.add_parser("report", help="accuracy vs Gemini on a labelled set")
+    r.add_argument("model")
+    r.add_argument("labels")
+    args = ap.parse_args()
+
+    if args.cmd == "collect":
+        print(f"labelled {collect(args.corpus, args.labels)} new policies")
+    elif args.cmd == "train":
+        print(format_report(train(args.labels, args.model, holdout=args.holdout, l2=args.l2)))
+    else:
+        print(format_report(evaluate(DistilledScorer.load(args.model), list(_read_jsonl(args.labels)))))
@@ -0,0 +1,541 @@
+# app/evidence_index.py
+"""
+Full-text index over evidence sentences, for analyst queries across every
+analyzed policy ("data brokers" AND "precise location") without re-running
+spaCy.
+
+Rows are the evidence sentences of spacy_extract_category_lines (kind
+"evidence", with their category and score) and the sentences/lines where a
+heuristic pattern fires (kind "heuristic", with the pattern key; no score).
+They live in a SQLite file (EVIDENCE_INDEX_PATH) with an FTS5 table over the
+sentence text (porter stemming, so "brokers" finds "broker"), next to the
+policy each came from.
+
+Building is incremental: every analysis that computed evidence is queued
+(write_behind.py) and indexed off the request path, keyed by text hash. A
+policy is re-indexed only when it comes back under different rules or with
+more evidence than before (a larger snippets_top_k). Backfill a corpus, with
+every matching sentence rather than the top few per category:
+
+  python -m backend.app.evidence_index build corpus.jsonl [--index path]
+
+Queries (GET /search, or search()): FTS5-style boolean syntax, i.e. words,
+"quoted phrases", prefix*, AND / OR / NOT and parentheses (adjacent terms
+mean AND). scope="sentence" needs the whole query to match one sentence;
+scope="policy" lets each term match a different sentence of the same policy.
+Filters: categories, score range (evidence rows only), kind, domain.
+Results come newest policy first (order="relevance" ranks by bm25 instead);
+totals are exact up to COUNT_CAP.
+"""
+import html
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from contextlib import closing
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from . import config, metrics, rules
+from .write_behind import WriteBehind
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS policies (
+    id          INTEGER PRIMARY KEY,
+    text_hash   TEXT NOT NULL UNIQUE,
+    url         TEXT,
+    domain      TEXT,
+    rules       TEXT NOT NULL,
+    top_k       INTEGER,              -- evidence per category indexed; NULL = all
+    indexed_at  REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS policies_domain ON policies(domain);
+CREATE TABLE IF NOT EXISTS sentences (
+    id          INTEGER PRIMARY KEY,  -- (policy id << 16) + n, see SENTENCE_BITS
+    kind        TEXT NOT NULL,        -- 'evidence' | 'heuristic'
+    category    TEXT NOT NULL,
+    pattern     TEXT,                 -- heuristic pattern key
+    score       REAL,                 -- evidence score; NULL for heuristic rows
+    start       INTEGER NOT NULL,
+    "end"       INTEGER NOT NULL,
+    text        TEXT NOT NULL
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS sentences_fts USING fts5(
+    text, content='sentences', content_rowid='id', tokenize='porter unicode61'
+);
+CREATE TRIGGER IF NOT EXISTS sentences_ai AFTER INSERT ON sentences BEGIN
+    INSERT INTO sentences_fts(rowid, text) VALUES (new.id, new.text);
+END;
+CREATE TRIGGER IF NOT EXISTS sentences_ad AFTER DELETE ON sentences BEGIN
+    INSERT INTO sentences_fts(sentences_fts, rowid, text) VALUES ('delete', old.id, old.text);
+END;
+-- All of a policy's sentences as one document (rowid = policy id), for
+-- policy-scope queries without sentence filters
+CREATE VIRTUAL TABLE IF NOT EXISTS policy_fts USING fts5(
+    text, content='', tokenize='porter unicode61'
+);
+"""
+
+# A sentence's rowid carries its policy id, so which policies an FTS match
+# hits is known without reading any row, and a policy's sentences are one
+# rowid range (FTS5 can seek to it).
+SENTENCE_BITS = 16
+MAX_SENTENCES = 1 << SENTENCE_BITS    # per policy; the rest are not indexed
+
+SCOPES = ("sentence", "policy")
+ORDERS = ("recent", "relevance")
+KINDS = ("evidence", "heuristic")
+MAX_LIMIT = 100
+COUNT_CAP = 10_000      # totals above this are reported as a lower bound
+
+
+# ---------------------------
+# Query parsing: the FTS5 boolean subset, re-serialized so user input can
+# never be an FTS5 syntax error, and split into leaves for policy scope
+# ---------------------------
+_TOKEN = re.compile(r'\s*(?:(")((?:[^"]|"")*)"(\*?)|(\()|(\))|([^\s()"]+))')
+
+
+class QueryError(ValueError):
+    pass
+
+
+def _tokenize(q: str) -> List[Tuple[str, str]]:
+    out, pos = [], 0
+    q = q.strip()
+    while pos < len(q):
+        m = _TOKEN.match(q, pos)
+        if not m or m.end() == pos:
+            raise QueryError(f"unbalanced quote at {pos}")
+        pos = m.end()
+        quote, phrase, star, lp, rp, word = m.groups()
+        if quote:
+            out.append(("term", phrase.replace('""', '"') + star))
+        elif lp:
+            out.append(("(", lp))
+        elif rp:
+            out.append((")", rp))
+        elif word in ("AND", "OR", "NOT"):
+            out.append((word, word))
+        else:
+            out.append(("term", word))
+    return out
+
+
+class _Parser:
+    """expr := and (OR and)* ; and := not (AND? not)* ; not := atom (NOT atom)* ; atom := term | ( expr )"""
+
+    def __init__(self, tokens):
+        self.tokens, self.i = tokens, 0
+
+    def peek(self):
+        return self.tokens[self.i][0] if self.i < len(self.tokens) else None
+
+    def take(self, kind):
+        if self.peek() != kind:
+            raise QueryError(f"expected {kind!r}" + (f", got {self.tokens[self.i][1]!r}" if self.peek() else " at end"))
+        self.i += 1
+        return self.tokens[self.i - 1][1]
+
+    def parse(self):
+        if not self.tokens:
+            raise QueryError("empty query")
+        node = self.expr()
+        if self.peek() is not None:
+            raise QueryError(f"unexpected {self.tokens[self.i][1]!r}")
+        return node
+
+    def expr(self):
+        node = self.and_()
+        while self.peek() == "OR":
+            self.take("OR")
+            node = ("OR", node, self.and_())
+        return node
+
+    def and_(self):
+        node = self.not_()
+        while self.peek() in ("AND", "term", "("):
+            if self.peek() == "AND":
+                self.take("AND")
+            node = ("AND", node, self.not_())
+        return node
+
+    def not_(self):
+        node = self.atom()
+        while self.peek() == "NOT":
+            self.take("NOT")
+            node = ("NOT", node, self.atom())
+        return node
+
+    def atom(self):
+        if self.peek() == "(":
+            self.take("(")
+            node = self.expr()
+            self.take(")")
+            return node
+        return ("term", self.take("term"))
+
+
+def parse_query(q: str):
+    return _Parser(_tokenize(q)).parse()
+
+
+def _fts(node) -> str:
+    """AST -> FTS5 query string (every term quoted, so no user text is FTS5 syntax)."""
+    if node[0] == "term":
+        text = node[1]
+        prefix = text.endswith("*")
+        text = text.rstrip("*")
+        if not text.strip():
+            raise QueryError("empty term")
+        return '"' + text.replace('"', '""') + '"' + ("*" if prefix else "")
+    op, left, right = node
+    return f"({_fts(left)} {op} {_fts(right)})"
+
+
+def _positive_leaves(node, negated: bool = False) -> List[str]:
+    if node[0] == "term":
+        return [] if negated else [_fts(node)]
+    op, left, right = node
+    return _positive_leaves(left, negated) + _positive_leaves(right, negated or op == "NOT")
+
+
+# ---------------------------
+# Store
+# ---------------------------
+class EvidenceIndex:
+    """The index in one SQLite file (WAL mode, one connection per call; shareable between processes)."""
+
+    def __init__(self, path: str):
+        self.path = path
+        with closing(self._connect()) as db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.executescript(SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        db = sqlite3.connect(self.path, timeout=30.0, isolation_level=None)
+        db.row_factory = sqlite3.Row
+        return db
+
+    # -- writing --
+
+    def add(self, items: Iterable[Dict[str, Any]]) -> int:
+        """
+        Index policies given as {"text_hash", "url", "rules", "top_k", "evidence",
+        "heuristic_units"}. Returns how many were (re)indexed.
+        """
+        from .trust_index import _domain
+
+        done = 0
+        with closing(self._connect()) as db:
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                for item in items:
+                    row = db.execute("SELECT id, rules, top_k FROM policies WHERE text_hash = ?",
+                                     (item["text_hash"],)).fetchone()
+                    url = item.get("url")
+                    domain = _domain(url) if url else None
+                    if row is not None and row["rules"] == item["rules"] and not _more_evidence(item["top_k"], row["top_k"]):
+                        if url:
+                            db.execute("UPDATE policies SET url = ?, domain = ? WHERE id = ?", (url, domain, row["id"]))
+                        continue
+                    if row is None:
+                        pid = db.execute(
+                            "INSERT INTO policies (text_hash, url, domain, rules, top_k, indexed_at) VALUES (?, ?, ?, ?, ?, ?)",
+                            (item["text_hash"], url, domain, item["rules"], item["top_k"], time.time())).lastrowid
+                    else:
+                        pid = row["id"]
+                        self._drop_sentences(db, pid)
+                        db.execute(
+                            "UPDATE policies SET url = coalesce(?, url), domain = coalesce(?, domain), rules = ?, "
+                            "top_k = ?, indexed_at = ? WHERE id = ?",
+                            (url, domain, item["rules"], item["top_k"], time.time(), pid))
+                    rows = list(_sentence_rows(pid, item))
+                    db.executemany('INSERT INTO sentences (id, kind, category, pattern, score, start, "end", text) '
+                                   "VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+                    db.execute("INSERT INTO policy_fts (rowid, text) VALUES (?, ?)",
+                               (pid, "\n".join(r[-1] for r in rows)))
+                    done += 1
+                db.execute("COMMIT")
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+        metrics.incr("evidence_index.policies", done)
+        return done
+
+    @staticmethod
+    def _drop_sentences(db, pid: int) -> None:
+        lo, hi = _sentence_range(pid)
+        old = [r[0] for r in db.execute("SELECT text FROM sentences WHERE id BETWEEN ? AND ? ORDER BY id", (lo, hi))]
+        # Contentless FTS5 deletes need the exact text that was indexed
+        db.execute("INSERT INTO policy_fts (policy_fts, rowid, text) VALUES ('delete', ?, ?)", (pid, "\n".join(old)))
+        db.execute("DELETE FROM sentences WHERE id BETWEEN ? AND ?", (lo, hi))
+
+    # -- reading --
+
+    def search(self, q: str, scope: str = "sentence", categories: Optional[List[str]] = None,
+               min_score: Optional[float] = None, max_score: Optional[float] = None,
+               kind: Optional[str] = None, domain: Optional[str] = None, order: str = "recent",
+               limit: int = 20, offset: int = 0) -> Dict[str, Any]:
+        """
+        Matching sentences (scope "sentence") or policies (scope "policy", with
+        their first 3 matching sentences), newest first or by bm25 relevance.
+        "total" is exact up to COUNT_CAP ("exact": false beyond it).
+        """
+        if scope not in SCOPES:
+            raise QueryError(f"scope must be one of {SCOPES}")
+        if order not in ORDERS:
+            raise QueryError(f"order must be one of {ORDERS}")
+        if kind is not None and kind not in KINDS:
+            raise QueryError(f"kind must be one of {KINDS}")
+        limit = max(1, min(int(limit), MAX_LIMIT))
+        offset = max(0, int(offset))
+        ast = parse_query(q)
+
+        # Filters on sentence columns need the row; the domain filter only the rowid
+        filters, params = [], []
+        if categories:
+            filters.append(f"s.category IN ({', '.join('?' * len(categories))})")
+            params += list(categories)
+        if min_score is not None:
+            filters.append("s.score >= ?")
+            params.append(float(min_score))
+        if max_score is not None:
+            filters.append("s.score <= ?")
+            params.append(float(max_score))
+        if kind:
+            filters.append("s.kind = ?")
+            params.append(kind)
+        policy_filter, policy_params = "", []
+        if domain:
+            from .trust_index import _domain
+            policy_filter = " AND {pid} IN (SELECT id FROM policies WHERE domain = ?)"
+            policy_params = [_domain(domain)]
+
+        with closing(self._connect()) as db:
+            if scope == "sentence":
+                return self._sentence_search(db, ast, filters, params, policy_filter, policy_params,
+                                             order, limit, offset)
+            return self._policy_search(db, ast, filters, params, policy_filter, policy_params,
+                                       order, limit, offset)
+
+    def _sentence_search(self, db, ast, filters, params, policy_filter, policy_params, order, limit, offset):
+        match = _fts(ast)
+        join = " JOIN sentences s ON s.id = sentences_fts.rowid" if filters else ""
+        where = " AND ".join(["sentences_fts MATCH ?"] + filters) + policy_filter.format(pid=f"(sentences_fts.rowid >> {SENTENCE_BITS})")
+        args = [match] + params + policy_params
+        total, policies = db.execute(
+            f"SELECT count(*), count(DISTINCT rowid >> {SENTENCE_BITS}) FROM ("
+            f"SELECT sentences_fts.rowid AS rowid FROM sentences_fts{join} WHERE {where} LIMIT ?)",
+            args + [COUNT_CAP + 1]).fetchone()
+        exact = total <= COUNT_CAP
+        ordering = "sentences_fts.rowid DESC" if order == "recent" else "sentences_fts.rank"
+        rows = db.execute(
+            f"SELECT s.*, highlight(sentences_fts, 0, char(2), char(3)) AS marked "
+            f"FROM sentences_fts JOIN sentences s ON s.id = sentences_fts.rowid WHERE {where} "
+            f"ORDER BY {ordering} LIMIT ? OFFSET ?", args + [limit, offset]).fetchall()
+        info = self._policies(db, {r["id"] >> SENTENCE_BITS for r in rows})
+        return {"scope": "sentence", "total": min(total, COUNT_CAP), "exact": exact,
+                "policies": policies if exact else None,
+                "results": [dict(_hit(r), policy=info[r["id"] >> SENTENCE_BITS]) for r in rows]}
+
+    def _policy_search(self, db, ast, filters, params, policy_filter, policy_params, order, limit, offset):
+        if not filters:
+            # One document per policy: the boolean query is a single FTS5 match
+            where = "policy_fts MATCH ?" + policy_filter.format(pid="policy_fts.rowid")
+            args = [_fts(ast)] + policy_params
+            total = db.execute(f"SELECT count(*) FROM (SELECT rowid FROM policy_fts WHERE {where} LIMIT ?)",
+                               args + [COUNT_CAP + 1]).fetchone()[0]
+            ordering = "policy_fts.rowid DESC" if order == "recent" else "policy_fts.rank"
+            ids = [r[0] for r in db.execute(
+                f"SELECT rowid FROM policy_fts WHERE {where} ORDER BY {ordering} LIMIT ? OFFSET ?",
+                args + [limit, offset])]
+        else:
+            # Sentence filters: each term must hit a qualifying sentence, so combine
+            # the policy sets of the terms (newest first; no relevance order here)
+            sets_sql, sets_params = _policy_sets(ast, filters, params, policy_filter, policy_params)
+            total = db.execute(f"SELECT count(*) FROM ({sets_sql})", sets_params).fetchone()[0]
+            ids = [r[0] for r in db.execute(f"SELECT * FROM ({sets_sql}) ORDER BY 1 DESC LIMIT ? OFFSET ?",
+                                            sets_params + [limit, offset])]
+
+        positive = " OR ".join(_positive_leaves(ast))
+        where = " AND ".join(["sentences_fts MATCH ?", "sentences_fts.rowid BETWEEN ? AND ?"] + filters)
+        results = []
+        info = self._policies(db, set(ids))
+        for pid in ids:
+            lo, hi = _sentence_range(pid)
+            args = [positive, lo, hi] + params
+            n = db.execute(f"SELECT count(*) FROM sentences_fts JOIN sentences s ON s.id = sentences_fts.rowid "
+                           f"WHERE {where}", args).fetchone()[0]
+            rows = db.execute(
+                f"SELECT s.*, highlight(sentences_fts, 0, char(2), char(3)) AS marked "
+                f"FROM sentences_fts JOIN sentences s ON s.id = sentences_fts.rowid WHERE {where} "
+                f"ORDER BY sentences_fts.rowid LIMIT 3", args).fetchall()
+            results.append(dict(info[pid], matching_sentences=n, sentences=[_hit(r) for r in rows]))
+        return {"scope": "policy", "total": min(total, COUNT_CAP), "exact": total <= COUNT_CAP,
+                "policies": min(total, COUNT_CAP), "results": results}
+
+    @staticmethod
+    def _policies(db, ids) -> Dict[int, Dict[str, Any]]:
+        if not ids:
+            return {}
+        rows = db.execute(f"SELECT id, text_hash, url, domain FROM policies WHERE id IN ({', '.join('?' * len(ids))})",
+                          list(ids)).fetchall()
+        return {r["id"]: {"text_hash": r["text_hash"], "url": r["url"], "domain": r["domain"]} for r in rows}
+
+    def stats(self) -> Dict[str, Any]:
+        with closing(self._connect()) as db:
+            policies = db.execute("SELECT count(*) FROM policies").fetchone()[0]
+            by_kind = dict(db.execute("SELECT kind, count(*) FROM sentences GROUP BY kind").fetchall())
+        return {"policies": policies, "sentences": by_kind}
+
+
+def _sentence_range(pid: int) -> Tuple[int, int]:
+    return pid << SENTENCE_BITS, ((pid + 1) << SENTENCE_BITS) - 1
+
+
+def _more_evidence(new_top_k: Optional[int], old_top_k: Optional[int]) -> bool:
+    if old_top_k is None:
+        return False           # already holds every matching sentence
+    return new_top_k is None or new_top_k > old_top_k
+
+
+def _sentence_rows(pid: int, item: Dict[str, Any]) -> Iterable[tuple]:
+    rows = []
+    for cat, lines in (item.get("evidence") or {}).items():
+        for ev in lines or []:
+            rows.append(("evidence", cat, None, ev.get("score"), ev.get("start", 0), ev.get("end", 0), ev["text"]))
+    for u in item.get("heuristic_units") or []:
+        rows.append(("heuristic", u["category"], u["pattern"], None, u["start"], u["end"], u["text"]))
+    base = pid << SENTENCE_BITS
+    return [(base + n,) + row for n, row in enumerate(rows[:MAX_SENTENCES])]
+
+
+def _hit(r: sqlite3.Row) -> Dict[str, Any]:
+    marked = html.escape(r["marked"]).replace("\x02", "<mark>").replace("\x03", "</mark>")
+    return {"kind": r["kind"], "category": r["category"], "pattern": r["pattern"], "score": r["score"],
+            "start": r["start"], "end": r["end"], "text": r["text"], "highlight": marked}
+
+
+def _policy_sets(node, filters: List[str], params: List[Any], policy_filter: str,
+                 policy_params: List[Any]) -> Tuple[str, List[Any]]:
+    """SQL selecting the policy ids that satisfy `node`, each term matched by any one qualifying sentence."""
+    if node[0] == "term":
+        pid = f"(sentences_fts.rowid >> {SENTENCE_BITS})"
+        where = " AND ".join(["sentences_fts MATCH ?"] + filters) + policy_filter.format(pid=pid)
+        return (f"SELECT {pid} AS pid FROM sentences_fts JOIN sentences s ON s.id = sentences_fts.rowid WHERE {where}",
+                [_fts(node)] + params + policy_params)
+    op, left, right = node
+    lsql, lparams = _policy_sets(left, filters, params, policy_filter, policy_params)
+    rsql, rparams = _policy_sets(right, filters, params, policy_filter, policy_params)
+    setop = {"AND": "INTERSECT", "OR": "UNION", "NOT": "EXCEPT"}[op]
+    return f"SELECT * FROM ({lsql}) {setop} SELECT * FROM ({rsql})", lparams + rparams
+
+
+# ---------------------------
+# Live feed (write-behind)
+# ---------------------------
+_index: Optional[EvidenceIndex] = None
+_index_lock = threading.Lock()
+
+
+def get_index() -> Optional[EvidenceIndex]:
+    global _index
+    path = config.data_path(getattr(config, "EVIDENCE_INDEX_PATH", None))
+    if not path:
+        return None
+    with _index_lock:
+        if _index is None or _index.path != path:
+            _index = EvidenceIndex(path)
+        return _index
+
+
+def _item(text: str, text_key: str, url: Optional[str], signals: Dict[str, Any], top_k: Optional[int]) -> Dict[str, Any]:
+    from .hashing import normalize_spans
+    from .heuristics import HeuristicScanner
+
+    ruleset = rules.current()
+    # Offsets into the normalized text, like the evidence's (see pipeline.compute_signals)
+    units = normalize_spans(HeuristicScanner(text, ruleset).units(), text)
+    return {"text_hash": text_key, "url": url, "top_k": top_k,
+            "rules": f"{ruleset.versions['heuristics']}-{ruleset.versions['matcher']}",
+            "evidence": signals.get("evidence") or {},
+            "heuristic_units": units}
+
+
+def _write(batch: List[tuple]) -> None:
+    index = get_index()
+    if index is not None:
+        index.add(_item(*args) for args in batch)
+
+
+_writer = WriteBehind("evidence_index", _write,
+                      max_batch=getattr(config, "EVIDENCE_INDEX_FLUSH_ROWS", 200),
+                      max_delay=getattr(config, "EVIDENCE_INDEX_FLUSH_SECONDS", 5.0),
+                      max_pending=getattr(config, "EVIDENCE_INDEX_MAX_PENDING", 1000))
+
+
+def record(text: Optional[str], text_key: str, url: Optional[str], signals: Dict[str, Any],
+           options: Dict[str, Any]) -> None:
+    """Queue an analysis for indexing (needs its text and evidence; a no-op otherwise)."""
+    if text and options.get("return_snippets") and getattr(config, "EVIDENCE_INDEX_PATH", None):
+        _writer.put((text, text_key[:32], url, signals, options.get("snippets_top_k")))
+
+
+def flush() -> None:
+    _writer.flush()
+
+
+def build(corpus_path: str, index: EvidenceIndex, batch_size: int = 200) -> int:
+    """Index a JSONL corpus of {"url", "text"} with all matching sentences (spaCy + heuristics only)."""
+    from .hashing import normalize_spans, text_hash
+    from .nlp_spacy import spacy_extract_category_lines
+
+    done, batch = 0, []
+    with open(corpus_path, "r", encoding="utf-8") as fh:
+        for line in fh:
+            if not line.strip():
+                continue
+            row = json.loads(line)
+            text = (row.get("text") or "").strip()
+            if not text:
+                continue
+            evidence = {cat: normalize_spans(lines, text)
+                        for cat, lines in spacy_extract_category_lines(text, top_k=None).items()}
+            batch.append(_item(text, text_hash(text)[:32], row.get("url"), {"evidence": evidence}, None))
+            if len(batch) >= batch_size:
+                done += index.add(batch)
+                batch = []
+    return done + index.add(batch)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    ap = argparse.ArgumentParser(description="Evidence sentence full-text index.")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    b = sub.add_parser("build")
+    b.add_argument("corpus", help="JSONL with one {\"url\", \"text\"} per line")
+    s = sub.add_parser("search")
+    s.add_argument("query")
+    s.add_argument("--scope", default="sentence", choices=SCOPES)
+    s.add_argument("--category", action="append")
+    s.add_argument("--limit", type=int, default=10)
+    sub.add_parser("stats")
+    for p in (b, s, sub.choices["stats"]):
+        p.add_argument("--index", default=config.data_path(getattr(config, "EVIDENCE_INDEX_PATH", None)) or "evidence_index.sqlite3")
+    args = ap.parse_args()
+
+    index = EvidenceIndex(args.index)
+    if args.cmd == "build":
+        t = time.perf_counter()
+        n = build(args.corpus, index)
+        print(f"indexed {n} policies into {args.index} in {time.perf_counter() - t:.1f}s")
+    elif args.cmd == "search":
+        t = time.perf_counter()
+        out = index.search(args.query, scope=args.scope, categories=args.category, limit=args.limit)
+        print(json.dumps(out, indent=2))
+        print(f"{(time.perf_counter() - t) * 1e3:.1f} ms")
+    else:
+        print(json.dumps(index.stats(), indent=2))
@@ -0,0 +1,212 @@
+# app/gemini_transport.py
+"""
+Pooled, hedged HTTP transport for Gemini generateContent (REST), used by
+summarizer_gemini._call_gemini when GEMINI_TRANSPORT = "pooled".
+
+  - Keep-alive connections live in a small per-process pool instead of being
+    set up per call; a connection that errors or times out is dropped.
+  - Every attempt has a socket timeout and every call an overall deadline
+    (GEMINI_TIMEOUT_SECONDS), so a stuck upstream can't hold a worker forever.
+  - Hedging: once enough latencies have been seen, a call still running after
+    the recent p95 gets a duplicate request on another connection. The first
+    response wins; the loser is cancelled by closing its socket.
+
+GEMINI_API_BASE (or the environment variable of the same name) points the
+transport at another server, e.g. backend/bench/fake_gemini.py.
+Counters: gemini.calls, gemini.hedges, gemini.hedge_wins, gemini.timeouts,
+gemini.errors.
+"""
+import http.client
+import json
+import os
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Deque, Dict, Optional
+from urllib.parse import quote, urlsplit
+
+from . import config, metrics
+
+# Latencies needed before p95 is trusted enough to hedge on
+_HEDGE_MIN_SAMPLES = 20
+
+
+class GeminiTimeout(TimeoutError):
+    pass
+
+
+class ConnectionPool:
+    """LIFO pool of keep-alive HTTP(S) connections to one host."""
+
+    def __init__(self, base_url: str, size: int, timeout: float):
+        parts = urlsplit(base_url)
+        self._cls = http.client.HTTPSConnection if parts.scheme == "https" else http.client.HTTPConnection
+        self._host, self._port = parts.hostname, parts.port
+        self.prefix = parts.path.rstrip("/")
+        self.timeout = timeout
+        self._idle: "queue.LifoQueue[http.client.HTTPConnection]" = queue.LifoQueue(maxsize=size)
+
+    def acquire(self, fresh: bool = False) -> http.client.HTTPConnection:
+        if not fresh:
+            try:
+                return self._idle.get_nowait()
+            except queue.Empty:
+                pass
+        return self._cls(self._host, self._port, timeout=self.timeout)
+
+    def release(self, conn: http.client.HTTPConnection) -> None:
+        try:
+            self._idle.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+    def discard(self, conn: http.client.HTTPConnection) -> None:
+        conn.close()
+
+
+class _Attempt:
+    """One HTTP request; cancel() closes its socket so a blocked read returns."""
+
+    def __init__(self, pool: ConnectionPool):
+        self.pool = pool
+        self.conn: Optional[http.client.HTTPConnection] = None
+        self.cancelled = False
+        self._lock = threading.Lock()
+
+    def run(self, path: str, body: bytes) -> Dict[str, Any]:
+        try:
+            return self._send(path, body, fresh=False)
+        except (ConnectionError, http.client.RemoteDisconnected):
+            # An idle pooled connection the server already closed; retry once on a new one
+            if self.cancelled:
+                raise
+            return self._send(path, body, fresh=True)
+
+    def _send(self, path: str, body: bytes, fresh: bool) -> Dict[str, Any]:
+        with self._lock:
+            if self.cancelled:
+                raise GeminiTimeout("cancelled before start")
+            self.conn = self.pool.acquire(fresh)
+        conn, keep = self.conn, False
+        try:
+            conn.request("POST", path, body=body, headers={"Content-Type": "application/json"})
+            resp = conn.getresponse()
+            data = resp.read()
+            keep = not resp.will_close
+            if resp.status != 200:
+                raise RuntimeError(f"Gemini HTTP {resp.status}: {data[:200]!r}")
+            return json.loads(data)
+        finally:
+            with self._lock:
+                self.conn = None
+                keep = keep and not self.cancelled
+            (self.pool.release if keep else self.pool.discard)(conn)
+
+    def cancel(self) -> None:
+        """Abort a request still in flight; a finished attempt's connection is left alone."""
+        with self._lock:
+            self.cancelled = True
+            conn = self.conn
+        if conn is not None and conn.sock is not None:
+            try:
+                conn.sock.shutdown(2)   # socket.SHUT_RDWR: unblocks the reader
+            except OSError:
+                pass
+
+
+class GeminiTransport:
+    def __init__(self, base_url: str, api_key: str, pool_size: int = 8,
+                 timeout: float = 30.0, hedge: bool = True, hedge_min_seconds: float = 0.5):
+        self.api_key = api_key
+        self.timeout = timeout
+        self.hedge = hedge
+        self.hedge_min_seconds = hedge_min_seconds
+        self.pool = ConnectionPool(base_url, pool_size, timeout)
+        self._executor = ThreadPoolExecutor(max_workers=pool_size * 2, thread_name_prefix="gemini")
+        self._latencies: Deque[float] = deque(maxlen=200)
+        self._lat_lock = threading.Lock()
+
+    def hedge_delay(self) -> Optional[float]:
+        """Seconds to wait before hedging (recent p95), or None if not hedging yet."""
+        if not self.hedge:
+            return None
+        with self._lat_lock:
+            if len(self._latencies) < _HEDGE_MIN_SAMPLES:
+                return None
+            ordered = sorted(self._latencies)
+        return max(self.hedge_min_seconds, ordered[int(0.95 * (len(ordered) - 1))])
+
+    def _observe(self, seconds: float) -> None:
+        with self._lat_lock:
+            self._latencies.append(seconds)
+
+    def generate(self, prompt: str, model: str) -> str:
+        """Text of the first candidate for `prompt`; raises GeminiTimeout or RuntimeError."""
+        path = f"{self.pool.prefix}/v1beta/models/{quote(model)}:generateContent?key={quote(self.api_key)}"
+        body = json.dumps({"contents": [{"role": "user", "parts": [{"text": prompt}]}]}).encode("utf-8")
+        metrics.incr("gemini.calls")
+
+        started = time.monotonic()
+        deadline = started + self.timeout
+        attempts = [_Attempt(self.pool)]
+        futures = {self._executor.submit(attempts[0].run, path, body): attempts[0]}
+
+        delay = self.hedge_delay()
+        if delay is not None:
+            done, _ = wait(futures, timeout=min(delay, self.timeout))
+            if not done:
+                hedge = _Attempt(self.pool)
+                attempts.append(hedge)
+                futures[self._executor.submit(hedge.run, path, body)] = hedge
+                metrics.incr("gemini.hedges")
+
+        error: Optional[BaseException] = None
+        pending = set(futures)
+        try:
+            while pending:
+                done, pending = wait(pending, timeout=max(0.0, deadline - time.monotonic()),
+                                     return_when=FIRST_COMPLETED)
+                if not done:
+                    metrics.incr("gemini.timeouts")
+                    raise GeminiTimeout(f"Gemini call exceeded {self.timeout:.1f}s")
+                for fut in done:
+                    if fut.exception() is None:
+                        if futures[fut] is not attempts[0]:
+                            metrics.incr("gemini.hedge_wins")
+                        self._observe(time.monotonic() - started)
+                        return _candidate_text(fut.result())
+                    error = error or fut.exception()
+            metrics.incr("gemini.errors")
+            raise error
+        finally:
+            for attempt in attempts:
+                attempt.cancel()   # no-op for the winner, whose connection is back in the pool
+
+
+def _candidate_text(data: Dict[str, Any]) -> str:
+    for cand in data.get("candidates") or []:
+        parts = (cand.get("content") or {}).get("parts") or []
+        return "".join(p.get("text", "") for p in parts)
+    return ""
+
+
+_transport: Optional[GeminiTransport] = None
+_transport_lock = threading.Lock()
+
+
+def get_transport() -> GeminiTransport:
+    global _transport
+    if _transport is None:
+        with _transport_lock:
+            if _transport is None:
+                _transport = GeminiTransport(
+                    base_url=os.environ.get("GEMINI_API_BASE") or config.GEMINI_API_BASE,
+                    api_key=config.GEMINI_API_KEY,
+                    pool_size=config.GEMINI_POOL_SIZE,
+                    timeout=config.GEMINI_TIMEOUT_SECONDS,
+                    hedge=config.GEMINI_HEDGE,
+                    hedge_min_seconds=config.GEMINI_HEDGE_MIN_SECONDS,
+                )
+    return _transport
@@ -0,0 +1,59 @@
+# app/hashing.py
+"""
+Content hashing shared by request coalescing, caching and lookups.
+
+Policy text copied from a page differs mostly in whitespace (line wraps,
+indentation, trailing blanks), so hashes are taken over a whitespace-collapsed
+form of the text.
+"""
+import hashlib
+import re
+from typing import Any, Dict, List
+
+_WS = re.compile(r"\s+")
+
+
+def normalize_text(text: str) -> str:
+    """Collapse whitespace runs to single spaces and trim the ends."""
+    return _WS.sub(" ", text or "").strip()
+
+
+def text_hash(text: str) -> str:
+    """Hex SHA-256 of the normalized text."""
+    return hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+
+
+def normalized_offsets(text: str) -> List[int]:
+    """
+    For every offset 0..len(text) in `text`, the matching offset in
+    normalize_text(text). Offsets in a whitespace run map to its one space or
+    just past it.
+    """
+    out = []
+    pos, in_space = 0, True   # leading whitespace is trimmed, not collapsed
+    for ch in text:
+        out.append(pos)
+        if not ch.isspace():
+            pos, in_space = pos + 1, False
+        elif not in_space:
+            pos, in_space = pos + 1, True
+    out.append(pos)
+    size = len(normalize_text(text))
+    return [min(p, size) for p in out]
+
+
+def normalize_spans(spans: List[Dict[str, Any]], text: str) -> List[Dict[str, Any]]:
+    """
+    Copies of {"text", "start", "end", ...} spans of `text`, re-expressed in
+    normalize_text(text); whitespace at a span's ends is trimmed off first.
+    """
+    offsets = normalized_offsets(text)
+    out = []
+    for span in spans:
+        start, end = span["start"], span["end"]
+        while start < end and text[start].isspace():
+            start += 1
+        while end > start and text[end - 1].isspace():
+            end -= 1
+        out.append(dict(span, text=normalize_text(span["text"]), start=offsets[start], end=offsets[end]))
+    return out
@@ -1,13 +1,14 @@
 from __future__ import annotations
 import re
+import threading
+from collections import OrderedDict
 from typing import Dict, List, Tuple
+from . import config, rules
 from .config import CATEGORY_WEIGHTS
+from .lexicon import spans_by_label
 
 # -------- helpers --------
 
-def _rx(pattern: str, flags=re.IGNORECASE | re.MULTILINE) -> re.Pattern:
-    return re.compile(pattern, flags)
-
 def _count(pattern: re.Pattern, text: str) -> int:
     return sum(1 for _ in pattern.finditer(text))
 
@@ -15,176 +16,18 @@ def _apply(delta: float, amount: float) -> float:
     return max(-1.0, min(1.0, delta + amount))
 
 # -------- patterns (penalties / bonuses) --------
+# The patterns live in the rule set ("heuristics" in rules/default.json), compiled
+# by rules.RuleSet into {key: {"cat", "regex" (compiled or None), "delta", "flag", "type"}}
+# and hot-reloaded without restarting workers. A pattern's hits are its lexicon
+# terms' hits (the shared per-text scan, see lexicon.py) plus its regex matches.
 
-PATTERNS = {
-    # --- Third-Party Sharing/Selling ---
-    "TP_SELL": {
-        "cat": "Third-Party Sharing/Selling",
-        "regex": _rx(r"\b(sell|sale|sold|monetiz(?:e|ation)|broker|data broker)\b"),
-        "delta": -0.35,
-        "flag": "Mentions selling/monetizing or broker relationship",
-        "type": "penalty"
-    },
-    "TP_SHARE_THIRDPARTY": {
-        "cat": "Third-Party Sharing/Selling",
-        "regex": _rx(r"\bshare(?:s|d|ing)?\b.{0,30}\b(third[- ]?part(?:y|ies)|partners?)\b"),
-        "delta": -0.25,
-        "flag": "Mentions sharing with third parties/partners",
-        "type": "penalty"
-    },
-    "TP_DNS_LINK": {
-        "cat": "User Control & Rights",  # UI control but helps Sharing via user choice
-        "regex": _rx(r"do\s+not\s+(sell|share)", re.IGNORECASE),
-        "delta": +0.15,
-        "flag": "Provides a Do Not Sell/Share option",
-        "type": "bonus"
-    },
-
-    # --- Tracking/Ads (affects Sharing & Purpose Limitation slightly) ---
-    "ADS_TRACKING": {
-        "cat": "Third-Party Sharing/Selling",
-        "regex": _rx(r"\b(adtech|behavioral\s+advertising|targeted\s+ads|cross[- ]site\s+tracking)\b"),
-        "delta": -0.15,
-        "flag": "Behavioral/targeted advertising or cross-site tracking",
-        "type": "penalty"
-    },
-
-    # --- Purpose Limitation / Vagueness ---
-    "PURPOSE_VAGUE_LI": {
-        "cat": "Purpose Limitation",
-        "regex": _rx(r"\blegitimate\s+interests\b"),
-        "delta": -0.15,
-        "flag": "Relies on vague 'legitimate interests'",
-        "type": "penalty"
-    },
-    "PURPOSE_VAGUE_MAY_SHARE": {
-        "cat": "Purpose Limitation",
-        "regex": _rx(r"\bmay\b.{0,20}\bshare\b"),
-        "delta": -0.10,
-        "flag": "Vague 'may share' without specifics",
-        "type": "penalty"
-    },
-    "PURPOSE_LIMIT_GOOD": {
-        "cat": "Purpose Limitation",
-        "regex": _rx(r"\buse(?:d)?\s+only\s+for\b|\bfor\s+the\s+purposes\s+described\b"),
-        "delta": +0.10,
-        "flag": "States use limited to specific purposes",
-        "type": "bonus"
-    },
-
-    # --- Data Collection ---
-    "COLLECT_SENSITIVE": {
-        "cat": "Data Collection",
-        "regex": _rx(r"\b(sensitive\s+(personal\s+)?information|biometric|genetic|health\s+data|precise\s+location)\b"),
-        "delta": -0.20,
-        "flag": "Collects sensitive categories",
-        "type": "penalty"
-    },
-    "COLLECT_LISTS_CATEGORIES": {
-        "cat": "Data Collection",
-        "regex": _rx(r"\b(categories|types)\s+of\s+(personal\s+)?(information|data)\b"),
-        "delta": +0.10,
-        "flag": "Discloses categories of data collected",
-        "type": "bonus"
-    },
-
-    # --- User Rights & Controls ---
-    "RIGHTS_LIST": {
-        "cat": "User Control & Rights",
-        "regex": _rx(r"\b(access|delete|erasure|correct|rectify|portability|opt[- ]?out)\b"),
-        "delta": +0.15,
-        "flag": "Lists user rights (access/delete/correct/portability/opt-out)",
-        "type": "bonus"
-    },
-    "REGULATORY_RIGHTS": {
-        "cat": "User Control & Rights",
-        "regex": _rx(r"\b(CCPA|GDPR|Do\s+Not\s+Sell|Do\s+Not\s+Share)\b"),
-        "delta": +0.10,
-        "flag": "References CCPA/GDPR or Do Not Sell/Share",
-        "type": "bonus"
-    },
-
-    # --- Retention & Deletion ---
-    "RETENTION_INDEFINITE": {
-        "cat": "Retention & Deletion",
-        "regex": _rx(r"\bretain(?:ed|tion)?\b.*\bindefinite(?:ly)?\b"),
-        "delta": -0.25,
-        "flag": "States indefinite retention",
-        "type": "penalty"
-    },
-    "RETENTION_VAGUE_LONG": {
-        "cat": "Retention & Deletion",
-        "regex": _rx(r"\bretain\b.*\b(as long as (?:necessary|needed))\b"),
-        "delta": -0.15,
-        "flag": "Vague retention ('as long as necessary')",
-        "type": "penalty"
-    },
-    "RETENTION_TIMELINE": {
-        "cat": "Retention & Deletion",
-        "regex": _rx(r"\b(retention\s+period|deleted\s+after|deletion\s+timeline|retain(?:ed|tion)?\s+for\s+\d+\s+(?:days|months|years))\b"),
-        "delta": +0.15,
-        "flag": "Provides retention/deletion timelines",
-        "type": "bonus"
-    },
-
-    # --- Security Practices ---
-    "SECURITY_ENCRYPTION": {
-        "cat": "Security Practices",
-        "regex": _rx(r"\b(encrypt(?:ed|ion)|TLS|HTTPS)\b"),
-        "delta": +0.10,
-        "flag": "Mentions encryption/TLS",
-        "type": "bonus"
-    },
-    "SECURITY_CONTROLS": {
-        "cat": "Security Practices",
-        "regex": _rx(r"\b(access\s+controls|SOC\s*2|ISO\s*27001|security\s+measures|breach\s+notification)\b"),
-        "delta": +0.10,
-        "flag": "Mentions recognized security controls or breach notice",
-        "type": "bonus"
-    },
-
-    # --- International Transfers & Jurisdiction ---
-    "XFER_SAFEGUARDS": {
-        "cat": "International Transfers & Jurisdiction",
-        "regex": _rx(r"\b(standard\s+contractual\s+clauses|SCCs?|data\s+privacy\s+framework|adequacy\s+decision)\b"),
-        "delta": +0.10,
-        "flag": "Mentions SCCs/DPF/adequacy safeguards",
-        "type": "bonus"
-    },
-    "JURIS_ARBITRATION": {
-        "cat": "International Transfers & Jurisdiction",
-        "regex": _rx(r"\b(arbitration|venue|governing\s+law|jurisdiction)\b"),
-        "delta": -0.05,
-        "flag": "Specifies venue/arbitration (potentially user-unfriendly)",
-        "type": "penalty"
-    },
-
-    # --- Children & Sensitive Data ---
-    "COPPA_CHILDREN": {
-        "cat": "Children/Minors + Sensitive Data",
-        "regex": _rx(r"\b(COPPA|child(?:ren)?|minor|under\s*1[3-8])\b"),
-        "delta": +0.10,
-        "flag": "States minors/COPPA stance",
-        "type": "bonus"
-    },
-    "SENSITIVE_LIMITS": {
-        "cat": "Children/Minors + Sensitive Data",
-        "regex": _rx(r"\b(biometric|health\s+data|precise\s+location)\b.*\b(not\s+collect|do\s+not\s+collect|prohibit)\b"),
-        "delta": +0.10,
-        "flag": "Limits collection of sensitive categories",
-        "type": "bonus"
-    },
-}
-
-# Some patterns conceptually affect multiple areas; optionally mirror small spillover bonuses/penalties here if you want.
+def _lexicon_spans(lexicon, text: str, pos: int = 0, endpos: int = None) -> Dict[str, List[Tuple[int, int]]]:
+    return spans_by_label(lexicon.scan(text, pos, endpos)["heuristics"])
 
 # -------- main API --------
 
-def detect_flags(text: str) -> Dict[str, Dict]:
-    """
-    Run all regexes and aggregate penalties/bonuses per category.
-    Returns a dict keyed by category with delta, flags, and raw hit counts.
-    """
+def _aggregate(counts: Dict[str, int], patterns: Dict[str, Dict]) -> Dict[str, Dict]:
+    """Per-category delta/flags/hits from raw per-pattern hit counts."""
     # Initialize per-category buckets
     out: Dict[str, Dict] = {
         cat: {"delta": 0.0, "flags": [], "hits": {}}
@@ -192,12 +35,11 @@ def detect_flags(text: str) -> Dict[str, Dict]:
     }
 
     # Apply each pattern; scale deltas by count with mild diminishing return
-    for key, spec in PATTERNS.items():
+    for key, spec in patterns.items():
         cat = spec["cat"]
-        pat = spec["regex"]
         dlt = float(spec["delta"])
         flag = spec["flag"]
-        n = _count(pat, text)
+        n = counts.get(key, 0)
 
         if n <= 0:
             continue
@@ -213,4 +55,243 @@ def detect_flags(text: str) -> Dict[str, Dict]:
         pretty = f"{flag} (x{n})" if n > 1 else flag
         out[cat]["flags"].append(pretty)
 
-    return out
\ No newline at end of file
+    return out
+
+
+def detect_flags(text: str) -> Dict[str, Dict]:
+    """
+    Run the lexicon scan and the structural regexes and aggregate penalties/bonuses
+    per category. Returns a dict keyed by category with delta, flags, and raw hit counts.
+    """
+    ruleset = rules.current()
+    patterns = ruleset.patterns
+    counts = {key: len(spans) for key, spans in _lexicon_spans(ruleset.lexicon, text).items()}
+    for key, spec in patterns.items():
+        if spec["regex"] is not None:
+            counts[key] = counts.get(key, 0) + _count(spec["regex"], text)
+    return _aggregate(counts, patterns)
+
+
+# -------- incremental scanning (selection refinement) --------
+
+# Where a pattern's matches can end. Patterns with an unbounded ".*" may span a
+# whole line (no DOTALL), everything else stays within a sentence or two.
+_LINE_BREAKS = ("\n",)
+_SENTENCE_BREAKS = ("\n", ". ", "! ", "? ", ".\t", "!\t", "?\t")
+
+
+def _breaks_for(spec: Dict) -> Tuple[str, ...]:
+    regex = spec.get("regex")
+    return _LINE_BREAKS if regex is not None and ".*" in regex.pattern else _SENTENCE_BREAKS
+
+
+def _unit_start(text: str, pos: int, breaks: Tuple[str, ...]) -> int:
+    """Start of the sentence/line containing text[pos] (0 if none before)."""
+    best = 0
+    for b in breaks:
+        i = text.rfind(b, 0, pos)
+        if i != -1:
+            best = max(best, i + len(b))
+    return best
+
+
+def _unit_end(text: str, pos: int, breaks: Tuple[str, ...]) -> int:
+    """End (exclusive, boundary included) of the sentence/line containing text[pos]."""
+    best = len(text)
+    for b in breaks:
+        i = text.find(b, pos)
+        if i != -1:
+            best = min(best, i + len(b))
+    return best
+
+
+def _common_prefix(a: str, b: str) -> int:
+    lo, hi = 0, min(len(a), len(b))
+    while lo < hi:  # binary search with C-level slice compares
+        mid = (lo + hi + 1) // 2
+        if a[:mid] == b[:mid]:
+            lo = mid
+        else:
+            hi = mid - 1
+    return lo
+
+
+def _common_suffix(a: str, b: str, limit: int) -> int:
+    lo, hi = 0, limit
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if a[len(a) - mid:] == b[len(b) - mid:]:
+            lo = mid
+        else:
+            hi = mid - 1
+    return lo
+
+
+class HeuristicScanner:
+    """
+    Stateful detect_flags() for a text that grows or changes between requests
+    (a selection that gets expanded, then the full page).
+
+    Keeps every pattern's hit offsets. An edit only rescans, per regex, the
+    window around the changed region widened to sentence boundaries (line
+    boundaries for ".*" patterns) plus one neighbouring sentence/line on each
+    side, and runs the lexicon once over the same kind of window (sentence
+    boundaries) for all term hits; hits outside are kept and shifted. Per-category deltas are then
+    rebuilt from the stored counts, giving the same output as detect_flags on
+    the full new text for matches that do not straddle more than one boundary.
+
+    The scanner remembers the heuristics rule version it scanned with; after a
+    rule reload the next update() rescans the whole text once.
+    """
+
+    def __init__(self, text: str = "", ruleset=None):
+        self._rescan(text, ruleset or rules.current())
+
+    def _rescan(self, text: str, ruleset) -> None:
+        self.text = text
+        self.patterns = ruleset.patterns
+        self.lexicon = ruleset.lexicon
+        self.version = ruleset.versions["heuristics"]
+        # Regex hits and lexicon term hits, each per pattern key
+        self.hits: Dict[str, List[Tuple[int, int]]] = {
+            key: [m.span() for m in spec["regex"].finditer(text)]
+            for key, spec in self.patterns.items() if spec["regex"] is not None
+        }
+        self.term_hits = _lexicon_spans(self.lexicon, text)
+
+    def counts(self) -> Dict[str, int]:
+        counts = {key: len(spans) for key, spans in self.hits.items()}
+        for key, spans in self.term_hits.items():
+            counts[key] = counts.get(key, 0) + len(spans)
+        return counts
+
+    def flags(self) -> Dict[str, Dict]:
+        return _aggregate(self.counts(), self.patterns)
+
+    def append(self, more: str) -> Dict[str, Dict]:
+        return self.edit(len(self.text), len(self.text), more)
+
+    def update(self, new_text: str) -> Dict[str, Dict]:
+        """Move to `new_text`, rescanning only what differs from the current text."""
+        ruleset = rules.current()
+        if ruleset.versions["heuristics"] != self.version:
+            self._rescan(new_text, ruleset)
+            return self.flags()
+        old = self.text
+        if new_text == old:
+            return self.flags()
+        pre = _common_prefix(old, new_text)
+        suf = _common_suffix(old, new_text, min(len(old), len(new_text)) - pre)
+        return self.edit(pre, len(old) - suf, new_text[pre:len(new_text) - suf])
+
+    def edit(self, start: int, end: int, replacement: str) -> Dict[str, Dict]:
+        """Replace text[start:end] with `replacement` and update hits incrementally."""
+        old = self.text
+        new = old[:start] + replacement + old[end:]
+        shift = len(replacement) - (end - start)
+        new_end = start + len(replacement)
+
+        for key, spans in self.hits.items():
+            breaks = _breaks_for(self.patterns[key])
+            # Window in new-text coordinates: changed region, out to unit boundaries,
+            # plus one more unit each side for matches that cross a boundary.
+            ws = _unit_start(new, start, breaks)
+            ws = _unit_start(new, max(0, ws - 1), breaks)
+            we = _unit_end(new, new_end, breaks)
+            we = _unit_end(new, we, breaks)
+
+            # Old hits are sorted and non-overlapping: keep those clear of the
+            # window (shifting the ones after it), widen the window over the rest.
+            before, after = [], []
+            for s, e in spans:
+                if e <= ws:
+                    before.append((s, e))
+                elif s >= we - shift:
+                    after.append((s + shift, e + shift))
+                else:
+                    ws = min(ws, s)
+                    we = max(we, e + shift) if e > end else we
+
+            fresh = [m.span() for m in self.patterns[key]["regex"].finditer(new, ws, we)]
+            self.hits[key] = before + fresh + after
+
+        self._edit_terms(new, start, end, shift, new_end)
+        self.text = new
+        return self.flags()
+
+    def _edit_terms(self, new: str, start: int, end: int, shift: int, new_end: int) -> None:
+        """The lexicon part of edit(): one window and one scan for all term hits."""
+        ws = _unit_start(new, start, _SENTENCE_BREAKS)
+        ws = _unit_start(new, max(0, ws - 1), _SENTENCE_BREAKS)
+        we = _unit_end(new, new_end, _SENTENCE_BREAKS)
+        we = _unit_end(new, we, _SENTENCE_BREAKS)
+        # Widen over hits straddling the window edge, until no key has one
+        changed = True
+        while changed:
+            changed = False
+            for spans in self.term_hits.values():
+                for s, e in spans:
+                    if e <= ws or s >= we - shift:
+                        continue
+                    if s < ws:
+                        ws, changed = s, True
+                    if e > end and e + shift > we:
+                        we, changed = e + shift, True
+
+        fresh = _lexicon_spans(self.lexicon, new, ws, we)
+        term_hits = {}
+        for key in set(self.term_hits) | set(fresh):
+            spans = self.term_hits.get(key, [])
+            kept = ([(s, e) for s, e in spans if e <= ws] + fresh.get(key, [])
+                    + [(s + shift, e + shift) for s, e in spans if s >= we - shift])
+            if kept:
+                term_hits[key] = kept
+        self.term_hits = term_hits
+
+    def units(self) -> List[Dict]:
+        """
+        Where the patterns fire: one entry per pattern and sentence (line, for
+        ".*" patterns) holding at least one hit, with that unit's offsets.
+        """
+        out = []
+        for key, spans in list(self.hits.items()) + list(self.term_hits.items()):
+            spec = self.patterns[key]
+            breaks = _breaks_for(spec)
+            last_end = -1
+            for s, _e in spans:
+                if s < last_end:
+                    continue   # same unit as the previous hit
+                us, ue = _unit_start(self.text, s, breaks), _unit_end(self.text, s, breaks)
+                out.append({"pattern": key, "category": spec["cat"], "start": us, "end": ue,
+                            "text": self.text[us:ue].strip()})
+                last_end = ue
+        return out
+
+
+class ScannerSessions:
+    """LRU of HeuristicScanner per client session id."""
+
+    def __init__(self, capacity: int = 256):
+        self.capacity = capacity
+        self._lock = threading.Lock()
+        self._scanners: "OrderedDict[str, Tuple[threading.Lock, HeuristicScanner]]" = OrderedDict()
+
+    def detect(self, session_id: str, text: str) -> Dict[str, Dict]:
+        with self._lock:
+            entry = self._scanners.get(session_id)
+            if entry is None:
+                entry = self._scanners[session_id] = (threading.Lock(), HeuristicScanner())
+            self._scanners.move_to_end(session_id)
+            while len(self._scanners) > self.capacity:
+                self._scanners.popitem(last=False)
+        lock, scanner = entry
+        with lock:
+            return scanner.update(text)
+
+
+_SESSIONS = ScannerSessions(getattr(config, "HEURISTIC_SESSIONS_MAX", 256))
+
+
+def detect_flags_incremental(session_id: str, text: str) -> Dict[str, Dict]:
+    """detect_flags(text), reusing the session's previous scan and rescanning only the delta."""
+    return _SESSIONS.detect(session_id, text)
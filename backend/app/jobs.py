@@ -0,0 +1,387 @@
+# app/jobs.py
+"""
+Asynchronous analysis jobs.
+
+POST /analyze with "async": true enqueues the request and answers 202 with a
+job id; GET /jobs/<id> polls (or long-polls with ?wait=<seconds>) for the
+result. Jobs live in a persistent store so any worker process can pick them
+up and clients can reconnect after a proxy timeout.
+
+  - dedup:    a request whose text/options/preferences match a queued, running
+              or recently finished job gets that job's id back
+  - priority: shorter texts first, so selection-sized work is not stuck
+              behind 100k-char pages
+  - retries:  failed attempts are retried with exponential backoff up to
+              JOBS_MAX_ATTEMPTS; a job whose worker died is re-claimed after
+              its lease expires
+  - leases:   a worker renews its lease every JOBS_LEASE_SECONDS / 3 while the
+              job runs, so only a dead or stalled worker loses it; every claim
+              gets a fresh token and complete/fail/heartbeat only apply with
+              the current one, so a worker that lost its lease cannot
+              overwrite the result of the worker that took over
+
+The store is pluggable: subclass JobStore, implement its methods and point
+JOBS_STORE at a factory for it. SQLiteJobStore is the default and is safe to
+share between processes.
+"""
+import abc
+import importlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import closing
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from . import config, metrics, rules
+
+PENDING = ("queued", "running")
+
+
+class JobStore(abc.ABC):
+    """
+    Interface for job stores. Jobs are plain dicts (see SQLiteJobStore._row);
+    a claimed job carries a "claim" token that heartbeat/complete/fail must
+    present, and they return False (doing nothing) once it is stale.
+    """
+
+    @abc.abstractmethod
+    def enqueue(self, key: str, payload: Dict[str, Any], priority: int) -> Tuple[str, bool]:
+        """Add a job unless one with the same key is pending or fresh. Returns (id, created)."""
+
+    @abc.abstractmethod
+    def claim(self, lease_seconds: float) -> Optional[Dict[str, Any]]:
+        """Atomically take the best runnable job, mark it running and give it a new claim token."""
+
+    @abc.abstractmethod
+    def heartbeat(self, job_id: str, claim: str, lease_seconds: float) -> bool:
+        """Extend a running job's lease to now + lease_seconds."""
+
+    @abc.abstractmethod
+    def complete(self, job_id: str, claim: str, result: Dict[str, Any]) -> bool:
+        """Store a running job's result."""
+
+    @abc.abstractmethod
+    def fail(self, job_id: str, claim: str, error: str, retry_at: Optional[float]) -> bool:
+        """Record a failed attempt; requeue at retry_at, or mark failed if None."""
+
+    @abc.abstractmethod
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """The job, or None if unknown (or purged)."""
+
+    @abc.abstractmethod
+    def purge(self, older_than: float) -> int:
+        """Delete finished jobs last updated before `older_than` (epoch seconds)."""
+
+
+class SQLiteJobStore(JobStore):
+    """Job store in a local SQLite file (WAL mode, one connection per call)."""
+
+    def __init__(self, path: str, result_ttl: float = 3600.0):
+        self.path = path
+        self.result_ttl = float(result_ttl)
+        with closing(self._connect()) as db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.executescript("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id          TEXT PRIMARY KEY,
+                    key         TEXT NOT NULL,
+                    status      TEXT NOT NULL,
+                    priority    INTEGER NOT NULL,
+                    payload     TEXT,
+                    result      TEXT,
+                    error       TEXT,
+                    attempts    INTEGER NOT NULL DEFAULT 0,
+                    run_after   REAL NOT NULL,
+                    lease_until REAL,
+                    claim       TEXT,
+                    created_at  REAL NOT NULL,
+                    updated_at  REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS jobs_runnable ON jobs(status, priority, run_after);
+                CREATE INDEX IF NOT EXISTS jobs_key ON jobs(key, status);
+            """)
+            if "claim" not in {row["name"] for row in db.execute("PRAGMA table_info(jobs)")}:
+                db.execute("ALTER TABLE jobs ADD COLUMN claim TEXT")   # stores created before claim tokens
+
+    def _connect(self) -> sqlite3.Connection:
+        db = sqlite3.connect(self.path, timeout=30.0, isolation_level=None)
+        db.row_factory = sqlite3.Row
+        return db
+
+    @staticmethod
+    def _row(row: Optional[sqlite3.Row]) -> Optional[Dict[str, Any]]:
+        if row is None:
+            return None
+        job = dict(row)
+        for field in ("payload", "result"):
+            job[field] = json.loads(job[field]) if job[field] else None
+        return job
+
+    def enqueue(self, key, payload, priority):
+        now = time.time()
+        with closing(self._connect()) as db:
+            db.execute("BEGIN IMMEDIATE")
+            row = db.execute(
+                "SELECT id FROM jobs WHERE key = ? AND "
+                "(status IN ('queued', 'running') OR (status = 'done' AND updated_at >= ?)) "
+                "ORDER BY created_at DESC LIMIT 1",
+                (key, now - self.result_ttl),
+            ).fetchone()
+            if row is not None:
+                db.execute("COMMIT")
+                return row["id"], False
+            job_id = uuid.uuid4().hex
+            db.execute(
+                "INSERT INTO jobs (id, key, status, priority, payload, run_after, created_at, updated_at) "
+                "VALUES (?, ?, 'queued', ?, ?, ?, ?, ?)",
+                (job_id, key, int(priority), json.dumps(payload), now, now, now),
+            )
+            db.execute("COMMIT")
+            return job_id, True
+
+    def claim(self, lease_seconds):
+        now = time.time()
+        with closing(self._connect()) as db:
+            db.execute("BEGIN IMMEDIATE")
+            row = db.execute(
+                "SELECT * FROM jobs WHERE "
+                "(status = 'queued' AND run_after <= ?) OR (status = 'running' AND lease_until <= ?) "
+                "ORDER BY priority ASC, created_at ASC LIMIT 1",
+                (now, now),
+            ).fetchone()
+            if row is None:
+                db.execute("COMMIT")
+                return None
+            claim = uuid.uuid4().hex
+            db.execute(
+                "UPDATE jobs SET status = 'running', attempts = attempts + 1, "
+                "lease_until = ?, claim = ?, updated_at = ? WHERE id = ?",
+                (now + lease_seconds, claim, now, row["id"]),
+            )
+            db.execute("COMMIT")
+        job = self._row(row)
+        job["status"] = "running"
+        job["attempts"] += 1
+        job["claim"] = claim
+        return job
+
+    def _update_claimed(self, job_id: str, claim: str, assignments: str, params: tuple) -> bool:
+        """UPDATE a job still running under `claim`; False when another worker has taken it over."""
+        with closing(self._connect()) as db:
+            cur = db.execute(
+                f"UPDATE jobs SET {assignments} WHERE id = ? AND status = 'running' AND claim = ?",
+                params + (job_id, claim),
+            )
+            return cur.rowcount == 1
+
+    def heartbeat(self, job_id, claim, lease_seconds):
+        now = time.time()
+        return self._update_claimed(job_id, claim, "lease_until = ?, updated_at = ?", (now + lease_seconds, now))
+
+    def complete(self, job_id, claim, result):
+        # The text is only needed for retries; drop it once the job is done.
+        return self._update_claimed(
+            job_id, claim,
+            "status = 'done', result = ?, payload = NULL, error = NULL, lease_until = NULL, claim = NULL, "
+            "updated_at = ?",
+            (json.dumps(result), time.time()),
+        )
+
+    def fail(self, job_id, claim, error, retry_at):
+        if retry_at is None:
+            return self._update_claimed(
+                job_id, claim,
+                "status = 'failed', error = ?, payload = NULL, lease_until = NULL, claim = NULL, updated_at = ?",
+                (error, time.time()),
+            )
+        return self._update_claimed(
+            job_id, claim,
+            "status = 'queued', error = ?, run_after = ?, lease_until = NULL, claim = NULL, updated_at = ?",
+            (error, retry_at, time.time()),
+        )
+
+    def get(self, job_id):
+        with closing(self._connect()) as db:
+            return self._row(db.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone())
+
+    def purge(self, older_than):
+        with closing(self._connect()) as db:
+            cur = db.execute(
+                "DELETE FROM jobs WHERE status IN ('done', 'failed') AND updated_at < ?", (older_than,)
+            )
+            return cur.rowcount
+
+
+class JobWorkerPool:
+    """Background threads that claim jobs from a store and run `handler(payload)`."""
+
+    def __init__(
+        self,
+        store: JobStore,
+        handler: Callable[[Dict[str, Any]], Dict[str, Any]],
+        workers: int = 2,
+        max_attempts: int = 3,
+        retry_base: float = 2.0,
+        lease_seconds: float = 300.0,
+        poll_interval: float = 0.5,
+    ):
+        self.store = store
+        self.handler = handler
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.retry_base = retry_base
+        self.lease_seconds = lease_seconds
+        self.poll_interval = poll_interval
+        self._stop = threading.Event()
+        self._threads = []
+
+    def start(self) -> None:
+        for i in range(self.workers):
+            t = threading.Thread(target=self._loop, name=f"privasee-job-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def stop(self, timeout: float = None) -> None:
+        self._stop.set()
+        for t in self._threads:
+            t.join(timeout)
+
+    def _keep_leased(self, job: Dict[str, Any], done: threading.Event) -> None:
+        """Renew `job`'s lease until `done` is set or the store says the claim is gone."""
+        while not done.wait(self.lease_seconds / 3):
+            try:
+                if not self.store.heartbeat(job["id"], job["claim"], self.lease_seconds):
+                    logging.warning("job %s: lease lost to another worker", job["id"])
+                    metrics.incr("jobs.lease_lost")
+                    return
+            except Exception:
+                # A missed renewal is retried next tick; the lease has two more to spare.
+                logging.exception("job %s: lease renewal failed", job["id"])
+
+    def run_once(self) -> bool:
+        """Claim and run a single job. Returns False when nothing was runnable."""
+        job = self.store.claim(self.lease_seconds)
+        if job is None:
+            return False
+        started = time.time()
+        done = threading.Event()
+        heartbeat = threading.Thread(target=self._keep_leased, args=(job, done),
+                                     name=f"{threading.current_thread().name}-lease", daemon=True)
+        heartbeat.start()
+        try:
+            result = self.handler(job["payload"])
+        except Exception as e:
+            done.set()   # stop renewing before the job is requeued
+            logging.exception("job %s failed (attempt %s)", job["id"], job["attempts"])
+            metrics.incr("jobs.errors")
+            retry_at = None
+            if job["attempts"] < self.max_attempts:
+                retry_at = time.time() + self.retry_base * (2 ** (job["attempts"] - 1))
+            if not self.store.fail(job["id"], job["claim"], f"{e.__class__.__name__}: {e}", retry_at):
+                metrics.incr("jobs.stale")
+            else:
+                metrics.incr("jobs.retried" if retry_at is not None else "jobs.failed")
+            return True
+        finally:
+            done.set()
+        if not self.store.complete(job["id"], job["claim"], result):
+            # Our lease expired and another worker owns the job now: its result stands.
+            logging.warning("job %s: finished after losing its lease, result discarded", job["id"])
+            metrics.incr("jobs.stale")
+            return True
+        metrics.incr("jobs.completed")
+        metrics.incr("jobs.run_seconds", time.time() - started)
+        return True
+
+    def _loop(self) -> None:
+        last_purge = 0.0
+        while not self._stop.is_set():
+            try:
+                if time.time() - last_purge > 600:
+                    last_purge = time.time()
+                    self.store.purge(last_purge - getattr(self.store, "result_ttl", 3600.0))
+                if not self.run_once():
+                    self._stop.wait(self.poll_interval)
+            except Exception:
+                # Store hiccup (e.g. database locked past the timeout): back off and keep going.
+                logging.exception("job worker loop error")
+                self._stop.wait(self.poll_interval)
+
+
+# ---------------------------
+# Process-wide queue
+# ---------------------------
+_store: Optional[JobStore] = None
+_pool: Optional[JobWorkerPool] = None
+_init_lock = threading.Lock()
+
+
+def _run_job(payload: Dict[str, Any]) -> Dict[str, Any]:
+    from .pipeline import run_analysis
+    return run_analysis(payload["text"], payload)
+
+
+def _make_store() -> JobStore:
+    factory = getattr(config, "JOBS_STORE", None)
+    if factory is None:
+        return SQLiteJobStore(config.data_path(config.JOBS_DB_PATH), result_ttl=config.JOBS_RESULT_TTL)
+    if isinstance(factory, str):
+        module, _, name = factory.rpartition(".")
+        factory = getattr(importlib.import_module(module), name)
+    store = factory()
+    if not isinstance(store, JobStore):
+        raise TypeError(f"JOBS_STORE must return a JobStore, got {type(store).__name__}")
+    return store
+
+
+def get_store() -> JobStore:
+    """The configured store (JOBS_STORE); the first call in each process also starts its worker pool."""
+    global _store, _pool
+    if _store is not None:
+        return _store
+    with _init_lock:
+        if _store is None:
+            store = _make_store()
+            if config.JOBS_WORKERS > 0:
+                _pool = JobWorkerPool(
+                    store,
+                    _run_job,
+                    workers=config.JOBS_WORKERS,
+                    max_attempts=config.JOBS_MAX_ATTEMPTS,
+                    retry_base=config.JOBS_RETRY_BASE_SECONDS,
+                    lease_seconds=config.JOBS_LEASE_SECONDS,
+                )
+                _pool.start()
+            _store = store
+    return _store
+
+
+def submit(text: str, payload: Dict[str, Any]) -> Tuple[str, bool]:
+    """
+    Enqueue an analysis (deduplicated by content hash, preferences and rule
+    version, so a rule reload never returns a result scored under old rules).
+    Returns (job_id, created).
+    """
+    from .pipeline import parse_options, signals_key
+    prefs = json.dumps(payload.get("preferences"), sort_keys=True, default=str)
+    key = (f"{signals_key(text, parse_options(payload))}-{uuid.uuid5(uuid.NAMESPACE_OID, prefs).hex[:12]}"
+           f"-{rules.current().version}")
+    job_payload = dict(payload, text=text)
+    job_payload.pop("async", None)
+    job_id, created = get_store().enqueue(key, job_payload, priority=len(text))
+    metrics.incr("jobs.enqueued" if created else "jobs.deduplicated")
+    return job_id, created
+
+
+def wait_for(job_id: str, timeout: float, interval: float = 0.25) -> Optional[Dict[str, Any]]:
+    """Fetch a job, polling the store until it leaves queued/running or `timeout` passes."""
+    store = get_store()
+    deadline = time.time() + max(0.0, timeout)
+    job = store.get(job_id)
+    while job is not None and job["status"] in PENDING and time.time() < deadline:
+        time.sleep(interval)
+        job = store.get(job_id)
+    return job
@@ -0,0 +1,171 @@
+# app/lexicon.py
+"""
+One vocabulary for the three keyword consumers.
+
+The "lexicon" section of the rule file maps every literal term to everything
+that listens for it:
+
+  "data broker": {"heuristics": ["TP_SELL"], "matcher": ["THIRDPARTY_PHRASES"],
+                  "preferences": ["no_sale_or_sharing"]}
+
+  heuristics    heuristic pattern keys; a hit counts like a regex match (heuristics.py)
+  matcher       spaCy matcher labels, formerly PhraseMatcher lists (nlp_spacy.py)
+  preferences   preferences whose conflict check the term triggers (policy_conflicts.py)
+
+All terms compile into one token-level KeywordAutomaton. Text is split into
+lowercased word tokens (\\w+), so matching ignores case and punctuation:
+"cross-border", "Cross border" and "cross–border" are one term. A trailing *
+on a token matches any token with that prefix ("collect*": collects,
+collected, collection).
+
+scan() runs the automaton once over a document and returns typed hits with
+character offsets. The last few documents' scans are memoized, so the
+heuristic, spaCy and conflict passes of one request share a single scan.
+
+Only literal terms belong here. Patterns with structure (gaps, ".*", digits)
+stay regexes in the heuristics section.
+"""
+import re
+import threading
+from bisect import bisect_left
+from collections import OrderedDict
+from itertools import product
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from .automaton import KeywordAutomaton
+
+KINDS = ("heuristics", "matcher", "preferences")
+
+_TOKEN = re.compile(r"\w+")
+_TERM_TOKEN = re.compile(r"\w+\*?")
+
+Hit = Tuple[int, int, str]   # (start char, end char, label)
+
+
+class Lexicon:
+    """A compiled lexicon section; treat as immutable (a rule reload builds a new one)."""
+
+    def __init__(self, entries: Dict[str, Dict[str, List[str]]], memo: int = 4):
+        self.entries = entries
+        terms: List[Tuple[str, ...]] = []
+        self._tags: List[Tuple[Tuple[str, str], ...]] = []
+        for term, targets in entries.items():
+            unknown = [k for k in targets if k not in KINDS]
+            if unknown:
+                raise ValueError(f"lexicon.{term}: unknown targets {unknown} (expected {KINDS})")
+            tokens = tuple(_TERM_TOKEN.findall(term.lower()))
+            if not tokens:
+                raise ValueError(f"lexicon.{term!r}: no word tokens")
+            terms.append(tokens)
+            self._tags.append(tuple((kind, label) for kind in KINDS for label in targets.get(kind, [])))
+
+        self._vocab: Set[str] = {t for tokens in terms for t in tokens if not t.endswith("*")}
+        self._prefixes = tuple(sorted({t[:-1] for tokens in terms for t in tokens if t.endswith("*")},
+                                      key=len, reverse=True))
+        self._automaton = KeywordAutomaton(
+            (variant, i) for i, tokens in enumerate(terms) for variant in self._variants(tokens)
+        )
+        self._memo_size = memo
+        self._memo: "OrderedDict[str, Dict[str, List[Hit]]]" = OrderedDict()
+        self._memo_lock = threading.Lock()
+
+    def _variants(self, tokens: Tuple[str, ...]) -> Set[Tuple[str, ...]]:
+        # A prefix token also has to match the vocabulary words (and longer
+        # prefix stems) that start with it, since those map to other symbols.
+        options = []
+        for t in tokens:
+            if t.endswith("*"):
+                stem = t[:-1]
+                options.append([t] + [v for v in self._vocab if v.startswith(stem)]
+                               + [p + "*" for p in self._prefixes if p != stem and p.startswith(stem)])
+            else:
+                options.append([t])
+        return set(product(*options))
+
+    def terms(self, kind: str) -> Dict[str, List[str]]:
+        """label -> the terms feeding it, for one consumer kind (rule versions, prototypes)."""
+        out: Dict[str, List[str]] = {}
+        for term, targets in self.entries.items():
+            for label in targets.get(kind, []):
+                out.setdefault(label, []).append(term)
+        return out
+
+    def _scan(self, text: str, pos: int, endpos: int) -> Dict[str, List[Hit]]:
+        window = text[pos:endpos] if pos or endpos < len(text) else text
+        low = window.lower()
+        if len(low) != len(window):   # a case mapping changed lengths: offsets would drift
+            low = None
+        matches = list(_TOKEN.finditer(window if low is None else low))
+        tokens = [m.group() for m in matches] if low is not None else [m.group().lower() for m in matches]
+        # Token -> automaton symbol: the token itself if some term uses it, else
+        # its longest prefix stem + "*" (anything else resets the automaton)
+        vocab, prefixes = self._vocab, self._prefixes
+        if prefixes:
+            tokens = [t if t in vocab or not t.startswith(prefixes)
+                      else next(p for p in prefixes if t.startswith(p)) + "*" for t in tokens]
+        out: Dict[str, List[Hit]] = {kind: [] for kind in KINDS}
+        for s, e, i in self._automaton.finditer(tokens):
+            start, end = pos + matches[s].start(), pos + matches[e - 1].end()
+            for kind, label in self._tags[i]:
+                out[kind].append((start, end, label))
+        for hits in out.values():
+            hits.sort(key=lambda h: (h[0], -h[1]))
+        return out
+
+    def scan(self, text: str, pos: int = 0, endpos: Optional[int] = None) -> Dict[str, List[Hit]]:
+        """
+        kind -> hits (start, end, label) in text[pos:endpos], ordered by start
+        (longest first). Whole-text scans are memoized; don't mutate the lists.
+        """
+        if pos or endpos is not None:
+            return self._scan(text, pos, len(text) if endpos is None else endpos)
+        with self._memo_lock:
+            hit = self._memo.get(text)
+            if hit is not None:
+                self._memo.move_to_end(text)
+                return hit
+        out = self._scan(text, 0, len(text))
+        with self._memo_lock:
+            self._memo[text] = out
+            while len(self._memo) > self._memo_size:
+                self._memo.popitem(last=False)
+        return out
+
+    def labels(self, text: str, kind: str) -> Set[str]:
+        """Labels of `kind` with a hit anywhere in a short text (one evidence line)."""
+        return {label for _, _, label in self._scan(text, 0, len(text))[kind]}
+
+    @classmethod
+    def from_lists(cls, kind: str, lists: Dict[str, Iterable[str]]) -> "Lexicon":
+        """A lexicon for one consumer from label -> terms lists."""
+        entries: Dict[str, Dict[str, List[str]]] = {}
+        for label, terms in lists.items():
+            for term in terms:
+                labels = entries.setdefault(term, {}).setdefault(kind, [])
+                if label not in labels:
+                    labels.append(label)
+        return cls(entries)
+
+
+def spans_by_label(hits: List[Hit]) -> Dict[str, List[Tuple[int, int]]]:
+    """
+    Per label, the hits a regex alternation of its terms would find: leftmost,
+    longest at one start, non-overlapping ("data broker" once, not also "broker").
+    """
+    out: Dict[str, List[Tuple[int, int]]] = {}
+    for start, end, label in hits:
+        spans = out.setdefault(label, [])
+        if not spans or start >= spans[-1][1]:
+            spans.append((start, end))
+    return out
+
+
+def labels_in(hits: List[Hit], start: int, end: int) -> Set[str]:
+    """Labels of the hits lying within text[start:end]; `hits` ordered by start."""
+    i = bisect_left(hits, (start, -1, ""))
+    found = set()
+    while i < len(hits) and hits[i][0] < end:
+        if hits[i][1] <= end:
+            found.add(hits[i][2])
+        i += 1
+    return found
@@ -0,0 +1,119 @@
+# app/memory.py
+"""
+Per-stage memory accounting for /analyze, and the per-request memory budget.
+
+stage(name) wraps one step of a request (routes.analyze, pipeline.py) and
+adds to /metrics:
+
+  memory.<stage>.calls
+  memory.<stage>.rss_growth_mb   resident set growth over the stage, summed (Linux /proc)
+  memory.<stage>.peak_mb         Python heap peak above the stage's starting point, summed,
+  memory.<stage>.peak_mb_max     and the largest seen; only while tracemalloc traces
+                                 (MEMORY_TRACE in config.py, or bench/memory.py)
+  memory.rss_mb                  gauge, process RSS after each request
+
+It also notes each stage's wall time for the thread's current request
+(last_timings(); shadow.py compares a candidate's stage times against it).
+
+These are process-wide readings: with several requests in flight a stage is
+also charged for what its neighbours allocate meanwhile, so compare stages
+over many requests, or measure one request at a time (bench/memory.py).
+tracemalloc roughly doubles allocation cost; leave it off in production
+unless you are chasing a leak.
+
+The budget: spaCy's Doc is most of a request's peak and grows linearly with
+the text (SPACY_BYTES_PER_CHAR). spacy_chunk_chars() tells the pipeline to
+parse a text that would not fit REQUEST_MEMORY_BUDGET_MB in pieces that do
+(nlp_spacy.spacy_signals). The pool (SPACY_THREADS) bounds how many of those
+run at once, so a worker's spaCy peak stays under threads x budget.
+"""
+import os
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+from . import config, metrics
+
+_MB = 2 ** 20
+_PAGE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+_local = threading.local()   # per thread: stack of open stages ([peak seen by nested stages]), timings
+
+# Never cut pieces smaller than this, whatever the budget says
+MIN_CHUNK_CHARS = 5_000
+
+
+def rss_bytes() -> Optional[int]:
+    """Resident set size of this process (None where /proc is missing)."""
+    try:
+        with open("/proc/self/statm", "rb") as f:
+            return int(f.read().split()[1]) * _PAGE
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def start_tracing() -> None:
+    """Start tracemalloc when MEMORY_TRACE asks for it (idempotent)."""
+    if getattr(config, "MEMORY_TRACE", False) and not tracemalloc.is_tracing():
+        tracemalloc.start()
+
+
+@contextmanager
+def stage(name: str):
+    """Account the memory and wall time one stage of a request uses (see the module docstring)."""
+    stack = getattr(_local, "stack", None)
+    if stack is None:
+        stack = _local.stack = []
+    if not stack:   # a new request on this thread
+        _local.timings = {}
+    started = time.perf_counter()
+    tracing = tracemalloc.is_tracing()
+    if tracing:
+        base, peak = tracemalloc.get_traced_memory()
+        if stack:   # hand the enclosing stage its peak so far before resetting it
+            stack[-1][0] = max(stack[-1][0], peak)
+        tracemalloc.reset_peak()
+    rss = rss_bytes()
+    frame = [0]
+    stack.append(frame)
+    try:
+        yield
+    finally:
+        stack.pop()
+        _local.timings[name] = _local.timings.get(name, 0.0) + time.perf_counter() - started
+        metrics.incr(f"memory.{name}.calls")
+        after = rss_bytes()
+        if rss is not None and after is not None and after > rss:
+            metrics.incr(f"memory.{name}.rss_growth_mb", (after - rss) / _MB)
+        if tracing and tracemalloc.is_tracing():
+            # A nested stage reset the peak: take the larger of its peak and ours
+            peak = max(tracemalloc.get_traced_memory()[1], frame[0])
+            if stack:
+                stack[-1][0] = max(stack[-1][0], peak)
+            peak_mb = max(0, peak - base) / _MB
+            metrics.incr(f"memory.{name}.peak_mb", peak_mb)
+            if peak_mb > metrics.get(f"memory.{name}.peak_mb_max"):
+                metrics.set_value(f"memory.{name}.peak_mb_max", peak_mb)
+        if not stack and after is not None:
+            metrics.set_value("memory.rss_mb", after / _MB)
+
+
+def last_timings() -> Dict[str, float]:
+    """Wall seconds per stage of the latest request on this thread (the current one, while it runs)."""
+    return dict(getattr(_local, "timings", {}))
+
+
+def spacy_chunk_chars(chars: int) -> Optional[int]:
+    """
+    None when spaCy can take a `chars`-long text in one Doc within
+    REQUEST_MEMORY_BUDGET_MB, else the piece size that fits.
+    """
+    budget = getattr(config, "REQUEST_MEMORY_BUDGET_MB", None)
+    if not budget:
+        return None
+    fits = int(budget * _MB / max(1, getattr(config, "SPACY_BYTES_PER_CHAR", 600)))
+    if chars <= fits:
+        return None
+    metrics.incr("memory.budget_chunked")
+    return max(fits, MIN_CHUNK_CHARS)
@@ -0,0 +1,40 @@
+# app/metrics.py
+"""
+Process-local counters exposed at GET /metrics.
+
+Counters are plain floats keyed by dotted names ("singleflight.coalesced");
+set_value() stores gauges (ratios, sizes) in the same namespace.
+Each worker process reports its own numbers; aggregate them in whatever
+scrapes the endpoint.
+"""
+import threading
+from typing import Dict
+
+_lock = threading.Lock()
+_counters: Dict[str, float] = {}
+
+
+def incr(name: str, value: float = 1.0) -> None:
+    with _lock:
+        _counters[name] = _counters.get(name, 0.0) + value
+
+
+def set_value(name: str, value: float) -> None:
+    """Gauge-style: overwrite rather than accumulate (ratios, sizes)."""
+    with _lock:
+        _counters[name] = float(value)
+
+
+def get(name: str) -> float:
+    with _lock:
+        return _counters.get(name, 0.0)
+
+
+def snapshot() -> Dict[str, float]:
+    with _lock:
+        return dict(sorted(_counters.items()))
+
+
+def reset() -> None:
+    with _lock:
+        _counters.clear()
@@ -1,7 +1,14 @@
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Tuple
+import heapq
+from bisect import bisect_left
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 import spacy
-from spacy.matcher import Matcher, PhraseMatcher
+from spacy.matcher import Matcher
+
+from . import config, rules
 
 CATEGORIES = [
     "Data Collection",
@@ -17,177 +24,344 @@ CATEGORIES = [
 # If you train a custom spaCy model with textcat, point SPACY_MODEL_DIR to it
 _SPACY_MODEL = os.environ.get("SPACY_MODEL_DIR")
 _nlp = None
-_MATCHER = None
-_PHRASE = None
+_MATCHERS = None   # (matcher rule version, Matcher)
+
+# One model per process, shared by every request thread. Loading and matcher
+# builds happen under these locks (double-checked, so the warm path takes no
+# lock); a pipeline is published only once fully assembled. Parsing a Doc and
+# running the Matcher over it don't mutate shared state, so requests then
+# use the model concurrently.
+_nlp_lock = threading.Lock()
+_matchers_lock = threading.Lock()
+
+def _load(model: str):
+    nlp = spacy.load(model)
+    if "sentencizer" not in nlp.pipe_names:
+        nlp.add_pipe("sentencizer")
+    return nlp
 
 def _get_nlp():
     global _nlp
+    override = getattr(_local, "nlp", None)
+    if override is not None:
+        return override
     if _nlp is not None:
         return _nlp
-    if _SPACY_MODEL and os.path.isdir(_SPACY_MODEL):
-        _nlp = spacy.load(_SPACY_MODEL)
-    else:
-        _nlp = spacy.load("en_core_web_sm")
-    if "sentencizer" not in _nlp.pipe_names:
-        _nlp.add_pipe("sentencizer")
+    with _nlp_lock:
+        if _nlp is None:
+            _nlp = _load(_SPACY_MODEL if _SPACY_MODEL and os.path.isdir(_SPACY_MODEL) else "en_core_web_sm")
     return _nlp
 
-def _build_matchers(nlp):
+# Shadow evaluation (shadow.py) runs a candidate model on a background thread:
+# candidate() switches that thread alone to it, with Matchers of its own (so
+# neither side evicts the other's) and inline parsing outside the serving pool.
+_local = threading.local()
+_candidates: Dict[str, Any] = {}   # model dir -> loaded candidate pipeline
+
+@contextmanager
+def candidate(model_dir: str = None):
+    """On this thread: spaCy work uses the model at `model_dir` (None: the production one)."""
+    if model_dir:
+        with _nlp_lock:
+            nlp = _candidates.get(model_dir)
+            if nlp is None:
+                nlp = _candidates[model_dir] = _load(model_dir)
+    else:
+        nlp = _get_nlp()
+    _local.nlp = nlp
+    try:
+        yield nlp
+    finally:
+        _local.nlp = None
+
+# Tokenizing, parsing and matching run in a small per-process pool
+# (SPACY_THREADS). Under a threaded server it caps how many Docs are alive
+# at once however many request threads there are (a long policy's Doc costs
+# tens of MB), and the numpy kernels in the pipeline components release the
+# GIL, so those few parses overlap. 0 runs everything on the request thread.
+_pool = None
+_pool_lock = threading.Lock()
+
+def _get_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ThreadPoolExecutor(max_workers=config.SPACY_THREADS, thread_name_prefix="spacy")
+    return _pool
+
+def _in_pool(fn, *args):
+    """
+    fn(*args) on a spaCy pool thread (the caller blocks); inline with
+    SPACY_THREADS = 0, on a pool thread, or under candidate().
+    """
+    if (getattr(config, "SPACY_THREADS", 0) <= 0 or threading.current_thread().name.startswith("spacy")
+            or getattr(_local, "nlp", None) is not None):
+        return fn(*args)
+    return _get_pool().submit(fn, *args).result()
+
+# Token patterns and pattern -> categories live in the rule set ("matcher" in
+# rules/default.json); the literal phrases are lexicon terms, found by the
+# per-text lexicon scan the heuristics share (lexicon.py). The Matcher is built
+# once per matcher rule version; after a reload it is rebuilt in the rules
+# watcher thread (if spaCy is already loaded), so requests never pay for the compile.
+
+def _build_matchers(nlp, ruleset):
     m = Matcher(nlp.vocab)
-    p = PhraseMatcher(nlp.vocab, attr="LOWER")
-
-    # --- Data Collection ---
-    p.add("DATA_COLLECTION", [nlp.make_doc(t) for t in [
-        "information we collect", "data we collect", "categories of information",
-        "collect personal information", "collection of personal data", "sensitive information"
-    ]])
-    m.add("DATA_COLLECTION_VERB", [[{"LEMMA": "collect"}]])
-
-    # --- Third-Party Sharing/Selling ---
-    p.add("THIRDPARTY_PHRASES", [nlp.make_doc(t) for t in [
-        "share with third party", "shared with third parties", "our partners", "data broker",
-        "sell personal data", "sale of personal data", "monetize data"
-    ]])
-    m.add("SELL_SHARE", [
-        [{"LOWER": {"IN": ["sell","sale","sold","monetize","monetised","monetized","broker"]}}],
-        [{"LEMMA": "share"}, {"LOWER": "with"}, {"LOWER": {"IN": ["third","partners","partner","third-party","third-parties"]}}]
-    ])
-
-    # --- Purpose Limitation ---
-    p.add("PURPOSE_LIMIT", [nlp.make_doc(t) for t in [
-        "purpose", "compatible further processing", "use only for", "use for the purposes described"
-    ]])
-    m.add("VAGUE_BASIS", [[{"LOWER": "legitimate"}, {"LOWER": "interests"}]])
-
-    # --- User Control & Rights ---
-    p.add("USER_RIGHTS", [nlp.make_doc(t) for t in [
-        "access your data", "delete your data", "erasure", "correct your data", "rectify",
-        "data portability", "opt out", "do not sell", "do not share", "ccpa", "gdpr"
-    ]])
-
-    # --- Retention & Deletion ---
-    p.add("RETENTION", [nlp.make_doc(t) for t in [
-        "retain data", "retention period", "deleted after", "deletion timeline", "retain indefinitely",
-        "as long as necessary", "as long as needed"
-    ]])
-
-    # --- Security Practices ---
-    p.add("SECURITY", [nlp.make_doc(t) for t in [
-        "encryption", "encrypted", "tls", "iso 27001", "soc 2", "access controls", "security measures",
-        "security breach", "breach notification"
-    ]])
-
-    # --- International Transfers & Jurisdiction ---
-    p.add("INTL", [nlp.make_doc(t) for t in [
-        "international transfers", "cross-border", "transfer outside", "jurisdiction", "venue",
-        "arbitration", "data privacy framework", "standard contractual clauses", "adequacy decision"
-    ]])
-
-    # --- Children/Minors + Sensitive Data ---
-    p.add("CHILDREN", [nlp.make_doc(t) for t in [
-        "coppa", "child", "children", "minor", "under 13", "under thirteen",
-        "biometric", "health data", "precise location", "sensitive categories"
-    ]])
-
-    return m, p
-
-def _get_matchers(nlp):
-    global _MATCHER, _PHRASE
-    if _MATCHER is None or _PHRASE is None:
-        _MATCHER, _PHRASE = _build_matchers(nlp)
-    return _MATCHER, _PHRASE
-
-PATTERN_TO_CATS = {
-    "DATA_COLLECTION": ["Data Collection"],
-    "DATA_COLLECTION_VERB": ["Data Collection"],
-    "THIRDPARTY_PHRASES": ["Third-Party Sharing/Selling"],
-    "SELL_SHARE": ["Third-Party Sharing/Selling"],
-    "PURPOSE_LIMIT": ["Purpose Limitation"],
-    "VAGUE_BASIS": ["Purpose Limitation"],
-    "USER_RIGHTS": ["User Control & Rights"],
-    "RETENTION": ["Retention & Deletion"],
-    "SECURITY": ["Security Practices"],
-    "INTL": ["International Transfers & Jurisdiction"],
-    "CHILDREN": ["Children/Minors + Sensitive Data"],
-}
-
-def _keyword_hits_to_scores(keyword_hits: Dict[str, int]) -> Dict[str, float]:
+
+    # Token patterns (lemmas / alternatives) that literal terms can't express
+    for label, patterns in ruleset.token_patterns.items():
+        m.add(label, patterns)
+
+    return m
+
+def _get_matchers(nlp, ruleset=None):
+    global _MATCHERS
+    ruleset = ruleset or rules.current()
+    version = ruleset.versions["matcher"]
+    if getattr(_local, "nlp", None) is not None:
+        own = getattr(_local, "matchers", None)
+        if own is None or own[0] is not nlp or own[1] != version:
+            own = _local.matchers = (nlp, version, _build_matchers(nlp, ruleset))
+        return own[2]
+    built = _MATCHERS
+    if built is None or built[0] != version:
+        with _matchers_lock:
+            built = _MATCHERS
+            if built is None or built[0] != version:
+                built = _MATCHERS = (version, _build_matchers(nlp, ruleset))
+    return built[1]
+
+def _warm_matchers(ruleset) -> None:
+    if _nlp is not None:
+        _get_matchers(_nlp, ruleset)
+
+rules.on_load(_warm_matchers)
+
+def _keyword_hits_to_scores(keyword_hits: Dict[str, int], pattern_categories: Dict[str, List[str]]) -> Dict[str, float]:
     """
     Turn raw hit counts into [0,1] per category. Simple normalization:
       per-pattern contribution = min(1.0, hits/3), summed over patterns then clipped to 1.0.
     """
     out = {cat: 0.0 for cat in CATEGORIES}
     for pat, n in keyword_hits.items():
-        cats = PATTERN_TO_CATS.get(pat, [])
+        cats = pattern_categories.get(pat, [])
         contrib = min(1.0, n / 3.0)
         for c in cats:
             out[c] = min(1.0, out[c] + contrib)
     return out
 
-# ---------------------------
-# Public: snippets extractor
-# ---------------------------
-def spacy_extract_category_lines(text: str, top_k: int = 3, use_textcat: bool = True) -> Dict[str, List[Dict[str, Any]]]:
+def _matches(doc, text, nlp, matcher, ruleset, offset: int = 0) -> List[Tuple[int, int, str]]:
     """
-    For each category, return up to top_k sentence snippets with:
-      { "text", "start", "end", "score", "matched": [...] }
-    Score blends keyword strength and (if available) textcat confidence.
+    (start, end, label) token spans of every token-pattern match and every
+    matcher-label lexicon hit in `doc`, ordered by start. `doc` is the Doc of
+    text[offset:offset + len(doc.text)] (the whole text, or one piece of it):
+    lexicon hits come from the whole text's memoized scan.
     """
-    nlp = _get_nlp()
-    matcher, phr = _get_matchers(nlp)
-    doc = nlp(text)
-
-    # If your model has a textcat (doc-level), we’ll reuse doc.cats for each sentence
-    has_textcat = use_textcat and any("textcat" in name for name in nlp.pipe_names)
-    doc_level_cats = doc.cats if has_textcat else {}
+    strings = nlp.vocab.strings
+    hits = [(s, e, strings[match_id]) for match_id, s, e in matcher(doc)]
+    lexicon_hits = ruleset.lexicon.scan(text)["matcher"]
+    end = offset + len(doc.text)
+    for i in range(bisect_left(lexicon_hits, (offset,)), len(lexicon_hits)):
+        start, stop, label = lexicon_hits[i]
+        if start >= end:
+            break
+        if stop > end:
+            continue   # straddles the end of the piece
+        span = doc.char_span(start - offset, stop - offset, alignment_mode="expand")
+        if span is not None:
+            hits.append((span.start, span.end, label))
+    hits.sort()
+    return hits
+
+def _parse_and_match(piece, text, offset, nlp, matcher, ruleset):
+    """
+    (Doc, _matches hits) for `piece` = text[offset:...] (no hits without a
+    matcher): the part of a request that runs in the pool.
+    """
+    doc = nlp(piece)
+    return doc, _matches(doc, text, nlp, matcher, ruleset, offset) if matcher is not None else []
 
-    cat_buckets: Dict[str, List[Dict[str, Any]]] = {c: [] for c in CATEGORIES}
+def _iter_sentence_matches(doc, hits):
+    """
+    Stream (sentence, per-pattern hit counts, matched token spans) for every
+    sentence with at least one hit of `_matches`. Spans are (start, end) token
+    offsets into `doc`, so nothing is copied out of the Doc here.
 
+    Hits are found once over the whole Doc and bucketed by sentence.
+    Matches that straddle a sentence boundary are dropped, as before.
+    """
+    i = 0
     for sent in doc.sents:
-        span = doc[sent.start:sent.end]
-
-        m_hits = matcher(span)
-        p_hits = phr(span)
-
-        # Count hits per pattern + collect matched terms
+        while i < len(hits) and hits[i][0] < sent.start:
+            i += 1
         pat_counts: Dict[str, int] = {}
-        matched_terms: List[str] = []
-        for match_id, s, e in m_hits:
-            name = nlp.vocab.strings[match_id]
+        spans: List[Tuple[int, int]] = []
+        while i < len(hits) and hits[i][0] < sent.end:
+            s, e, name = hits[i]
+            i += 1
+            if e > sent.end:
+                continue
             pat_counts[name] = pat_counts.get(name, 0) + 1
-            matched_terms.append(span[s:e].text)
-        for match_id, s, e in p_hits:
-            name = nlp.vocab.strings[match_id]
-            pat_counts[name] = pat_counts.get(name, 0) + 1
-            matched_terms.append(span[s:e].text)
+            spans.append((s, e))
+        if pat_counts:
+            yield sent, pat_counts, spans
+
+
+# ---------------------------
+# Public: probs + snippets from one parse
+# ---------------------------
+def spacy_signals(text: str, top_k: int = 3, probs: bool = True, evidence: bool = True,
+                  use_textcat: bool = True, mode: str = None, chunk_chars: int = None
+                  ) -> Tuple[Dict[str, float], Dict[str, List[Dict[str, Any]]]]:
+    """
+    (spacy_scores(text), spacy_extract_category_lines(text, top_k, ...)) from
+    one parse of `text`; a half not asked for comes back as {}.
+
+    chunk_chars: parse the text in pieces of about this many characters, cut
+    at sentence ends, so that only one piece's Doc is alive at a time (the
+    per-request memory budget, see memory.py). Offsets stay relative to the
+    whole text. Matches straddling a cut are lost, like those straddling a
+    sentence; with a textcat model, sentences blend their piece's cats and
+    the probs are the length-weighted mean over pieces.
+    """
+    nlp = _get_nlp()
+    ruleset = rules.current()
+    mode = mode or getattr(config, "EVIDENCE_RETRIEVAL", "matcher")
+    textcat = any("textcat" in name for name in nlp.pipe_names)
+    want_lines = evidence and (top_k is None or top_k > 0)
+    matcher = _get_matchers(nlp, ruleset) if probs or (want_lines and mode != "vector") else None
 
-        if not pat_counts:
+    pat_counts: Dict[str, int] = {}
+    piece_cats: List[Tuple[int, Dict[str, float]]] = []
+    # Heap entries: (score, -seq, start_char, end_char, matched char spans). The smallest
+    # entry is the weakest candidate; ties go to the earlier sentence, as a stable sort would.
+    heaps: Dict[str, List[tuple]] = {c: [] for c in CATEGORIES}
+    vector_lines: Dict[str, List[Dict[str, Any]]] = {c: [] for c in CATEGORIES}
+    seq = 0
+    for offset, piece in _pieces(text, chunk_chars):
+        doc, hits = _in_pool(_parse_and_match, piece, text, offset, nlp, matcher, ruleset)
+        if textcat:
+            piece_cats.append((len(piece), doc.cats))
+        if probs:
+            for _s, _e, name in hits:
+                pat_counts[name] = pat_counts.get(name, 0) + 1
+        if not want_lines:
             continue
+        if mode == "vector":
+            from .vector_evidence import extract_category_lines
+            for cat, lines in extract_category_lines(doc, nlp, ruleset, CATEGORIES, top_k=top_k).items():
+                vector_lines[cat].extend(dict(line, start=line["start"] + offset, end=line["end"] + offset)
+                                         for line in lines)
+        else:
+            seq = _push_sentences(heaps, doc, hits, offset, seq, doc.cats if textcat and use_textcat else {},
+                                  ruleset, top_k)
+
+    spacy_probs: Dict[str, float] = {}
+    if probs:
+        cats = _mean_cats(piece_cats)
+        if cats:
+            # A classifier with the right labels beats keyword counts
+            spacy_probs = {cat: float(cats.get(cat, 0.0)) for cat in CATEGORIES}
+        else:
+            spacy_probs = _keyword_hits_to_scores(pat_counts, ruleset.pattern_categories)
+
+    lines: Dict[str, List[Dict[str, Any]]] = {}
+    if evidence and mode == "vector":
+        for cat in CATEGORIES:
+            ranked = sorted(vector_lines[cat], key=lambda line: (-line["score"], line["start"]))
+            lines[cat] = ranked if top_k is None else ranked[:max(top_k, 0)]
+    elif evidence:
+        # Snippet text and matched terms are materialized for the final top_k alone
+        for cat in CATEGORIES:
+            lines[cat] = [
+                {
+                    "text": text[start:end].strip(),
+                    "start": start,
+                    "end": end,
+                    "score": score,
+                    "matched": sorted({text[a:b] for a, b in spans}),
+                }
+                for score, _, start, end, spans in sorted(heaps[cat], reverse=True)
+            ]
+    return spacy_probs, lines
+
+
+def _pieces(text: str, size: int = None):
+    """(offset, piece) cuts of `text` of at most `size` chars, at sentence ends where there is one."""
+    if not size or len(text) <= size:
+        yield 0, text
+        return
+    start = 0
+    while start < len(text):
+        end = min(len(text), start + size)
+        if end < len(text):
+            cut = max(text.rfind(b, start + size // 2, end) for b in (". ", "! ", "? ", "\n"))
+            if cut != -1:
+                end = cut + 1
+        yield start, text[start:end]
+        start = end
+
+
+def _mean_cats(piece_cats: List[Tuple[int, Dict[str, float]]]) -> Dict[str, float]:
+    """Length-weighted mean of per-piece textcat probs (one piece: its cats as they are)."""
+    if len(piece_cats) <= 1:
+        return piece_cats[0][1] if piece_cats else {}
+    total = sum(n for n, _ in piece_cats) or 1
+    out: Dict[str, float] = {}
+    for n, cats in piece_cats:
+        for cat, p in cats.items():
+            out[cat] = out.get(cat, 0.0) + p * n / total
+    return out
 
-        kw_scores = _keyword_hits_to_scores(pat_counts)
+
+def _push_sentences(heaps, doc, hits, offset: int, seq: int, doc_cats: Dict[str, float], ruleset, top_k) -> int:
+    """
+    Score the matched sentences of one Doc (a piece starting at `offset`) into
+    the per-category min-heaps; returns the next sentence sequence number.
+    Entries hold char offsets only, so nothing keeps the Doc alive.
+    """
+    for sent, pat_counts, spans in _iter_sentence_matches(doc, hits):
+        kw_scores = _keyword_hits_to_scores(pat_counts, ruleset.pattern_categories)
+        matched = None
 
         for cat in CATEGORIES:
             kw = kw_scores.get(cat, 0.0)
             # Blend with any doc-level textcat prob (if available)
-            tc = float(doc_level_cats.get(cat, 0.0)) if doc_level_cats else None
+            tc = float(doc_cats.get(cat, 0.0)) if doc_cats else None
             score = 0.7 * kw + (0.3 * tc if tc is not None else 0.0)
 
             if kw > 0 or (tc is not None and tc > 0.3):
-                cat_buckets[cat].append({
-                    "text": sent.text.strip(),
-                    "start": sent.start_char,
-                    "end": sent.end_char,
-                    "score": min(1.0, score),
-                    "matched": sorted(set(matched_terms)),
-                })
-
-    # keep best top_k per category
-    for cat in CATEGORIES:
-        cat_buckets[cat].sort(key=lambda x: x["score"], reverse=True)
-        if top_k is not None:
-            cat_buckets[cat] = cat_buckets[cat][:top_k]
-
-    return cat_buckets
+                if matched is None:
+                    matched = [(offset + doc[s].idx, offset + doc[e - 1].idx + len(doc[e - 1])) for s, e in spans]
+                entry = (min(1.0, score), -seq, offset + sent.start_char, offset + sent.end_char, matched)
+                heap = heaps[cat]
+                if top_k is None or len(heap) < top_k:
+                    heapq.heappush(heap, entry)
+                elif entry > heap[0]:
+                    heapq.heapreplace(heap, entry)
+        seq += 1
+    return seq
+
+
+# ---------------------------
+# Public: snippets extractor
+# ---------------------------
+def spacy_extract_category_lines(text: str, top_k: int = 3, use_textcat: bool = True,
+                                 mode: str = None) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    For each category, return up to top_k sentence snippets with:
+      { "text", "start", "end", "score", "matched": [...] }
+    Score blends keyword strength and (if available) textcat confidence.
+
+    mode: "matcher" (phrase/token patterns, below) or "vector" (embedding
+    retrieval, see vector_evidence.py); defaults to config.EVIDENCE_RETRIEVAL.
+
+    Sentences stream through fixed-size per-category min-heaps that hold only
+    offsets; snippet text and matched terms are materialized for the final
+    top_k alone, so memory stays O(categories x top_k) however long the policy.
+    """
+    return spacy_signals(text, top_k=top_k, probs=False, use_textcat=use_textcat, mode=mode)[1]
 
 # ---------------------------
 # Public: per-category probs
@@ -198,24 +372,4 @@ def spacy_scores(text: str) -> Dict[str, float]:
     If a textcat component with matching labels exists, use doc.cats.
     Otherwise, derive a heuristic probability from keyword hits across the whole text.
     """
-    nlp = _get_nlp()
-    matcher, phr = _get_matchers(nlp)
-    doc = nlp(text)
-
-    # If we have a classifier with the right labels, use it.
-    if any("textcat" in name for name in nlp.pipe_names) and doc.cats:
-        # Ensure only the categories we care about
-        return {cat: float(doc.cats.get(cat, 0.0)) for cat in CATEGORIES}
-
-    # Fallback: compute from keyword hits over entire doc
-    pat_counts: Dict[str, int] = {}
-
-    # Run on the whole doc once (PhraseMatcher supports full doc too)
-    for match_id, s, e in matcher(doc):
-        name = nlp.vocab.strings[match_id]
-        pat_counts[name] = pat_counts.get(name, 0) + 1
-    for match_id, s, e in phr(doc):
-        name = nlp.vocab.strings[match_id]
-        pat_counts[name] = pat_counts.get(name, 0) + 1
-
-    return _keyword_hits_to_scores(pat_counts)
\ No newline at end of file
+    return spacy_signals(text, evidence=False)[0]
@@ -0,0 +1,323 @@
+# app/pipeline.py
+"""
+The /analyze pipeline, split in two halves:
+
+  compute_signals(text, options)  text-only work: heuristics, Gemini
+                                  category scores + overview, spaCy probs and
+                                  evidence. Identical concurrent requests are
+                                  coalesced so they share one computation.
+  personalize(signals, prefs)     per-request work: preference conflicts,
+                                  penalties and the final Trust Score.
+
+run_analysis() glues both together and returns the /analyze response body;
+result_etag() names that body by its inputs (text hash, rules, models,
+preferences, options) so clients can revalidate without resending the text.
+
+Signals record the rule versions (rules.py) they were computed with, and a
+per-process LRU keeps recent ones. When a rule file is reloaded,
+refresh_signals() recomputes only the parts the changed sections feed:
+heuristics -> flags, matcher -> spaCy probs + evidence, preferences ->
+evidence tags (a lexicon term counts toward the sections it feeds). Gemini
+results depend on no rule section and are kept.
+"""
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, Optional
+
+from . import config, evidence_index, memory, metrics, rules, signal_store, trends
+from .hashing import normalize_spans, normalize_text, text_hash
+from .heuristics import detect_flags, detect_flags_incremental
+from .summarizer_gemini import llm_summary_categories, llm_general_eval
+from .scoring import compute_score
+from .distilled import category_scores
+from .cascade import account, score_categories
+from .preferences import validate_preferences, default_preferences, PREFERENCE_SCHEMA
+from .policy_conflicts import detect_conflicts, conflict_penalties, tag_evidence
+from .singleflight import SingleFlight, backend_from_config
+
+_flight = SingleFlight(backend_from_config(config), name="singleflight")
+
+
+def parse_options(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """Pull the analysis knobs out of an /analyze payload (see routes.analyze)."""
+    return {
+        "return_general": bool(payload.get("return_general", True)),
+        "return_snippets": bool(payload.get("return_snippets", True)),
+        "snippets_top_k": int(payload.get("snippets_top_k", 3)),
+        "include_spacy_probs": bool(payload.get("include_spacy_probs", True)),
+    }
+
+
+def signals_key(text: str, options: Dict[str, Any]) -> str:
+    """Coalescing key: normalized text hash + the options that change the signals."""
+    return _signals_key(text_hash(text), options)
+
+
+def _signals_key(digest: str, options: Dict[str, Any]) -> str:
+    opts = json.dumps(options, sort_keys=True, separators=(",", ":"))
+    return f"{digest}-{text_hash(opts)[:16]}"
+
+
+def _mtime(path: Optional[str]) -> Optional[int]:
+    try:
+        return os.stat(path).st_mtime_ns if path else None
+    except OSError:
+        return None
+
+
+def _model_versions() -> Dict[str, Any]:
+    """Everything besides the rules that decides which models produce a body."""
+    return {
+        "api": getattr(config, "API_VERSION", "v1"),
+        "gemini": [getattr(config, "GEMINI_MODEL", None), getattr(config, "GEMINI_MODEL_LARGE", None)],
+        "scorer": [getattr(config, "CATEGORY_SCORER", "gemini"), _mtime(getattr(config, "LOCAL_SCORER_PATH", None))],
+        "cascade": bool(getattr(config, "CASCADE_ENABLED", False)),
+        "evidence": getattr(config, "EVIDENCE_RETRIEVAL", "matcher"),
+        "spacy": os.environ.get("SPACY_MODEL_DIR") or "en_core_web_sm",
+    }
+
+
+def result_etag(digest: str, payload: Dict[str, Any]) -> str:
+    """
+    Entity tag (unquoted) for the /analyze body of the text with hash `digest`
+    under this payload's preferences and options, given the current rules and
+    models. It depends only on those inputs, so a client holding a body with
+    this tag can be answered 304 without any work.
+    """
+    _ok, prefs = validate_preferences(payload.get("preferences", default_preferences()))
+    variant = json.dumps([rules.current().version, _model_versions(), prefs, parse_options(payload)],
+                         sort_keys=True, separators=(",", ":"))
+    return f"{digest[:32]}-{hashlib.sha256(variant.encode('utf-8')).hexdigest()[:16]}"
+
+
+# Rule sections signals depend on (weights only matter in personalize)
+_SIGNAL_RULES = ("heuristics", "matcher", "preferences")
+
+
+def _rule_versions(ruleset) -> Dict[str, str]:
+    return {section: ruleset.versions[section] for section in _SIGNAL_RULES}
+
+
+def _heuristics(text: str, session_id: str = None) -> Dict[str, Any]:
+    # Fast regex heuristics (deterministic flags/bonuses/penalties);
+    # a session rescans only what changed since its previous request
+    return detect_flags_incremental(session_id, text) if session_id else detect_flags(text)
+
+
+def _nlp_signals(text: str, options: Dict[str, Any]):
+    """(spaCy probs, tagged evidence) as asked for by `options`, from one parse."""
+    spacy_probs = {}
+    evidence = {}
+
+    want_probs, want_lines = options["include_spacy_probs"], options["return_snippets"]
+    if want_probs or want_lines:
+        # Numeric per-category probabilities in [0,1] (used by scoring blend) and
+        # sentence-level evidence lines per category (top-K); a text over the
+        # memory budget is parsed in pieces
+        try:
+            from .nlp_spacy import spacy_signals
+            spacy_probs, evidence = spacy_signals(text, top_k=options["snippets_top_k"], probs=want_probs,
+                                                  evidence=want_lines,
+                                                  chunk_chars=memory.spacy_chunk_chars(len(text)))
+        except Exception:
+            spacy_probs, evidence = {}, {}
+
+    if want_lines:
+        # Requests whose texts differ only in whitespace share this result, so
+        # its lines point into the normalized text rather than this wrapping
+        evidence = {cat: normalize_spans(lines, text) for cat, lines in evidence.items()}
+        # Tag each line with the preferences its wording touches, once per shared result
+        tag_evidence(evidence, text=normalize_text(text))
+
+    return spacy_probs, evidence
+
+
+def _compute_signals(text: str, options: Dict[str, Any], session_id: str = None) -> Dict[str, Any]:
+    # Versions are taken first: a reload mid-computation then only makes the
+    # result look older than it is, and refresh_signals redoes that part.
+    versions = _rule_versions(rules.current())
+
+    # 1) Fast regex heuristics
+    with memory.stage("heuristics"):
+        heur = _heuristics(text, session_id)
+
+    # 2) spaCy signals (ahead of Gemini: the cascade routes on them)
+    with memory.stage("spacy"):
+        spacy_probs, evidence = _nlp_signals(text, options)
+
+    # 3) Gemini semantic judgments (normalized category scores in [0,1] + short reasons);
+    #    the cascade skips or narrows the call when cheap signals already agree,
+    #    otherwise the local distilled model serves when configured and confident
+    routing = None
+    with memory.stage("llm"):
+        if getattr(config, "CASCADE_ENABLED", False):
+            llm_cats, routing = score_categories(text, heur, spacy_probs)
+        else:
+            llm_cats = category_scores(text, llm_summary_categories)
+        llm_overview = llm_general_eval(text) if options["return_general"] else None
+        if routing is not None:
+            account(routing, overview_calls=1 if options["return_general"] else 0)
+
+    signals = {
+        "heuristics": heur,
+        "llm": llm_cats,
+        "overview": llm_overview,
+        "spacy": spacy_probs,
+        "evidence": evidence,
+        "routing": routing,
+        "rules": versions,
+    }
+    signal_store.record(text_hash(text), signals)
+    return signals
+
+
+def refresh_signals(signals: Dict[str, Any], text: Optional[str], options: Dict[str, Any],
+                    session_id: str = None) -> Optional[Dict[str, Any]]:
+    """
+    `signals` brought up to the current rule versions, recomputing only the
+    stale parts (a new dict; the input is shared and left alone). Returns the
+    input itself when nothing is stale, and None when a text-dependent part is
+    stale but `text` is unknown (hash-only index lookups).
+    """
+    current = _rule_versions(rules.current())
+    stored = signals.get("rules") or {}
+    stale = [section for section in _SIGNAL_RULES if stored.get(section) != current[section]]
+    if not stale:
+        return signals
+    if text is None and ("heuristics" in stale or "matcher" in stale):
+        return None
+
+    fresh = dict(signals, rules=current)
+    if "heuristics" in stale:
+        fresh["heuristics"] = _heuristics(text, session_id)
+    if "matcher" in stale:
+        fresh["spacy"], fresh["evidence"] = _nlp_signals(text, options)
+    elif "preferences" in stale:
+        evidence = {cat: [dict(ev) for ev in lines] for cat, lines in (signals.get("evidence") or {}).items()}
+        tag_evidence(evidence, retag=True, text=normalize_text(text))
+        fresh["evidence"] = evidence
+    for section in stale:
+        metrics.incr(f"signals.refreshed.{section}")
+    return fresh
+
+
+class SignalsCache:
+    """Small LRU of computed signals by signals_key (per process)."""
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self._lock = threading.Lock()
+        self._items: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            value = self._items.get(key)
+            if value is not None:
+                self._items.move_to_end(key)
+            return value
+
+    def put(self, key: str, value: Dict[str, Any]) -> None:
+        if self.capacity <= 0:
+            return
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self.capacity:
+                self._items.popitem(last=False)
+
+
+_cache = SignalsCache(getattr(config, "SIGNALS_CACHE_SIZE", 256))
+
+
+def compute_signals(text: str, options: Dict[str, Any], session_id: str = None) -> Dict[str, Any]:
+    """
+    Text-only signals for `text`. Concurrent calls with the same normalized text
+    and options share one computation (and its Gemini calls), and recent results
+    are reused from an LRU, refreshed if the rules changed since. Callers must
+    treat the returned dict as read-only: it may be handed to several requests.
+
+    The key is the whitespace-normalized text, so the shared result must not
+    depend on one request's wrapping: evidence text and offsets refer to
+    normalize_text(text). Heuristics do see the wrapping of the request that
+    computed them (line-scoped patterns stop at its line breaks) and are
+    shared as they are.
+
+    `session_id` only changes how heuristics are computed (incrementally, from
+    the session's previous text), not their result, so it is not part of the key.
+    """
+    key = signals_key(text, options)
+    signals = _cache.get(key)
+    hit = signals is not None
+    metrics.incr("signals_cache.hit" if hit else "signals_cache.miss")
+    if not hit:
+        signals, _shared = _flight.do(key, lambda: _compute_signals(text, options, session_id))
+    # Cached, or shared by another process, under rules older than ours
+    fresh = refresh_signals(signals, text, options, session_id)
+    if fresh is not signals or not hit:
+        _cache.put(key, fresh)
+    return fresh
+
+
+def cached_signals(digest: str, options: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    Signals this process computed recently for the text with hash `digest`,
+    if they are current or can be refreshed without the text; else None.
+    """
+    key = _signals_key(digest, options)
+    signals = _cache.get(key)
+    if signals is None:
+        return None
+    fresh = refresh_signals(signals, None, options)
+    if fresh is not None and fresh is not signals:
+        _cache.put(key, fresh)
+    return fresh
+
+
+def personalize(signals: Dict[str, Any], preferences: Any, options: Dict[str, Any]) -> Dict[str, Any]:
+    """Apply user preferences to shared signals and build the response body."""
+    ok, prefs = validate_preferences(preferences)
+    evidence = signals["evidence"]
+    weights = rules.current().weights
+
+    # --- Keyword conflicts with user preferences become score penalties ---
+    penalties = conflict_penalties(prefs, evidence)
+
+    # 4) Combine with weights into a transparent Trust Score (blend LLM + heuristics + spaCy)
+    #    compute_score gracefully handles missing spaCy by ignoring empty dicts.
+    result = compute_score(
+        heuristics=signals["heuristics"],
+        llm=signals["llm"],
+        spacy=signals["spacy"],
+        preference_penalties=penalties,
+        routing=signals.get("routing"),
+        weights=weights
+    )
+
+    # Conflict detection runs once, now that categories have scores
+    conflicts = detect_conflicts(prefs, categories=result["categories"], evidence=evidence)
+
+    # Attach personalized + transparency info
+    result["weights"] = weights
+    result["preferences"] = {"valid": ok, "values": prefs, "schema": PREFERENCE_SCHEMA}
+    if options["return_snippets"]:
+        result["evidence"] = evidence
+    result["personalized"] = {"conflicts": conflicts, "penalties": penalties}
+    if options["return_general"] and signals["overview"]:
+        result["overview"] = signals["overview"]   # puts the general evaluation in the JSON
+    return result
+
+
+def run_analysis(text: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+    """Full /analyze computation for an already-validated, stripped `text`."""
+    options = parse_options(payload)
+    session_id = payload.get("session_id")
+    signals = compute_signals(text, options, session_id=str(session_id) if session_id else None)
+    with memory.stage("personalize"):
+        result = personalize(signals, payload.get("preferences", default_preferences()), options)
+    key = text_hash(text)
+    trends.record(payload.get("url"), key, signals, result)
+    evidence_index.record(text, key, payload.get("url"), signals, options)
+    return result
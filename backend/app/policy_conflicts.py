@@ -1,45 +1,159 @@
 # app/policy_conflicts.py
-from typing import Dict, Any, List
-
-# Map preferences -> which categories & keywords/evidence to watch for
-PREF_TO_SIGNALS = {
-    "protect_location": {
-        "categories": ["Children/Minors + Sensitive Data", "Data Collection"],
-        "keywords": ["precise location", "geolocation", "gps", "location data"]
-    },
-    "opt_out_targeted_ads": {
-        "categories": ["User Control & Rights", "Third-Party Sharing/Selling"],
-        "keywords": ["behavioral advertising", "targeted ads", "adtech", "cross-site tracking"]
-    },
-    "no_sale_or_sharing": {
-        "categories": ["Third-Party Sharing/Selling"],
-        "keywords": ["sell", "sale", "data broker", "share with third"]
-    },
-    "limit_data_collection": {
-        "categories": ["Data Collection", "Purpose Limitation"],
-        "keywords": ["categories of information", "collect", "legitimate interests", "compatible further processing"]
-    },
-    "short_retention": {
-        "categories": ["Retention & Deletion"],
-        "keywords": ["retain indefinitely", "as long as necessary", "retention period"]
-    },
-    "restrict_cross_border": {
-        "categories": ["International Transfers & Jurisdiction"],
-        "keywords": ["international transfers", "cross-border", "standard contractual clauses", "adequacy decision"]
-    },
-    "strong_security": {
-        "categories": ["Security Practices"],
-        "keywords": ["encryption", "TLS", "access controls", "breach notification", "ISO 27001", "SOC 2"]
-    },
-    "child_privacy": {
-        "categories": ["Children/Minors + Sensitive Data"],
-        "keywords": ["coppa", "children", "minor", "biometric", "health data", "sensitive categories"]
-    },
-}
-
-def _text_contains_any(s: str, terms: List[str]) -> bool:
-    s_low = s.lower()
-    return any(t in s_low for t in terms)
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional
+from . import rules
+from .lexicon import Lexicon, labels_in
+
+# Preference -> categories lives in the rule set ("preferences" in
+# rules/default.json), the words to watch for in its lexicon; rules.RuleSet
+# compiles both into a ConflictEngine, swapped on reload.
+
+CONFLICT_PENALTY = -0.10   # gentle personalized penalty per conflicting preference
+LOW_SCORE_FALLBACK = 0.35  # a category scoring at or below this counts as a conflict
+TAG_CACHE_SIZE = 16384     # evidence lines whose preference tags an engine remembers
+
+
+class ConflictEngine:
+    """
+    A preference -> signals map compiled once. The preferences' words are
+    lexicon terms (lexicon.py): with the policy text at hand, an evidence
+    sentence's tags are read off the document's shared lexicon scan by
+    offsets; without it (cached evidence) the sentence alone is scanned.
+    Either way it's one token pass, however many preferences and keywords the
+    schema has.
+
+    Tags are kept in a side table keyed by the evidence line (offsets and
+    text), never on the evidence dicts themselves, which go out to clients;
+    repeated detection over the same evidence never rescans the text. The
+    table lives and dies with the engine, so a preferences reload starts
+    afresh. `version` is the rule version the engine was built from (see
+    pipeline.refresh_signals).
+    """
+
+    def __init__(self, pref_to_signals: Dict[str, Dict[str, Any]], lexicon: Optional[Lexicon] = None,
+                 cache_size: int = TAG_CACHE_SIZE):
+        self.signals = pref_to_signals
+        self.version = ""
+        self.lexicon = lexicon or Lexicon.from_lists(
+            "preferences", {key: spec["keywords"] for key, spec in pref_to_signals.items()})
+        self.cache_size = cache_size
+        self._tags: "OrderedDict[tuple, List[str]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(ev: Dict[str, Any]) -> tuple:
+        return ev.get("start"), ev.get("end"), ev.get("text", "")
+
+    def tags(self, ev: Dict[str, Any], hits=None) -> List[str]:
+        key = self._key(ev)
+        with self._lock:
+            tags = self._tags.get(key)
+            if tags is not None:
+                self._tags.move_to_end(key)
+                return tags
+        if hits is not None and "start" in ev and "end" in ev:
+            found = labels_in(hits, ev["start"], ev["end"])
+        else:
+            found = self.lexicon.labels(ev.get("text", ""), "preferences")
+        tags = sorted(found)
+        with self._lock:
+            self._tags[key] = tags
+            while len(self._tags) > self.cache_size:
+                self._tags.popitem(last=False)
+        return tags
+
+    def tag_evidence(self, evidence: Dict[str, List[Dict[str, Any]]], retag: bool = False,
+                     text: Optional[str] = None) -> None:
+        hits = self.lexicon.scan(text)["preferences"] if text is not None else None
+        for ev_list in (evidence or {}).values():
+            for ev in ev_list or []:
+                if retag:
+                    with self._lock:
+                        self._tags.pop(self._key(ev), None)
+                self.tags(ev, hits)
+
+    def _first_hits(self, evidence) -> Dict[tuple, Dict[str, Any]]:
+        """(pref_key, category) -> first evidence line in that category tagged with pref_key."""
+        first: Dict[tuple, Dict[str, Any]] = {}
+        for cat, ev_list in evidence.items():
+            for ev in ev_list or []:
+                for pref_key in self.tags(ev):
+                    first.setdefault((pref_key, cat), ev)
+        return first
+
+    def penalties(self, preferences: Dict[str, bool], evidence) -> Dict[str, float]:
+        """
+        Per-category score penalties from keyword conflicts. Needs only the
+        evidence, so it can feed compute_score before any scores exist.
+        """
+        first = self._first_hits(evidence)
+        penalties: Dict[str, float] = {}
+        for pref_key, enabled in preferences.items():
+            spec = self.signals.get(pref_key)
+            if not enabled or not spec:
+                continue
+            for cat in spec["categories"]:
+                if (pref_key, cat) in first:
+                    penalties[cat] = penalties.get(cat, 0.0) + CONFLICT_PENALTY
+                    break
+        return penalties
+
+    def detect(self, preferences, categories, evidence) -> List[Dict[str, Any]]:
+        first = self._first_hits(evidence)
+        conflicts = []
+        for pref_key, enabled in preferences.items():
+            spec = self.signals.get(pref_key)
+            if not enabled or not spec:
+                continue
+
+            matched_cat = None
+            matched_ev = None
+
+            # Scan categories & evidence for problematic signals
+            for cat in spec["categories"]:
+                # Prefer an evidence line that includes one of the keywords
+                hit = first.get((pref_key, cat))
+                if hit is not None:
+                    matched_cat, matched_ev = cat, hit
+                    break
+                # A fallback fired in the previous category: only this keyword check could override it
+                if matched_cat:
+                    break
+
+                # Fallback: if category score is notably low, consider it a potential conflict
+                ev_list = evidence.get(cat, []) or []
+                cat_score = (categories.get(cat) or {}).get("score", 1.0)
+                if cat_score <= LOW_SCORE_FALLBACK and ev_list:
+                    matched_cat, matched_ev = cat, ev_list[0]
+
+            if matched_cat:
+                conflicts.append({
+                    "preference": pref_key,
+                    "category": matched_cat,
+                    "message": _human_message(pref_key, matched_cat, matched_ev),
+                    "evidence": matched_ev
+                })
+        return conflicts
+
+
+def _engine() -> ConflictEngine:
+    return rules.current().conflicts
+
+
+def tag_evidence(evidence: Dict[str, List[Dict[str, Any]]], retag: bool = False,
+                 text: Optional[str] = None) -> None:
+    """
+    Work out (and remember, see ConflictEngine) the preferences each evidence
+    line touches; `retag` replaces old tags. Pass the policy `text` the evidence came from to reuse its scan.
+    """
+    _engine().tag_evidence(evidence, retag=retag, text=text)
+
+
+def conflict_penalties(preferences: Dict[str, bool], evidence: Dict[str, List[Dict[str, Any]]]) -> Dict[str, float]:
+    """Score penalties for keyword conflicts (see ConflictEngine.penalties)."""
+    return _engine().penalties(preferences, evidence or {})
+
 
 def detect_conflicts(
     preferences: Dict[str, bool],
@@ -52,46 +166,7 @@ def detect_conflicts(
     evidence: spacy evidence lines per category (as returned by spacy_extract_category_lines)
     Returns list of conflict dicts with helpful messages and pointers to evidence.
     """
-    conflicts = []
-    for pref_key, enabled in preferences.items():
-        if not enabled:
-            continue
-        spec = PREF_TO_SIGNALS.get(pref_key)
-        if not spec:
-            continue
-
-        hit_any = False
-        matched_cat = None
-        matched_ev = None
-
-        # Scan categories & evidence for problematic signals
-        for cat in spec["categories"]:
-            ev_list = evidence.get(cat, []) or []
-            # Prefer an evidence line that includes one of the keywords
-            for ev in ev_list:
-                if _text_contains_any(ev["text"], spec["keywords"]):
-                    hit_any = True
-                    matched_cat = cat
-                    matched_ev = ev
-                    break
-            if hit_any:
-                break
-
-            # Fallback: if category score is notably low, consider it a potential conflict
-            cat_score = (categories.get(cat) or {}).get("score", 1.0)
-            if cat_score <= 0.35 and ev_list:
-                hit_any = True
-                matched_cat = cat
-                matched_ev = ev_list[0]
-
-        if hit_any and matched_cat:
-            conflicts.append({
-                "preference": pref_key,
-                "category": matched_cat,
-                "message": _human_message(pref_key, matched_cat, matched_ev),
-                "evidence": matched_ev
-            })
-    return conflicts
+    return _engine().detect(preferences, categories or {}, evidence or {})
 
 def _human_message(pref_key: str, category: str, ev: Dict[str, Any]) -> str:
     # Friendly, demo-ready sentences
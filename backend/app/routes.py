@@ -1,23 +1,19 @@
 # app/routes.py
 from flask import Blueprint, request, jsonify
 from werkzeug.exceptions import BadRequest
-from . import config
-from .heuristics import detect_flags           # expects detect_flags(text) -> {category: {...}}
-from .summarizer_gemini import llm_summary     # expects llm_summary(text) -> {category: {"score": float, "reason": str}}
-from .scoring import compute_score             # expects compute_score(heur, llm) -> dict payload
-from .preferences import validate_preferences, default_preferences, PREFERENCE_SCHEMA
-from .policy_conflicts import detect_conflicts
-from .nlp_spacy import spacy_extract_category_lines, spacy_scores
-from .summarizer_gemini import llm_summary_categories, llm_general_eval
-from .scoring import compute_score
-from . import config
+from . import config, evidence_index, memory, metrics, jobs, shadow, trust_index, trends
+from .pipeline import run_analysis, parse_options, personalize, refresh_signals, result_etag, cached_signals
+from .hashing import text_hash
+from .preferences import default_preferences   # heuristics + Gemini + spaCy + scoring, see pipeline.py
 
 bp = Blueprint("api", __name__)
 
 MAX_TEXT_LEN = 120_000  # keep generous for whole-page mode
 
 from flask import current_app, jsonify
-import logging, traceback
+import logging, re, time, traceback
+
+_SHA256_HEX = re.compile(r"[0-9a-f]{64}")
 
 
 @bp.errorhandler(Exception)
@@ -50,8 +46,23 @@ def analyze():
         "return_snippets": true|false,    # optional, default true (spaCy evidence lines)
         "snippets_top_k": 3,              # optional, default 3
         "include_spacy_probs": true|false # optional, default true (blend spaCy probs)
+        "async": true|false               # optional, default false: 202 + job id, poll /jobs/<id>
+        "url": "https://..."              # optional; known sites are answered from the trust index
+        "session_id": "..."               # optional; heuristics rescan only what changed since
+                                          # this session's previous request (selection -> page)
+        "text_hash": "<sha256 hex>"       # instead of "text": hash-only probe, see below
       }
 
+    Every body comes with an ETag naming its inputs (text hash, rules and model
+    versions, preferences, options); send it back in If-None-Match to get 304
+    instead. A hash-only probe (SHA-256 hex of the whitespace-collapsed, trimmed
+    text in place of "text") is answered 304, 200 from the trust index or this
+    worker's recent results, or 404: then resend with the text.
+
+    Evidence "text", "start" and "end" refer to that same whitespace-collapsed,
+    trimmed text, not to the text as sent: requests differing only in
+    whitespace share one result.
+
     Response JSON schema (example):
       {
         "trust_score": 68.4,
@@ -79,82 +90,224 @@ def analyze():
         raise BadRequest("Content-Type must be application/json")
 
     payload = request.get_json(silent=True) or {}
-    return_general = bool(payload.get("return_general", True))
     text = (payload.get("text") or "").strip()
+    if not text and payload.get("text_hash"):
+        return _analyze_by_hash(payload)
     if not text:
         raise BadRequest("Field 'text' is required and must be non-empty.")
     if len(text) > MAX_TEXT_LEN:
         raise BadRequest(f"Text too long (>{MAX_TEXT_LEN} chars). Consider 'selection' mode.")
-    # --- Personalized preferences (optional) ---
-    ok, prefs = validate_preferences(payload.get("preferences", default_preferences()))
-
-    # Options
-    return_snippets = bool(payload.get("return_snippets", True))
-    snippets_top_k = int(payload.get("snippets_top_k", 3))
-    include_spacy_probs = bool(payload.get("include_spacy_probs", True))
-
-    # 1) Fast regex heuristics (deterministic flags/bonuses/penalties)
-    heur = detect_flags(text)  # expected per-category dict with at least {"delta": float, "flags": [...]}
-
-    # 2) Gemini semantic judgments (normalized category scores in [0,1] + short reasons)
-    llm = llm_summary(text)    # expected per-category: {"score": float, "reason": str}
-
-    llm_cats = llm_summary_categories(text)           # per-category {score, reason}
-    llm_overview = llm_general_eval(text) if return_general else None
-
-    # 3) spaCy signals
-    spacy_probs = {}
-    evidence = {}
-
-    if include_spacy_probs:
-        # Optional numeric per-category probabilities in [0,1] (used by scoring blend)
-        try:
-            from .nlp_spacy import spacy_scores
-            spacy_probs = spacy_scores(text) or {}
-        except Exception:
-            spacy_probs = {}
-
-    if return_snippets:
-        # Sentence-level evidence lines per category (top-K)
-        try:
-            from .nlp_spacy import spacy_extract_category_lines
-            evidence = spacy_extract_category_lines(text, top_k=snippets_top_k) or {}
-        except Exception:
-            evidence = {}
-    llm_cats = llm_summary_categories(text)           # per-category {score, reason}
-    llm_overview = llm_general_eval(text) if return_general else None
-    
-      # --- Detect conflicts with user preferences before scoring ---
-    conflicts = detect_conflicts(prefs, categories={}, evidence=evidence)
-    penalties = {}
-    for c in conflicts:
-        cat = c["category"]
-        penalties[cat] = penalties.get(cat, 0.0) - 0.10  # gentle personalized penalty
-
-
-    # 4) Combine with weights into a transparent Trust Score (blend LLM + heuristics + spaCy)
-    #    compute_score should gracefully handle missing spaCy by ignoring empty dicts.
-        # Compute with preference penalties
-    result = compute_score(
-        heuristics=heur,
-        llm=llm_cats,
-        spacy=spacy_probs,
-        preference_penalties=penalties
-    )
-
-    # Re-run conflict detection now that categories have scores
-    conflicts = detect_conflicts(prefs, categories=result["categories"], evidence=evidence)
-
-
-        # Attach personalized + transparency info
-    result["weights"] = config.CATEGORY_WEIGHTS
-    result["preferences"] = {"valid": ok, "values": prefs, "schema": PREFERENCE_SCHEMA}
-    if return_snippets:
-        result["evidence"] = evidence
-    result["personalized"] = {"conflicts": conflicts, "penalties": penalties}
-    if return_general and llm_overview:
-        result["overview"] = llm_overview   # puts the general evaluation in the JSON
-    return jsonify(result), 200
+
+    etag = result_etag(text_hash(text), payload)
+    if request.if_none_match.contains_weak(etag):
+        return _not_modified(etag)
+
+    # Well-known policy we have already analyzed offline: skip the live pipeline
+    indexed = _from_index(payload.get("url"), text, payload, etag)
+    if indexed is not None:
+        return indexed
+
+    if payload.get("async"):
+        job_id, created = jobs.submit(text, payload)
+        body = {"job_id": job_id, "status": "queued" if created else "deduplicated", "poll": f"/jobs/{job_id}"}
+        # The tag of the body the job will produce, for the client to keep with it
+        return jsonify(body), 202, {"Location": f"/jobs/{job_id}", "ETag": f'"{etag}"'}
+
+    # Heuristics, Gemini and spaCy run once per distinct text even when many
+    # clients submit it at the same time; preferences are applied per request.
+    with memory.stage("request"):
+        result = run_analysis(text, payload)
+        with memory.stage("response"):
+            body = jsonify(result)
+    # A sampled request is re-run through the candidate pipeline once it is answered
+    shadow_run = shadow.sample(text, payload, result)
+    if shadow_run is not None:
+        body.call_on_close(shadow_run)
+    return body, 200, {"ETag": f'"{etag}"'}
+
+
+def _not_modified(etag):
+    metrics.incr("analyze.not_modified")
+    return "", 304, {"ETag": f'"{etag}"'}
+
+
+def _analyze_by_hash(payload):
+    digest = str(payload.get("text_hash")).lower()
+    if not _SHA256_HEX.fullmatch(digest):
+        raise BadRequest("Field 'text_hash' must be the hex SHA-256 of the whitespace-normalized text.")
+    etag = result_etag(digest, payload)
+    if request.if_none_match.contains_weak(etag):
+        return _not_modified(etag)
+
+    indexed = _from_index(payload.get("url"), bytes.fromhex(digest)[:16], payload, etag)
+    if indexed is not None:
+        return indexed
+    options = parse_options(payload)
+    signals = cached_signals(digest, options)
+    if signals is None:
+        metrics.incr("analyze.hash_miss")
+        return jsonify({"error": "not_found", "message": "Unknown text hash; send the text."}), 404
+    metrics.incr("analyze.hash_hit")
+    result = personalize(signals, payload.get("preferences", default_preferences()), options)
+    trends.record(payload.get("url"), digest, signals, result)
+    return jsonify(result), 200, {"ETag": f'"{etag}"', "X-PrivaSee-Source": "cache"}
+
+
+def _from_index(url, text_or_digest, payload, etag=None):
+    if not url or not getattr(config, "TRUST_INDEX_PATH", None):
+        return None
+    options = parse_options(payload)
+    if isinstance(text_or_digest, bytes):
+        signals = trust_index.lookup_hash(url, text_or_digest, options)
+    else:
+        signals = trust_index.lookup(url, text_or_digest, options)
+    if signals is not None:
+        # Built under older rules: redo the stale parts (impossible without the text)
+        text = None if isinstance(text_or_digest, bytes) else text_or_digest
+        signals = refresh_signals(signals, text, options)
+    if signals is None:
+        return None
+    result = personalize(signals, payload.get("preferences", default_preferences()), options)
+    key = text_or_digest.hex() if isinstance(text_or_digest, bytes) else text_hash(text_or_digest)
+    trends.record(url, key, signals, result, source="index")
+    evidence_index.record(text, key, url, signals, options)
+    headers = {"X-PrivaSee-Source": "index"}
+    if etag:
+        headers["ETag"] = f'"{etag}"'
+    return jsonify(result), 200, headers
+
+
+@bp.route("/lookup", methods=["POST"])
+def lookup():
+    """
+    Index-only probe: {"url": "...", "text": "..."} or {"url": "...", "text_hash": "<sha256 hex>"}
+    plus the usual /analyze options. 200 with the /analyze body on a hit, 404 otherwise.
+    """
+    if not request.is_json:
+        raise BadRequest("Content-Type must be application/json")
+    payload = request.get_json(silent=True) or {}
+    if not payload.get("url"):
+        raise BadRequest("Field 'url' is required.")
+    key = (payload.get("text") or "").strip()
+    if not key:
+        digest = payload.get("text_hash")
+        if not isinstance(digest, str) or not _SHA256_HEX.fullmatch(digest.lower()):
+            raise BadRequest("Provide 'text' or a hex 'text_hash' (SHA-256 of the whitespace-normalized text).")
+        key = bytes.fromhex(digest)[:16]
+    hit = _from_index(payload["url"], key, payload)
+    if hit is None:
+        return jsonify({"error": "not_found", "message": "Not in the trust index; use /analyze."}), 404
+    return hit
+
+
+@bp.route("/jobs/<job_id>", methods=["GET"])
+def job_status(job_id):
+    """
+    Poll an async analysis. ?wait=<seconds> long-polls until the job finishes
+    (capped at JOBS_MAX_WAIT). 202 while queued/running, 200 once done/failed.
+    """
+    try:
+        wait = min(float(request.args.get("wait", 0)), config.JOBS_MAX_WAIT)
+    except ValueError:
+        raise BadRequest("Query parameter 'wait' must be a number of seconds.")
+    job = jobs.wait_for(job_id, wait)
+    if job is None:
+        return jsonify({"error": "not_found", "message": f"Unknown job '{job_id}'."}), 404
+
+    body = {"job_id": job["id"], "status": job["status"], "attempts": job["attempts"]}
+    if job["status"] == "done":
+        body["result"] = job["result"]
+    elif job["error"]:
+        body["error"] = job["error"]
+    return jsonify(body), 202 if job["status"] in jobs.PENDING else 200
+
+
+def _trends_args():
+    if not getattr(config, "TRENDS_PATH", None):
+        return None, (jsonify({"error": "not_found", "message": "Trend store is not enabled (TRENDS_PATH)."}), 404)
+    if trends.duckdb is None:
+        return None, (jsonify({"error": "unavailable", "message": "Trend queries need duckdb installed."}), 503)
+    args = {k: request.args.get(k) for k in ("since", "until")}
+    args["bucket"] = request.args.get("bucket", "month")
+    return args, None
+
+
+@bp.route("/trends/domains/<domain>", methods=["GET"])
+def trends_domain(domain):
+    """
+    Trust Score history of one site: ?bucket=day|week|month|quarter|year (default month),
+    optional ?since= / ?until= (ISO dates). Scores exclude per-user preference penalties.
+    """
+    args, err = _trends_args()
+    if err:
+        return err
+    t0 = time.perf_counter()
+    try:
+        periods = trends.domain_history(config.data_path(config.TRENDS_PATH), domain, **args)
+    except ValueError as e:
+        raise BadRequest(str(e))
+    return jsonify({"domain": trends.site(domain), "bucket": args["bucket"], "periods": periods,
+                    "took_ms": round((time.perf_counter() - t0) * 1e3, 1)}), 200
+
+
+@bp.route("/trends/flags", methods=["GET"])
+def trends_flags():
+    """
+    Heuristic flag frequency per period across all sites (or ?domain=), top ?limit= (default 20)
+    patterns per period, with the same ?bucket= / ?since= / ?until= as /trends/domains.
+    """
+    args, err = _trends_args()
+    if err:
+        return err
+    t0 = time.perf_counter()
+    try:
+        limit = int(request.args.get("limit", 20))
+        rows = trends.flag_frequency(config.data_path(config.TRENDS_PATH), domain=request.args.get("domain"), limit=limit, **args)
+    except ValueError as e:
+        raise BadRequest(str(e))
+    return jsonify({"bucket": args["bucket"], "flags": rows,
+                    "took_ms": round((time.perf_counter() - t0) * 1e3, 1)}), 200
+
+
+@bp.route("/search", methods=["GET"])
+def search():
+    """
+    Full-text search over indexed evidence sentences:
+      ?q=          words, "phrases", prefix*, AND / OR / NOT, ( ) (required)
+      ?scope=      sentence (default: all terms in one sentence) | policy (anywhere in one policy)
+      ?category=   repeatable; ?min_score= / ?max_score= (evidence rows only);
+      ?kind=       evidence | heuristic; ?domain=; ?limit= (<= 100); ?offset=
+      ?order=      recent (default, newest policies first) | relevance (bm25)
+    """
+    index = evidence_index.get_index()
+    if index is None:
+        return jsonify({"error": "not_found", "message": "Evidence index is not enabled (EVIDENCE_INDEX_PATH)."}), 404
+    q = request.args.get("q", "")
+    if not q.strip():
+        raise BadRequest("Query parameter 'q' is required.")
+    t0 = time.perf_counter()
+    try:
+        out = index.search(
+            q,
+            scope=request.args.get("scope", "sentence"),
+            categories=request.args.getlist("category") or None,
+            min_score=request.args.get("min_score", type=float),
+            max_score=request.args.get("max_score", type=float),
+            kind=request.args.get("kind"),
+            domain=request.args.get("domain"),
+            order=request.args.get("order", "recent"),
+            limit=request.args.get("limit", 20, type=int),
+            offset=request.args.get("offset", 0, type=int),
+        )
+    except evidence_index.QueryError as e:
+        raise BadRequest(f"Bad query: {e}")
+    out["took_ms"] = round((time.perf_counter() - t0) * 1e3, 1)
+    return jsonify(out), 200
+
+
+@bp.route("/metrics", methods=["GET"])
+def metrics_view():
+    return jsonify(metrics.snapshot()), 200
 
 
 # Optional: lightweight error mappers for cleaner client messages
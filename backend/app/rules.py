@@ -0,0 +1,240 @@
+# app/rules.py
+"""
+Versioned, hot-reloadable rule sets.
+
+The tunable rules live in a JSON data file (default: rules/default.json):
+
+  weights       category -> weight in the Trust Score (the category set itself
+                is fixed by config.CATEGORY_WEIGHTS)
+  lexicon       literal terms -> the heuristic patterns, matcher labels and
+                preferences they feed, scanned once per text (lexicon.py)
+  heuristics    patterns with category, delta, flag text; fed by lexicon terms
+                and/or a regex for the structural ones (heuristics.py)
+  matcher       spaCy token patterns and label -> categories
+                (nlp_spacy.py, vector_evidence.py)
+  preferences   preference -> categories (policy_conflicts.py)
+
+Every section gets its own version (a hash of its canonical JSON, including
+the lexicon terms that feed it), so a cached result can tell exactly which of
+its parts an edit made stale; see pipeline.refresh_signals.
+
+Older files that still list matcher "phrases" or preference "keywords" load
+with those folded into the lexicon.
+
+Reloading: a background thread stats RULES_PATH every RULES_CHECK_SECONDS. A
+changed file is loaded, validated and compiled in that thread (regexes,
+lexicon automaton, plus any compile hooks such as the spaCy matchers), then
+swapped in with a single reference assignment. Requests always see one
+complete rule set; a file that fails to load leaves the current one in place
+(counter rules.reload_errors).
+"""
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from . import config, metrics
+from .lexicon import Lexicon
+
+SECTIONS = ("weights", "heuristics", "matcher", "preferences")
+LEXICON_FED = ("heuristics", "matcher", "preferences")   # sections that take lexicon terms
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "rules", "default.json")
+
+_FLAGS = {"i": re.IGNORECASE, "m": re.MULTILINE, "s": re.DOTALL, "x": re.VERBOSE}
+
+
+def _section_version(data: Any) -> str:
+    canonical = json.dumps(data, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()[:12]
+
+
+def _compile_regex(key: str, spec: Dict[str, Any]) -> "re.Pattern":
+    flags = 0
+    for ch in spec.get("flags", "im"):
+        if ch not in _FLAGS:
+            raise ValueError(f"heuristics.{key}: unknown regex flag {ch!r}")
+        flags |= _FLAGS[ch]
+    return re.compile(spec["regex"], flags)
+
+
+class RuleSet:
+    """One loaded rule file, validated and compiled; treat as immutable."""
+
+    def __init__(self, data: Dict[str, Any], source: str = "<memory>"):
+        missing = [s for s in SECTIONS if s not in data]
+        if missing:
+            raise ValueError(f"{source}: missing sections {missing}")
+        categories = list(config.CATEGORY_WEIGHTS.keys())
+
+        self.source = source
+        self.name = data.get("name", os.path.basename(source))
+        self.lexicon = Lexicon(_lexicon_entries(data))
+        self.versions: Dict[str, str] = {s: _section_version(data[s]) for s in SECTIONS}
+        for s in LEXICON_FED:
+            self.versions[s] = _section_version([data[s], self.lexicon.terms(s)])
+        self.version = _section_version(self.versions)
+
+        weights = {cat: float(w) for cat, w in data["weights"].items()}
+        if sorted(weights) != sorted(categories):
+            raise ValueError(f"{source}: weights must cover exactly {categories}")
+        self.weights = {cat: weights[cat] for cat in categories}
+
+        # "regex" is None for patterns fed by lexicon terms alone
+        lexicon_keys = set(self.lexicon.terms("heuristics"))
+        self.patterns: Dict[str, Dict[str, Any]] = {}
+        for key, spec in data["heuristics"].items():
+            if spec.get("cat") not in categories:
+                raise ValueError(f"{source}: heuristics.{key} has unknown category {spec.get('cat')!r}")
+            if "regex" not in spec and key not in lexicon_keys:
+                raise ValueError(f"{source}: heuristics.{key} has neither a regex nor lexicon terms")
+            regex = _compile_regex(key, spec) if "regex" in spec else None
+            self.patterns[key] = dict(spec, regex=regex, delta=float(spec["delta"]))
+
+        matcher = data["matcher"]
+        self.phrases: Dict[str, List[str]] = self.lexicon.terms("matcher")
+        self.token_patterns: Dict[str, List[List[Dict[str, Any]]]] = matcher.get("token_patterns", {})
+        self.pattern_categories: Dict[str, List[str]] = matcher.get("categories", {})
+        for label, cats in self.pattern_categories.items():
+            unknown = [c for c in cats if c not in categories]
+            if unknown:
+                raise ValueError(f"{source}: matcher.categories.{label} has unknown categories {unknown}")
+
+        # "keywords" here is derived from the lexicon, for reference and benches
+        keywords = self.lexicon.terms("preferences")
+        self.preferences: Dict[str, Dict[str, Any]] = {}
+        for key, spec in data["preferences"].items():
+            if not isinstance(spec.get("categories"), list):
+                raise ValueError(f"{source}: preferences.{key} needs a \"categories\" list")
+            self.preferences[key] = dict(spec, keywords=keywords.get(key, []))
+
+        targets = {"heuristics": self.patterns, "matcher": self.pattern_categories, "preferences": self.preferences}
+        for kind, labels in targets.items():
+            unknown = sorted(set(self.lexicon.terms(kind)) - set(labels))
+            if unknown:
+                raise ValueError(f"{source}: lexicon terms feed unknown {kind} {unknown}")
+
+        from .policy_conflicts import ConflictEngine
+        self.conflicts = ConflictEngine(self.preferences, lexicon=self.lexicon)
+        self.conflicts.version = self.versions["preferences"]
+
+
+def _lexicon_entries(data: Dict[str, Any]) -> Dict[str, Dict[str, List[str]]]:
+    """The lexicon section, plus any legacy matcher phrases / preference keywords folded in."""
+    entries = {term: {kind: list(labels) for kind, labels in targets.items()}
+               for term, targets in (data.get("lexicon") or {}).items()}
+    legacy = [("matcher", (data["matcher"].get("phrases") or {}).items()),
+              ("preferences", ((k, spec.get("keywords") or []) for k, spec in data["preferences"].items()))]
+    for kind, lists in legacy:
+        for label, terms in lists:
+            for term in terms:
+                labels = entries.setdefault(term.lower(), {}).setdefault(kind, [])
+                if label not in labels:
+                    labels.append(label)
+    return entries
+
+
+def load(path: str) -> RuleSet:
+    with open(path, "r", encoding="utf-8") as fh:
+        rs = RuleSet(json.load(fh), source=path)
+    for hook in list(_hooks):
+        hook(rs)
+    return rs
+
+
+# ---------------------------
+# Compile hooks: extra per-rule-set compilation (e.g. spaCy matchers) that
+# should happen in the reload thread, before the swap, not in a request.
+# ---------------------------
+_hooks: List[Callable[[RuleSet], None]] = []
+
+
+def on_load(hook: Callable[[RuleSet], None]) -> None:
+    """Run `hook(ruleset)` for every rule set loaded from now on (and the current one)."""
+    _hooks.append(hook)
+    if _current is not None:
+        hook(_current)
+
+
+# ---------------------------
+# Serving: the process-wide current rule set
+# ---------------------------
+_current: Optional[RuleSet] = None
+_current_stat: Optional[Tuple[int, int, int]] = None
+_init_lock = threading.Lock()
+_watcher: Optional[threading.Thread] = None
+
+
+def _path() -> str:
+    return getattr(config, "RULES_PATH", None) or DEFAULT_PATH
+
+
+def _stat(path: str) -> Optional[Tuple[int, int, int]]:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+
+def reload(force: bool = False) -> bool:
+    """Load the rule file if it changed (or `force`); returns True when a new set was swapped in."""
+    global _current, _current_stat
+    path = _path()
+    stat = _stat(path)
+    if stat is None or (stat == _current_stat and not force and _current is not None):
+        return False
+    try:
+        rs = load(path)
+    except (OSError, ValueError, KeyError, TypeError, re.error) as e:
+        metrics.incr("rules.reload_errors")
+        if _current is None:
+            raise
+        logging.warning("rules: keeping %s@%s, %s failed to load: %s", _current.name, _current.version, path, e)
+        _current_stat = stat   # don't retry a broken file until it changes again
+        return False
+    _current, _current_stat = rs, stat
+    metrics.incr("rules.reloads")
+    return True
+
+
+def _watch() -> None:
+    while True:
+        time.sleep(max(0.5, float(getattr(config, "RULES_CHECK_SECONDS", 5.0))))
+        try:
+            reload()
+        except Exception:   # keep watching whatever happens
+            logging.exception("rules reload failed")
+
+
+_override = threading.local()
+
+
+@contextmanager
+def using(ruleset: RuleSet):
+    """current() returns `ruleset` on this thread only, inside the block (shadow evaluation)."""
+    saved = getattr(_override, "ruleset", None)
+    _override.ruleset = ruleset
+    try:
+        yield ruleset
+    finally:
+        _override.ruleset = saved
+
+
+def current() -> RuleSet:
+    """The rule set in effect; the first call loads it and starts the reload watcher."""
+    global _watcher
+    rs = getattr(_override, "ruleset", None) or _current
+    if rs is not None:
+        return rs
+    with _init_lock:
+        if _current is None:
+            reload(force=True)
+        if _watcher is None and getattr(config, "RULES_CHECK_SECONDS", 5.0):
+            _watcher = threading.Thread(target=_watch, name="rules-watcher", daemon=True)
+            _watcher.start()
+    return _current
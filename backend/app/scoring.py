@@ -21,6 +21,8 @@ Inputs (expected shapes):
     ...
   }
 
+- routing: optional cascade record {"path": "skip"|"partial"|"full"|"escalated", ...}
+
 Output:
 {
   "trust_score": float (0..100),
@@ -37,8 +39,11 @@ Output:
 }
 """
 
-from typing import Dict, Any
-from .config import CATEGORY_WEIGHTS
+from typing import Dict, Any, List, Tuple
+
+import numpy as np
+
+from . import rules
 
 # ---- Blend weights among sources (tune as needed) ----
 # LLM carries most signal; heuristics nudge; spaCy adds corroboration
@@ -50,6 +55,7 @@ GAMMA_SPACY = 0.30   # spaCy per-category probability
 RISK_HIGH_MAX   = 39.0   # 0–39 = High
 RISK_MEDIUM_MAX = 69.0   # 40–69 = Medium
 # 70–100 = Low
+RISK_LEVELS = ("High", "Medium", "Low")   # codes 0/1/2 in compute_scores_bulk
 
 
 def _clamp01(x: float) -> float:
@@ -107,17 +113,23 @@ def compute_score(
     heuristics: Dict[str, Dict[str, Any]],
     llm: Dict[str, Dict[str, Any]],
     spacy: Dict[str, float] = None,
-    preference_penalties: Dict[str, float] = None
+    preference_penalties: Dict[str, float] = None,
+    routing: Dict[str, Any] = None,
+    weights: Dict[str, float] = None
 ) -> Dict[str, Any]:
     """
     Blend LLM + heuristics + spaCy + personalized penalties into:
       - per-category scores in [0,1]
       - overall Trust Score (0..100)
       - risk level badge
+    routing: optional LLM cascade record (see cascade.py), echoed as "routing"
+    so clients can tell which categories Gemini actually scored.
+    weights: category weights; defaults to the current rule set's (rules.py).
     """
+    weights = weights or rules.current().weights
     per_cat: Dict[str, Dict[str, Any]] = {}
-    # Ensure deterministic ordering based on CATEGORY_WEIGHTS
-    for cat, weight in CATEGORY_WEIGHTS.items():
+    # Ensure deterministic ordering based on the category weights
+    for cat, weight in weights.items():
         llm_for_cat  = (llm or {}).get(cat) or {}
         heur_for_cat = (heuristics or {}).get(cat) or {}
 
@@ -163,12 +175,55 @@ def compute_score(
 
     # Weighted sum → 0..100
     trust_score = 0.0
-    for cat, weight in CATEGORY_WEIGHTS.items():
+    for cat, weight in weights.items():
         trust_score += 100.0 * float(weight) * float(per_cat[cat]["score"])
     trust_score = round(trust_score, 1)
 
-    return {
+    out = {
         "trust_score": trust_score,
         "risk_level": _risk_label(trust_score),
         "categories": per_cat
     }
+    if routing:
+        out["routing"] = routing
+    return out
+
+
+def compute_scores_bulk(
+    llm: np.ndarray,
+    delta: np.ndarray,
+    spacy: np.ndarray,
+    weights: List[float],
+    alpha: float = ALPHA_LLM,
+    beta: float = BETA_REGEX,
+    gamma: float = GAMMA_SPACY,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    compute_score for many policies at once, without preference penalties.
+    llm / delta / spacy are (n_policies, n_categories) arrays in weight order;
+    NaN in spacy means "no spaCy prob" (its term is dropped, as in compute_score).
+    Returns (trust scores rounded to 0.1, risk codes into RISK_LEVELS), equal
+    to compute_score's; keep the two in step.
+    """
+    llm = np.clip(np.asarray(llm, dtype=np.float64), 0.0, 1.0)
+    delta = np.asarray(delta, dtype=np.float64)
+    spacy = np.asarray(spacy, dtype=np.float64)
+
+    blended = alpha * llm + beta * np.clip(llm + delta, 0.0, 1.0)
+    blended += np.where(np.isnan(spacy), 0.0, gamma * np.clip(np.nan_to_num(spacy), 0.0, 1.0))
+    per_cat = np.clip(blended, 0.0, 1.0)
+
+    # Summed column by column in compute_score's order (not a matmul), so the
+    # rounding to 0.1 lands on exactly the same value
+    trust = np.zeros(per_cat.shape[0])
+    for j, weight in enumerate(weights):
+        trust += 100.0 * float(weight) * per_cat[:, j]
+    # np.round scales by 10 before rounding, round() works on the exact value;
+    # they can only disagree next to a .x5 tie, so those few go through round()
+    tenths = trust * 10.0
+    ties = np.flatnonzero(np.abs(tenths - np.floor(tenths) - 0.5) < 1e-6)
+    rounded = np.round(trust, 1)
+    rounded[ties] = [round(float(x), 1) for x in trust[ties]]
+    trust = rounded
+    risk = np.where(trust <= RISK_HIGH_MAX, 0, np.where(trust <= RISK_MEDIUM_MAX, 1, 2)).astype(np.int8)
+    return trust, risk
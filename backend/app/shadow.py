@@ -0,0 +1,229 @@
+# app/shadow.py
+"""
+Shadow evaluation: try a candidate rule file, spaCy model or Gemini model on
+live traffic without changing what clients get or how fast they get it.
+
+A SHADOW_SAMPLE_RATE fraction of the /analyze requests computed live (not
+the index, hash probe, 304 or async paths) is re-run through the candidate
+pipeline once its response has been sent, on SHADOW_WORKERS background
+threads:
+
+  heuristics   detect_flags under the SHADOW_RULES_PATH rule set
+  spaCy        probs + evidence under that rule set and the SHADOW_SPACY_MODEL_DIR model
+  Gemini       production's category scores, reused; SHADOW_GEMINI_MODEL names a
+               model to call instead (real, billed calls: keep the rate low)
+  scoring      personalize() with the candidate's weights and preferences
+
+Unset candidates fall back to production's, so with none set the shadow
+checks itself (expect zero divergence). Production's signals come from the
+signals LRU (pipeline.cached_signals); a request whose entry is already gone
+is not shadowed.
+
+Every comparison is logged to the "privasee.shadow" logger as one JSON object
+(WARNING when the risk band differs, INFO otherwise) and appended to
+SHADOW_LOG_PATH when set: trust score and risk band on both sides, category
+scores that moved by at least SHADOW_LOG_MIN_DELTA, and per-stage wall times
+(production's from memory.stage). /metrics gets shadow.sampled, .completed,
+.dropped, .errors, .risk_changes, .trust_delta_sum (absolute; divide by
+.completed), .trust_delta_max and .cpu_seconds.
+
+CPU budget: shadow threads run at the lowest OS priority (Linux), parse
+inline rather than in the serving spaCy pool, and after each job sleep until
+their CPU time is at most SHADOW_CPU_BUDGET of the wall time since the job
+started. Shadow work is Python on the serving process, so that also bounds
+its share of the GIL. Serving threads do no more than a random() draw and,
+for a sampled request, an LRU lookup plus a non-blocking put; a job that
+finds the queue (SHADOW_QUEUE_MAX) full is dropped.
+"""
+import json
+import logging
+import os
+import queue
+import random
+import threading
+import time
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from . import config, memory, metrics, pipeline, rules
+from .hashing import text_hash
+from .preferences import default_preferences
+
+_log = logging.getLogger("privasee.shadow")
+
+
+# ---------------------------
+# Candidate rule set
+# ---------------------------
+_rules_lock = threading.Lock()
+_rules_cache: Tuple[Any, Optional[rules.RuleSet]] = (None, None)   # ((path, mtime, size), RuleSet)
+
+
+def candidate_rules() -> rules.RuleSet:
+    """The SHADOW_RULES_PATH rule set, reloaded when the file changes; production's if unset."""
+    global _rules_cache
+    path = getattr(config, "SHADOW_RULES_PATH", None)
+    if not path:
+        return rules.current()
+    st = os.stat(path)
+    key = (path, st.st_mtime_ns, st.st_size)
+    with _rules_lock:
+        if _rules_cache[0] != key:
+            # Not rules.load(): its compile hooks would rebuild production's matchers
+            with open(path, "r", encoding="utf-8") as fh:
+                _rules_cache = (key, rules.RuleSet(json.load(fh), source=path))
+        return _rules_cache[1]
+
+
+# ---------------------------
+# One comparison
+# ---------------------------
+def evaluate(text: str, payload: Dict[str, Any], signals: Dict[str, Any],
+             result: Dict[str, Any], timings: Dict[str, float]) -> Dict[str, Any]:
+    """Run `text` through the candidate pipeline; the comparison record to log."""
+    from .nlp_spacy import candidate
+    from .summarizer_gemini import llm_summary_categories
+
+    options = pipeline.parse_options(payload)
+    ruleset = candidate_rules()
+    model = getattr(config, "SHADOW_GEMINI_MODEL", None)
+    mine: Dict[str, float] = {}
+    with rules.using(ruleset), candidate(getattr(config, "SHADOW_SPACY_MODEL_DIR", None)):
+        t = time.perf_counter()
+        heuristics = pipeline._heuristics(text)
+        mine["heuristics"] = time.perf_counter() - t
+
+        t = time.perf_counter()
+        spacy_probs, evidence = pipeline._nlp_signals(text, options)
+        mine["spacy"] = time.perf_counter() - t
+
+        llm = signals["llm"]
+        if model:
+            t = time.perf_counter()
+            llm = llm_summary_categories(text, model=model)
+            mine["llm"] = time.perf_counter() - t
+
+        t = time.perf_counter()
+        shadow = pipeline.personalize(dict(signals, heuristics=heuristics, spacy=spacy_probs, evidence=evidence,
+                                           llm=llm),
+                                      payload.get("preferences", default_preferences()), options)
+        mine["personalize"] = time.perf_counter() - t
+
+    min_delta = float(getattr(config, "SHADOW_LOG_MIN_DELTA", 0.05))
+    moved = {cat: [round(c["score"], 4), round(shadow["categories"][cat]["score"], 4)]
+             for cat, c in result["categories"].items()
+             if abs(shadow["categories"][cat]["score"] - c["score"]) >= min_delta}
+    return {
+        "ts": round(time.time(), 3),
+        "text_hash": text_hash(text)[:16],
+        "url": payload.get("url"),
+        "chars": len(text),
+        "candidate": {"rules": f"{ruleset.name}@{ruleset.version}",
+                      "spacy_model": getattr(config, "SHADOW_SPACY_MODEL_DIR", None),
+                      "gemini_model": model},
+        "trust_score": [result["trust_score"], shadow["trust_score"]],
+        "risk_level": [result["risk_level"], shadow["risk_level"]],
+        "categories": moved,
+        "stage_ms": {stage: [round(timings[stage] * 1e3, 1) if stage in timings else None, round(took * 1e3, 1)]
+                     for stage, took in mine.items()},
+    }
+
+
+def report(record: Dict[str, Any]) -> None:
+    delta = abs(record["trust_score"][1] - record["trust_score"][0])
+    band_changed = record["risk_level"][0] != record["risk_level"][1]
+    metrics.incr("shadow.completed")
+    metrics.incr("shadow.trust_delta_sum", delta)
+    if delta > metrics.get("shadow.trust_delta_max"):
+        metrics.set_value("shadow.trust_delta_max", delta)
+    if band_changed:
+        metrics.incr("shadow.risk_changes")
+    line = json.dumps(record, sort_keys=True)
+    _log.log(logging.WARNING if band_changed else logging.INFO, line)
+    path = config.data_path(getattr(config, "SHADOW_LOG_PATH", None))
+    if path:
+        with open(path, "a", encoding="utf-8") as fh:
+            fh.write(line + "\n")
+
+
+# ---------------------------
+# Background workers
+# ---------------------------
+def _lowest_priority() -> None:
+    try:   # Linux: a thread id is a valid PRIO_PROCESS target and affects that thread only
+        os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), 19)
+    except (AttributeError, OSError):
+        pass
+
+
+class ShadowRunner:
+    """Bounded queue of sampled requests and the paced threads that evaluate them."""
+
+    def __init__(self, workers: int, queue_max: int, cpu_budget: float):
+        self.workers = max(1, workers)
+        self.cpu_budget = min(1.0, max(0.01, cpu_budget))
+        self._queue: "queue.Queue[tuple]" = queue.Queue(maxsize=max(1, queue_max))
+        self._lock = threading.Lock()
+        self._threads = []
+
+    def submit(self, job: tuple) -> bool:
+        """Queue a job without ever blocking; False (and shadow.dropped) when the queue is full."""
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            metrics.incr("shadow.dropped")
+            return False
+        if len(self._threads) < self.workers:
+            with self._lock:
+                while len(self._threads) < self.workers:
+                    t = threading.Thread(target=self._loop, name=f"privasee-shadow-{len(self._threads)}", daemon=True)
+                    t.start()
+                    self._threads.append(t)
+        return True
+
+    def _loop(self) -> None:
+        _lowest_priority()
+        while True:
+            job = self._queue.get()
+            wall, cpu = time.perf_counter(), time.thread_time()
+            try:
+                report(evaluate(*job))
+            except Exception:
+                logging.exception("shadow evaluation failed")
+                metrics.incr("shadow.errors")
+            used = time.thread_time() - cpu
+            metrics.incr("shadow.cpu_seconds", used)
+            # Rest until this job's CPU time is cpu_budget of the wall time it took
+            rest = used / self.cpu_budget - (time.perf_counter() - wall)
+            if rest > 0:
+                time.sleep(rest)
+
+
+_runner: Optional[ShadowRunner] = None
+_runner_lock = threading.Lock()
+
+
+def _get_runner() -> ShadowRunner:
+    global _runner
+    if _runner is None:
+        with _runner_lock:
+            if _runner is None:
+                _runner = ShadowRunner(int(getattr(config, "SHADOW_WORKERS", 1)),
+                                       int(getattr(config, "SHADOW_QUEUE_MAX", 16)),
+                                       float(getattr(config, "SHADOW_CPU_BUDGET", 0.10)))
+    return _runner
+
+
+def sample(text: str, payload: Dict[str, Any], result: Dict[str, Any]) -> Optional[Callable[[], None]]:
+    """
+    For a request picked by SHADOW_SAMPLE_RATE, the callable that queues its
+    shadow run (call it once the response is sent); None for all others.
+    """
+    rate = float(getattr(config, "SHADOW_SAMPLE_RATE", 0.0) or 0.0)
+    if rate <= 0 or random.random() >= rate:
+        return None
+    signals = pipeline.cached_signals(text_hash(text), pipeline.parse_options(payload))
+    if signals is None:
+        return None
+    metrics.incr("shadow.sampled")
+    job = (text, payload, signals, result, memory.last_timings())
+    return lambda: _get_runner().submit(job)
@@ -0,0 +1,335 @@
+# app/signal_store.py
+"""
+Columnar store of the raw per-category signals behind every analyzed policy,
+so trust scores can be recomputed in bulk when weights or the blend change,
+with no model calls.
+
+Layout: a directory of immutable chunk files (chunk-<time>-<pid>-<n>.npz),
+each holding, for its rows:
+
+  key      S32      normalized text hash (hashing.text_hash), first 128 bits
+                    as in the trust index
+  llm      f8[n,C]  Gemini category score
+  delta    f8[n,C]  heuristic delta
+  spacy    f8[n,C]  spaCy probability, NaN when not computed
+  trust    f8[n]    Trust Score as last computed (no preference penalties)
+  risk     i1[n]    risk band code (scoring.RISK_LEVELS)
+  at       f8[n]    time the signals were recorded
+
+with columns in config.CATEGORY_WEIGHTS order. The newest row per key wins.
+
+Writing: with SIGNAL_STORE_PATH set, every freshly computed signal set (not
+cache or index hits) is queued per process and written by a background thread
+(write_behind.py) as a new chunk every SIGNAL_STORE_FLUSH_ROWS rows or
+SIGNAL_STORE_FLUSH_SECONDS, and at exit. Chunks are written to a temp file
+and os.replace()d, so readers never see a partial chunk.
+
+Rescoring:
+  python -m backend.app.signal_store stats STORE
+  python -m backend.app.signal_store rescore STORE --dry-run [--weights w.json] [--alpha .5 --beta .2 --gamma .3]
+  python -m backend.app.signal_store rescore STORE [...]      # rewrites trust/risk in place
+  python -m backend.app.signal_store import-index trust_index.bin STORE
+
+Stored scores carry no preference penalties (those are per user), so a
+rescore moves the shared baseline; personalized responses follow from it.
+"""
+import glob
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from . import config
+from .scoring import ALPHA_LLM, BETA_REGEX, GAMMA_SPACY, RISK_LEVELS, compute_scores_bulk
+from .write_behind import WriteBehind
+
+CATEGORIES = list(config.CATEGORY_WEIGHTS.keys())
+KEY_LEN = 32   # hex chars of text_hash kept per row
+
+
+def signal_row(key: str, signals: Dict[str, Any]) -> Dict[str, Any]:
+    """One store row from pipeline signals (see pipeline._compute_signals)."""
+    llm = signals.get("llm") or {}
+    heur = signals.get("heuristics") or {}
+    spacy = signals.get("spacy") or {}
+    return {
+        "key": key[:KEY_LEN],
+        "llm": [float((llm.get(c) or {}).get("score", 0.5)) for c in CATEGORIES],
+        "delta": [float((heur.get(c) or {}).get("delta", 0.0)) for c in CATEGORIES],
+        "spacy": [float(spacy[c]) if c in spacy else np.nan for c in CATEGORIES],
+        "at": time.time(),
+    }
+
+
+class Columns:
+    """All rows of a store (or of one chunk) as NumPy columns."""
+
+    FIELDS = ("key", "llm", "delta", "spacy", "trust", "risk", "at")
+
+    def __init__(self, **cols: np.ndarray):
+        for name in self.FIELDS:
+            setattr(self, name, cols[name])
+
+    def __len__(self) -> int:
+        return len(self.key)
+
+    @classmethod
+    def from_rows(cls, rows: List[Dict[str, Any]], weights: List[float]) -> "Columns":
+        llm = np.asarray([r["llm"] for r in rows], dtype=np.float64).reshape(len(rows), len(CATEGORIES))
+        delta = np.asarray([r["delta"] for r in rows], dtype=np.float64).reshape(llm.shape)
+        spacy = np.asarray([r["spacy"] for r in rows], dtype=np.float64).reshape(llm.shape)
+        trust, risk = compute_scores_bulk(llm, delta, spacy, weights)
+        return cls(
+            key=np.asarray([r["key"] for r in rows], dtype=f"S{KEY_LEN}"),
+            llm=llm, delta=delta, spacy=spacy,
+            trust=trust, risk=risk,
+            at=np.asarray([r["at"] for r in rows], dtype=np.float64),
+        )
+
+    @classmethod
+    def concat(cls, parts: List["Columns"]) -> "Columns":
+        return cls(**{name: np.concatenate([getattr(p, name) for p in parts]) for name in cls.FIELDS})
+
+    def latest_per_key(self) -> "Columns":
+        """Rows deduplicated by key, keeping the most recently recorded."""
+        keep = _latest_index(self.key, self.at)
+        return Columns(**{name: getattr(self, name)[keep] for name in self.FIELDS})
+
+
+def _latest_index(key: np.ndarray, at: np.ndarray) -> np.ndarray:
+    """Row indices of the newest row per key, in storage order."""
+    order = np.argsort(at, kind="stable")[::-1]
+    _, first = np.unique(key[order], return_index=True)
+    return np.sort(order[first])
+
+
+class SignalStore:
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self._seq = 0
+        self._lock = threading.Lock()
+
+    def chunks(self) -> List[str]:
+        return sorted(glob.glob(os.path.join(self.path, "chunk-*.npz")))
+
+    def write_chunk(self, cols: Columns, name: Optional[str] = None) -> str:
+        if name is None:
+            with self._lock:
+                self._seq += 1
+                name = f"chunk-{time.time():.6f}-{os.getpid()}-{self._seq}.npz"
+        out = os.path.join(self.path, name)
+        tmp = f"{out}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as fh:
+            np.savez(fh, categories=np.asarray(CATEGORIES), **{n: getattr(cols, n) for n in Columns.FIELDS})
+            fh.flush()
+            os.fsync(fh.fileno())
+        os.replace(tmp, out)
+        return out
+
+    def append(self, rows: List[Dict[str, Any]], weights: Optional[List[float]] = None) -> Optional[str]:
+        if not rows:
+            return None
+        return self.write_chunk(Columns.from_rows(rows, weights or _current_weights()))
+
+    @staticmethod
+    def read_chunk(path: str) -> Columns:
+        with np.load(path, allow_pickle=False) as z:
+            if list(z["categories"]) != CATEGORIES:
+                raise ValueError(f"{path}: categories differ from config.CATEGORY_WEIGHTS")
+            return Columns(**{name: z[name] for name in Columns.FIELDS})
+
+    def load(self, latest: bool = True) -> Tuple[Columns, List[Tuple[str, int]]]:
+        """All rows (newest per key with `latest`) plus (chunk, row count) for write-back."""
+        parts, sizes = [], []
+        for chunk in self.chunks():
+            cols = self.read_chunk(chunk)
+            parts.append(cols)
+            sizes.append((chunk, len(cols)))
+        if not parts:
+            empty = Columns.from_rows([], _current_weights())
+            return empty, []
+        cols = Columns.concat(parts)
+        return (cols.latest_per_key() if latest else cols), sizes
+
+
+def _current_weights() -> List[float]:
+    from . import rules
+    weights = rules.current().weights
+    return [weights[c] for c in CATEGORIES]
+
+
+# ---------------------------
+# Live recording (write-behind, off the request path)
+# ---------------------------
+_store: Optional[SignalStore] = None
+
+
+def _get_store() -> Optional[SignalStore]:
+    global _store
+    path = config.data_path(getattr(config, "SIGNAL_STORE_PATH", None))
+    if not path:
+        return None
+    if _store is None or _store.path != path:
+        _store = SignalStore(path)
+    return _store
+
+
+def _write(rows: List[Dict[str, Any]]) -> None:
+    store = _get_store()
+    if store is not None:
+        store.append(rows)
+
+
+_writer = WriteBehind("signal_store", _write,
+                      max_batch=getattr(config, "SIGNAL_STORE_FLUSH_ROWS", 256),
+                      max_delay=getattr(config, "SIGNAL_STORE_FLUSH_SECONDS", 60.0))
+
+
+def record(key: str, signals: Dict[str, Any]) -> None:
+    """Queue the signals of one analysis; a no-op unless SIGNAL_STORE_PATH is set."""
+    if getattr(config, "SIGNAL_STORE_PATH", None):
+        _writer.put(signal_row(key, signals))
+
+
+def flush() -> None:
+    _writer.flush()
+
+
+# ---------------------------
+# Bulk rescoring
+# ---------------------------
+def rescore(store: SignalStore, weights: Dict[str, float], alpha: float = ALPHA_LLM,
+            beta: float = BETA_REGEX, gamma: float = GAMMA_SPACY, dry_run: bool = True,
+            top_n: int = 10) -> Dict[str, Any]:
+    """
+    Recompute trust/risk for every stored row with new weights/blend. Returns a
+    report with risk-band transitions (latest row per policy) and, unless
+    `dry_run`, rewrites each chunk's trust/risk columns in place (atomically).
+    """
+    missing = [c for c in CATEGORIES if c not in weights]
+    if missing:
+        raise ValueError(f"weights missing categories: {missing}")
+    w = [float(weights[c]) for c in CATEGORIES]
+
+    t0 = time.perf_counter()
+    cols, sizes = store.load(latest=False)
+    t_load = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    trust, risk = compute_scores_bulk(cols.llm, cols.delta, cols.spacy, w, alpha, beta, gamma)
+    t_score = time.perf_counter() - t0
+
+    # Band changes are reported per policy (latest row per key)
+    idx = _latest_index(cols.key, cols.at)
+    old_risk, new_risk = cols.risk[idx], risk[idx]
+    old_trust, new_trust = cols.trust[idx], trust[idx]
+    transitions = np.zeros((len(RISK_LEVELS), len(RISK_LEVELS)), dtype=np.int64)
+    np.add.at(transitions, (old_risk, new_risk), 1)
+    shift = np.round(new_trust - old_trust, 1)
+    top = np.argsort(-np.abs(shift), kind="stable")[:top_n]
+
+    report = {
+        "rows": int(len(cols)),
+        "policies": int(len(idx)),
+        "band_changes": int((old_risk != new_risk).sum()),
+        "transitions": {f"{RISK_LEVELS[a]}->{RISK_LEVELS[b]}": int(transitions[a, b])
+                        for a in range(len(RISK_LEVELS)) for b in range(len(RISK_LEVELS))
+                        if a != b and transitions[a, b]},
+        "mean_shift": float(shift.mean()) if len(shift) else 0.0,
+        "max_abs_shift": float(np.abs(shift).max()) if len(shift) else 0.0,
+        "top_changes": [{"key": cols.key[idx[i]].decode(), "old": round(float(old_trust[i]), 1),
+                         "new": float(new_trust[i]), "old_risk": RISK_LEVELS[old_risk[i]],
+                         "new_risk": RISK_LEVELS[new_risk[i]]} for i in top if shift[i]],
+        "load_seconds": t_load,
+        "score_seconds": t_score,
+        "dry_run": dry_run,
+    }
+
+    if not dry_run:
+        at = 0
+        for chunk, n in sizes:
+            part = store.read_chunk(chunk)
+            part.trust = trust[at:at + n]
+            part.risk = risk[at:at + n]
+            store.write_chunk(part, name=os.path.basename(chunk))
+            at += n
+    return report
+
+
+def import_index(index_path: str, store: SignalStore) -> int:
+    """Backfill a store from the signals held in a trust index file."""
+    import struct
+    import zlib
+    from .trust_index import TrustIndex, _ENTRY
+
+    index = TrustIndex(index_path)
+    seen = set()
+    rows = []
+    for i in range(index.count):
+        _kh, th, offset, length = _ENTRY.unpack_from(index._mm, index._entries_at + i * _ENTRY.size)
+        if (offset, length) in seen:
+            continue   # URL and domain entries share one blob
+        seen.add((offset, length))
+        signals = json.loads(zlib.decompress(index._mm[offset:offset + length]))
+        rows.append(signal_row(th.hex(), signals))
+    store.append(rows)
+    return len(rows)
+
+
+def _print_report(report: Dict[str, Any]) -> None:
+    verb = "would change" if report["dry_run"] else "changed"
+    print(f"{report['policies']} policies ({report['rows']} rows): loaded in {report['load_seconds']:.3f}s, "
+          f"rescored in {report['score_seconds'] * 1e3:.1f} ms")
+    print(f"risk band {verb} for {report['band_changes']} policies")
+    for move, n in sorted(report["transitions"].items(), key=lambda kv: -kv[1]):
+        print(f"  {move:<14} {n}")
+    print(f"trust score shift: mean {report['mean_shift']:+.2f}, max |{report['max_abs_shift']:.1f}|")
+    for c in report["top_changes"]:
+        print(f"  {c['key']}  {c['old']:5.1f} -> {c['new']:5.1f}  {c['old_risk']} -> {c['new_risk']}")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    ap = argparse.ArgumentParser(description="Columnar signal store: stats, bulk rescoring, backfill.")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    s = sub.add_parser("stats")
+    s.add_argument("store")
+    r = sub.add_parser("rescore")
+    r.add_argument("store")
+    r.add_argument("--weights", help="JSON file: {category: weight} or a rule file with \"weights\" "
+                                     "(default: the current rule set)")
+    r.add_argument("--alpha", type=float, default=ALPHA_LLM)
+    r.add_argument("--beta", type=float, default=BETA_REGEX)
+    r.add_argument("--gamma", type=float, default=GAMMA_SPACY)
+    r.add_argument("--dry-run", action="store_true", help="report band changes without writing")
+    r.add_argument("--json", action="store_true")
+    i = sub.add_parser("import-index")
+    i.add_argument("index")
+    i.add_argument("store")
+    args = ap.parse_args()
+
+    store = SignalStore(args.store)
+    if args.cmd == "stats":
+        cols, sizes = store.load()
+        counts = np.bincount(cols.risk, minlength=len(RISK_LEVELS)) if len(cols) else [0] * len(RISK_LEVELS)
+        print(f"{len(sizes)} chunks, {sum(n for _, n in sizes)} rows, {len(cols)} policies")
+        print("  " + "  ".join(f"{lvl}: {int(n)}" for lvl, n in zip(RISK_LEVELS, counts)))
+    elif args.cmd == "rescore":
+        if args.weights:
+            with open(args.weights, "r", encoding="utf-8") as fh:
+                data = json.load(fh)
+            weights = data.get("weights", data)
+        else:
+            from . import rules
+            weights = rules.current().weights
+        report = rescore(store, weights, args.alpha, args.beta, args.gamma, dry_run=args.dry_run)
+        if args.json:
+            print(json.dumps(report, indent=2))
+        else:
+            _print_report(report)
+    else:
+        print(f"imported {import_index(args.index, store)} policies")
@@ -0,0 +1,179 @@
+# app/singleflight.py
+"""
+Single-flight request coalescing.
+
+Concurrent callers asking for the same key share one in-progress computation:
+the first caller (the leader) runs the function, everyone else waits and
+receives the leader's result (or its exception).
+
+Within a process this is a dict of in-flight calls guarded by a lock. To
+coordinate several worker processes, plug in a lock backend: the leader of
+each process takes the backend's per-key lock before computing, and publishes
+its result there so leaders in other processes that were waiting on the same
+lock can pick it up instead of recomputing.
+
+Backends:
+  - LocalBackend     no cross-process coordination (default)
+  - FileLockBackend  flock()-based locks + JSON result files in a shared
+                     directory; a local stand-in for Redis-style locking
+"""
+import contextlib
+import json
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from . import metrics
+
+
+# ---------------------------
+# Lock backends
+# ---------------------------
+class LocalBackend:
+    """No-op backend: coalescing stays within the current process."""
+
+    def lock(self, key: str):
+        return contextlib.nullcontext()
+
+    def load(self, key: str) -> Optional[Any]:
+        return None
+
+    def store(self, key: str, value: Any) -> None:
+        pass
+
+
+class FileLockBackend:
+    """
+    Cross-process backend for workers on one host.
+
+    Each key gets `<dir>/<key>.lock` (held with flock while the leader computes)
+    and `<dir>/<key>.json` (the published result, visible for `ttl` seconds).
+    Values must be JSON-serializable.
+    """
+
+    def __init__(self, directory: str, ttl: float = 10.0):
+        import fcntl  # POSIX only; imported here so LocalBackend works everywhere
+        self._fcntl = fcntl
+        self.directory = directory
+        self.ttl = float(ttl)
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key: str, ext: str) -> str:
+        return os.path.join(self.directory, f"{key}.{ext}")
+
+    @contextlib.contextmanager
+    def lock(self, key: str):
+        with open(self._path(key, "lock"), "a+") as fh:
+            self._fcntl.flock(fh.fileno(), self._fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                self._fcntl.flock(fh.fileno(), self._fcntl.LOCK_UN)
+
+    def load(self, key: str) -> Optional[Any]:
+        path = self._path(key, "json")
+        try:
+            if time.time() - os.path.getmtime(path) > self.ttl:
+                return None
+            with open(path, "r", encoding="utf-8") as fh:
+                return json.load(fh)
+        except (OSError, ValueError):
+            return None
+
+    def store(self, key: str, value: Any) -> None:
+        path = self._path(key, "json")
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as fh:
+                json.dump(value, fh)
+            os.replace(tmp, path)  # readers never see a half-written file
+        except (OSError, TypeError, ValueError):
+            with contextlib.suppress(OSError):
+                os.remove(tmp)
+        self._sweep()
+
+    def _sweep(self) -> None:
+        """Drop lock/result files well past their TTL so the directory stays small."""
+        cutoff = time.time() - max(60.0, 6 * self.ttl)
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return
+        for name in names:
+            path = os.path.join(self.directory, name)
+            with contextlib.suppress(OSError):
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+
+
+# ---------------------------
+# Single-flight group
+# ---------------------------
+class _Call:
+    __slots__ = ("done", "value", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """
+    Group of coalesced calls. Counters are reported under `<name>.*`:
+      leader            computations actually run
+      coalesced         callers that joined an in-flight call in this process
+      coalesced_remote  leaders that reused a result published by another process
+    """
+
+    def __init__(self, backend=None, name: str = "singleflight"):
+        self.backend = backend or LocalBackend()
+        self.name = name
+        self._lock = threading.Lock()
+        self._calls: Dict[str, _Call] = {}
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Tuple[Any, bool]:
+        """Run fn() once per key among concurrent callers. Returns (value, shared)."""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            metrics.incr(f"{self.name}.coalesced")
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.value, True
+
+        try:
+            value, shared = self._lead(key, fn)
+            call.value = value
+            return value, shared
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+
+    def _lead(self, key: str, fn: Callable[[], Any]) -> Tuple[Any, bool]:
+        with self.backend.lock(key):
+            value = self.backend.load(key)
+            if value is not None:
+                metrics.incr(f"{self.name}.coalesced_remote")
+                return value, True
+            metrics.incr(f"{self.name}.leader")
+            value = fn()
+            self.backend.store(key, value)
+        return value, False
+
+
+def backend_from_config(config) -> Any:
+    lock_dir = getattr(config, "SINGLEFLIGHT_LOCK_DIR", None)
+    if lock_dir:
+        return FileLockBackend(lock_dir, ttl=getattr(config, "SINGLEFLIGHT_RESULT_TTL", 10.0))
+    return LocalBackend()
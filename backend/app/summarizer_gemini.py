@@ -1,25 +1,42 @@
 #hi
 
 from typing import Dict, Any, List
+from concurrent.futures import ThreadPoolExecutor
 import json
 import google.generativeai as genai
+from . import config
 from .config import GEMINI_API_KEY, GEMINI_MODEL, CATEGORY_WEIGHTS
 
 # ---- Gemini setup ----
 genai.configure(api_key=GEMINI_API_KEY)
 _model = genai.GenerativeModel(GEMINI_MODEL)
+_models = {GEMINI_MODEL: _model}
+
+def _get_model(name: str = None):
+    if not name:
+        return _model
+    if name not in _models:
+        _models[name] = genai.GenerativeModel(name)
+    return _models[name]
 
 # ---- Shared helpers ----
-def _call_gemini(prompt: str, system: str = None, retries: int = 2) -> str:
-    """Robust wrapper that returns plain text; raises last error if all retries fail."""
+def _call_gemini(prompt: str, system: str = None, retries: int = 2, model: str = None) -> str:
+    """
+    Robust wrapper that returns plain text; raises last error if all retries fail.
+    GEMINI_TRANSPORT = "pooled" sends it through gemini_transport (keep-alive
+    pool, per-call deadline, hedging); "sdk" uses the google-generativeai client.
+    """
+    # Combine system and user prompt for Gemini
+    full_prompt = f"{system}\n\n{prompt}" if system else prompt
+    pooled = getattr(config, "GEMINI_TRANSPORT", "sdk") == "pooled"
     for attempt in range(retries + 1):
         try:
-            if system:
-                # Combine system and user prompt for Gemini
-                full_prompt = f"{system}\n\n{prompt}"
-                resp = _model.generate_content(full_prompt)
-            else:
-                resp = _model.generate_content(prompt)
+            if pooled:
+                from .gemini_transport import get_transport
+                return get_transport().generate(full_prompt, model or GEMINI_MODEL)
+            resp = _get_model(model).generate_content(
+                full_prompt, request_options={"timeout": config.GEMINI_TIMEOUT_SECONDS}
+            )
             return resp.text or ""
         except Exception as e:
             if attempt >= retries:
@@ -111,7 +128,7 @@ TEXT:
 # ============================================================
 # 2) PER-CATEGORY SCORING (the original thing you wanted)
 # ============================================================
-def llm_summary_categories(text: str) -> Dict[str, Dict[str, Any]]:
+def llm_summary_categories(text: str, categories: List[str] = None, model: str = None) -> Dict[str, Dict[str, Any]]:
     """
     Returns per-category normalized scores in [0,1] + short reasons, exactly for your scorer:
     {
@@ -119,8 +136,27 @@ def llm_summary_categories(text: str) -> Dict[str, Dict[str, Any]]:
       "Third-Party Sharing/Selling": {"score": 0.25, "reason": "Mentions sharing with partners; no opt-out."},
       ...
     }
+    `categories` restricts the prompt (and the result) to a subset; `model`
+    overrides GEMINI_MODEL for this call. With GEMINI_CATEGORY_SHARDS > 1 the
+    categories are split across that many smaller prompts sent in parallel.
     """
-    categories = list(CATEGORY_WEIGHTS.keys())
+    categories = list(categories or CATEGORY_WEIGHTS.keys())
+    shards = min(max(1, int(getattr(config, "GEMINI_CATEGORY_SHARDS", 1))), len(categories))
+    if shards > 1:
+        groups = [categories[i::shards] for i in range(shards)]
+        merged: Dict[str, Dict[str, Any]] = {}
+        for part in _shard_executor.map(lambda group: _categories_once(text, group, model), groups):
+            merged.update(part)
+        return {cat: merged[cat] for cat in categories}
+    return _categories_once(text, categories, model)
+
+
+# Threads start on first use, so this costs nothing while sharding is off
+_shard_executor = ThreadPoolExecutor(max_workers=len(CATEGORY_WEIGHTS), thread_name_prefix="gemini-shard")
+
+
+def _categories_once(text: str, categories: List[str], model: str = None) -> Dict[str, Dict[str, Any]]:
+    """One Gemini call scoring exactly `categories` (see llm_summary_categories)."""
 
     system = (
         "You are a precise privacy-policy scorer. "
@@ -139,7 +175,7 @@ Given the privacy policy text, output ONLY a JSON object mapping category -> {{"
 TEXT:
 \"\"\"{text}\"\"\""""
 
-    out = _call_gemini(prompt, system=system)
+    out = _call_gemini(prompt, system=system, model=model)
     data = _safe_json(out)
 
     # Fill missing categories & clamp
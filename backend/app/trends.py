@@ -0,0 +1,389 @@
+# app/trends.py
+"""
+Historical trend store: every analysis served (live or from the trust index)
+appends its scores and heuristic pattern hits to a local, append-only Parquet
+store, queried with DuckDB for dashboards (GET /trends/...).
+
+Layout under TRENDS_PATH, one directory per table:
+
+  analyses/         ts, domain, url, text_hash, trust_score, risk_level,
+                    base_score, base_risk, source    (text_hash: first 128 bits
+                    of hashing.text_hash, as in the trust index)
+  category_scores/  ts, domain, text_hash, category, score
+  flags/            ts, domain, text_hash, pattern, category, hits
+
+trust_score/risk_level are what the user was served (preference penalties
+included); base_score/base_risk and category_scores are the same analysis
+without penalties, i.e. the site's own score, which is what the history
+queries aggregate.
+
+Writing happens off the request path: record() queues a small tuple and a
+write_behind thread turns each batch into one Parquet part per table (CSV
+staging -> DuckDB COPY, temp name + rename, so readers never see a partial
+file). Parts are compacted in the background once a table has more than
+TRENDS_COMPACT_PARTS of them (small parts -> a segment sorted by domain, ts;
+many segments -> one), so a per-domain query reads few files and can skip
+row groups by their min/max statistics. Each segment of analyses/ and flags/
+also gets a daily rollup (analyses_daily/, flags_daily/) that all-sites flag
+queries read instead of the raw rows. One process compacts at a time (flock);
+the others keep appending.
+
+DuckDB is optional: without it (or without TRENDS_PATH) nothing is recorded
+and /trends answers 404/503.
+"""
+import csv
+import glob
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from . import config, metrics
+from .scoring import compute_score
+from .trust_index import _domain
+from .write_behind import WriteBehind
+
+try:
+    import duckdb
+except ImportError:   # optional dependency
+    duckdb = None
+
+TABLES = {
+    "analyses": {"ts": "DOUBLE", "domain": "VARCHAR", "url": "VARCHAR", "text_hash": "VARCHAR",
+                 "trust_score": "DOUBLE", "risk_level": "VARCHAR", "base_score": "DOUBLE",
+                 "base_risk": "VARCHAR", "source": "VARCHAR"},
+    "category_scores": {"ts": "DOUBLE", "domain": "VARCHAR", "text_hash": "VARCHAR",
+                        "category": "VARCHAR", "score": "DOUBLE"},
+    "flags": {"ts": "DOUBLE", "domain": "VARCHAR", "text_hash": "VARCHAR", "pattern": "VARCHAR",
+              "category": "VARCHAR", "hits": "INTEGER"},
+}
+BUCKETS = ("day", "week", "month", "quarter", "year")
+
+
+class TrendsUnavailable(RuntimeError):
+    pass
+
+
+def site(url_or_domain: str) -> str:
+    """The domain trends are grouped by ("https://www.Example.com/x" -> "example.com")."""
+    return _domain(url_or_domain)
+
+
+def enabled() -> bool:
+    return bool(getattr(config, "TRENDS_PATH", None)) and duckdb is not None
+
+
+# ---------------------------
+# Recording
+# ---------------------------
+def record(url: Optional[str], text_key: str, signals: Dict[str, Any], result: Dict[str, Any],
+           source: str = "live") -> None:
+    """
+    Queue one served analysis. Cheap: the rows (and the penalty-free base
+    score) are built in the writer thread; `signals` and `result` are only
+    read, never kept past the write.
+    """
+    if not enabled():
+        return
+    _writer.put((time.time(), url or None, text_key[:32], signals, result["trust_score"],
+                 result["risk_level"], result.get("weights"), source))
+
+
+def _rows(batch: List[tuple]) -> Dict[str, List[tuple]]:
+    out: Dict[str, List[tuple]] = {table: [] for table in TABLES}
+    for ts, url, key, signals, trust, risk, weights, source in batch:
+        domain = site(url) if url else None
+        heur = signals.get("heuristics") or {}
+        base = compute_score(heuristics=heur, llm=signals.get("llm"), spacy=signals.get("spacy"),
+                             weights=weights)
+        out["analyses"].append((ts, domain, url, key, trust, risk, base["trust_score"],
+                                base["risk_level"], source))
+        for cat, c in base["categories"].items():
+            out["category_scores"].append((ts, domain, key, cat, c["score"]))
+        for cat, h in heur.items():
+            for pattern, n in (h.get("hits") or {}).items():
+                out["flags"].append((ts, domain, key, pattern, cat, n))
+    return out
+
+
+_seq = 0
+_seq_lock = threading.Lock()
+
+
+def _part_name(prefix: str) -> str:
+    global _seq
+    with _seq_lock:
+        _seq += 1
+        return f"{prefix}-{time.time():.6f}-{os.getpid()}-{_seq}.parquet"
+
+
+def _copy_to_parquet(con, select_sql: str, path: str) -> None:
+    tmp = f"{path}.tmp"
+    con.execute(f"COPY ({select_sql}) TO '{tmp}' (FORMAT PARQUET, COMPRESSION ZSTD)")
+    os.replace(tmp, path)
+
+
+def _select_csv(staging: str, table: str) -> str:
+    columns = ", ".join(f"'{name}': '{kind}'" for name, kind in TABLES[table].items())
+    names = ", ".join(name if name != "ts" else "make_timestamp(CAST(ts * 1e6 AS BIGINT)) AS ts"
+                      for name in TABLES[table])
+    return (f"SELECT {names} FROM read_csv('{staging}', header = false, quote = '\"', escape = '\"', "
+            f"columns = {{{columns}}})")
+
+
+def write_batch(path: str, batch: List[tuple]) -> None:
+    """Append one batch of record() tuples to the store at `path`."""
+    con = duckdb.connect()
+    try:
+        for table, rows in _rows(batch).items():
+            if not rows:
+                continue
+            table_dir = os.path.join(path, table)
+            os.makedirs(table_dir, exist_ok=True)
+            staging = os.path.join(path, f".staging-{os.getpid()}-{table}.csv")
+            with open(staging, "w", newline="", encoding="utf-8") as fh:
+                csv.writer(fh).writerows(rows)
+            try:
+                _copy_to_parquet(con, _select_csv(staging, table), os.path.join(table_dir, _part_name("part")))
+            finally:
+                os.unlink(staging)
+            metrics.incr(f"trends.rows.{table}", len(rows))
+    finally:
+        con.close()
+    limit = getattr(config, "TRENDS_COMPACT_PARTS", 32)
+    if limit and len(glob.glob(os.path.join(path, "analyses", "part-*.parquet"))) > limit:
+        compact(path, limit)
+
+
+def _write(batch: List[tuple]) -> None:
+    path = config.data_path(getattr(config, "TRENDS_PATH", None))
+    if path and duckdb is not None:
+        write_batch(path, batch)
+
+
+_writer = WriteBehind("trends", _write,
+                      max_batch=getattr(config, "TRENDS_FLUSH_ROWS", 1000),
+                      max_delay=getattr(config, "TRENDS_FLUSH_SECONDS", 10.0),
+                      max_pending=getattr(config, "TRENDS_MAX_PENDING", 50_000))
+
+
+def flush() -> None:
+    _writer.flush()
+
+
+# ---------------------------
+# Compaction
+# ---------------------------
+# Daily rollups, one file per segment (same name, under <table>_daily/), so
+# all-sites queries aggregate a few thousand rollup rows instead of every flag.
+ROLLUPS = {
+    "analyses": "SELECT date_trunc('day', ts) AS day, count(*) AS n FROM {src} GROUP BY day",
+    "flags": "SELECT date_trunc('day', ts) AS day, pattern, any_value(category) AS category, "
+             "count(*) AS analyses, sum(hits) AS hits FROM {src} GROUP BY day, pattern",
+}
+
+
+def _merge(con, path: str, table: str, files: List[str]) -> None:
+    listing = ", ".join(f"'{f}'" for f in files)
+    name = _part_name("seg")
+    segment = os.path.join(path, table, name)
+    _copy_to_parquet(con, f"SELECT * FROM read_parquet([{listing}]) ORDER BY domain, ts", segment)
+    if table in ROLLUPS:
+        os.makedirs(os.path.join(path, f"{table}_daily"), exist_ok=True)
+        _copy_to_parquet(con, ROLLUPS[table].format(src=f"read_parquet('{segment}')"),
+                         os.path.join(path, f"{table}_daily", name))
+    for f in files:
+        os.unlink(f)
+        rollup = os.path.join(path, f"{table}_daily", os.path.basename(f))
+        if os.path.exists(rollup):
+            os.unlink(rollup)
+
+
+def compact(path: str, limit: int = 32, full: bool = False) -> bool:
+    """
+    Merge small parts into a sorted segment, and segments into one once there
+    are more than `limit` (or everything, with `full`). Returns False if
+    another process is compacting.
+    """
+    import fcntl
+
+    with open(os.path.join(path, ".compact.lock"), "w") as lock:
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            return False
+        con = duckdb.connect()
+        try:
+            for table in TABLES:
+                table_dir = os.path.join(path, table)
+                parts = sorted(glob.glob(os.path.join(table_dir, "part-*.parquet")))
+                if full:
+                    files = parts + sorted(glob.glob(os.path.join(table_dir, "seg-*.parquet")))
+                    if files:
+                        _merge(con, path, table, files)
+                    continue
+                if parts:
+                    _merge(con, path, table, parts)
+                segments = sorted(glob.glob(os.path.join(table_dir, "seg-*.parquet")))
+                if len(segments) > limit:
+                    _merge(con, path, table, segments)
+        finally:
+            con.close()
+        metrics.incr("trends.compactions")
+    return True
+
+
+# ---------------------------
+# Queries
+# ---------------------------
+_conn = None
+_conn_pid = None
+_conn_lock = threading.Lock()
+
+
+def _cursor():
+    """A cursor on this process's in-memory DuckDB (cursors are per thread)."""
+    global _conn, _conn_pid
+    if duckdb is None:
+        raise TrendsUnavailable("duckdb is not installed (pip install duckdb)")
+    with _conn_lock:
+        if _conn is None or _conn_pid != os.getpid():
+            _conn, _conn_pid = duckdb.connect(), os.getpid()
+        return _conn.cursor()
+
+
+def _source(path: str, table: str, files: str = "*.parquet") -> Optional[str]:
+    pattern = os.path.join(path, table, files)
+    if not glob.glob(pattern):
+        return None
+    return f"read_parquet('{pattern}')"
+
+
+def _query(sql: str, params: Dict[str, Any]) -> List[tuple]:
+    cur = _cursor()
+    try:
+        for attempt in (0, 1):
+            try:
+                return cur.execute(sql, params).fetchall()
+            except duckdb.IOException:
+                if attempt:    # a compaction removed a file between glob and read
+                    raise
+    finally:
+        cur.close()
+
+
+def _where(domain: Optional[str], since: Optional[str], until: Optional[str], ts: str = "ts") -> str:
+    clauses = ["TRUE"]
+    if domain:
+        clauses.append("domain = $domain")
+    if since:
+        clauses.append(f"{ts} >= CAST($since AS TIMESTAMP)")
+    if until:
+        clauses.append(f"{ts} < CAST($until AS TIMESTAMP)")
+    return " AND ".join(clauses)
+
+
+def _params(bucket: str, **values: Any) -> Dict[str, Any]:
+    if bucket not in BUCKETS:
+        raise ValueError(f"bucket must be one of {BUCKETS}")
+    for name in ("since", "until"):
+        if values.get(name):
+            try:
+                values[name] = datetime.fromisoformat(values[name]).isoformat(sep=" ")
+            except ValueError:
+                raise ValueError(f"{name} must be an ISO date (YYYY-MM-DD[THH:MM:SS])") from None
+    return {k: v for k, v in dict(bucket=bucket, **values).items() if v is not None}
+
+
+def domain_history(path: str, domain: str, bucket: str = "month", since: Optional[str] = None,
+                   until: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Per-period base Trust Score stats and per-category averages for one domain."""
+    domain = site(domain)
+    params = _params(bucket, domain=domain, since=since, until=until)
+    analyses, categories = _source(path, "analyses"), _source(path, "category_scores")
+    if analyses is None:
+        return []
+    where = _where(domain, since, until)
+    rows = _query(f"""
+        SELECT strftime(date_trunc($bucket, ts), '%Y-%m-%d') AS period, count(*),
+               count(DISTINCT text_hash), round(avg(base_score), 1), min(base_score), max(base_score),
+               count(*) FILTER (WHERE base_risk = 'High'), count(*) FILTER (WHERE base_risk = 'Medium'),
+               count(*) FILTER (WHERE base_risk = 'Low')
+        FROM {analyses} WHERE {where} GROUP BY period ORDER BY period""", params)
+    per_cat: Dict[str, Dict[str, float]] = {}
+    if categories is not None:
+        for period, cat, avg in _query(f"""
+                SELECT strftime(date_trunc($bucket, ts), '%Y-%m-%d') AS period, category, round(avg(score), 3)
+                FROM {categories} WHERE {where} GROUP BY period, category""", params):
+            per_cat.setdefault(period, {})[cat] = avg
+    return [
+        {"period": period, "analyses": n, "versions": versions, "avg_trust": avg, "min_trust": lo,
+         "max_trust": hi, "risk": {"High": high, "Medium": medium, "Low": low},
+         "categories": per_cat.get(period, {})}
+        for period, n, versions, avg, lo, hi, high, medium, low in rows
+    ]
+
+
+def flag_frequency(path: str, bucket: str = "month", domain: Optional[str] = None,
+                   since: Optional[str] = None, until: Optional[str] = None,
+                   limit: int = 20) -> List[Dict[str, Any]]:
+    """
+    How often each heuristic pattern fires per period: analyses with the flag,
+    total hits, and share of all analyses in that period (top `limit` per period).
+    """
+    domain = site(domain) if domain else None
+    params = _params(bucket, domain=domain, since=since, until=until, limit=int(limit))
+    where = _where(domain, since, until)
+    if domain:
+        # One site: its rows are contiguous in the sorted segments
+        totals = [(_source(path, "analyses"), "ts", "count(*)", where)]
+        fired = [(_source(path, "flags"), "ts", "count(*)", "sum(hits)", where)]
+    else:
+        # All sites: daily rollups of the segments + raw rows of not yet compacted
+        # parts (so date filters apply per day to compacted data)
+        by_day = _where(None, since, until, ts="day")
+        totals = [(_source(path, "analyses_daily"), "day", "sum(n)", by_day),
+                  (_source(path, "analyses", "part-*.parquet"), "ts", "count(*)", where)]
+        fired = [(_source(path, "flags_daily"), "day", "sum(analyses)", "sum(hits)", by_day),
+                 (_source(path, "flags", "part-*.parquet"), "ts", "count(*)", "sum(hits)", where)]
+    totals = [t for t in totals if t[0]]
+    fired = [f for f in fired if f[0]]
+    if not totals or not fired:
+        return []
+
+    totals_sql = " UNION ALL ".join(
+        f"SELECT date_trunc($bucket, {t}) AS p, {n} AS n FROM {src} WHERE {w} GROUP BY p"
+        for src, t, n, w in totals)
+    fired_sql = " UNION ALL ".join(
+        f"SELECT date_trunc($bucket, {t}) AS p, pattern, any_value(category) AS category, {n} AS analyses, "
+        f"{h} AS hits FROM {src} WHERE {w} GROUP BY p, pattern" for src, t, n, h, w in fired)
+    rows = _query(f"""
+        WITH totals AS (
+            SELECT p, sum(n) AS n FROM ({totals_sql}) GROUP BY p
+        ), fired AS (
+            SELECT p, pattern, any_value(category) AS category, sum(analyses) AS analyses, sum(hits) AS hits
+            FROM ({fired_sql}) GROUP BY p, pattern
+        )
+        SELECT strftime(p, '%Y-%m-%d'), pattern, category, analyses, hits, round(analyses / n, 4)
+        FROM fired JOIN totals USING (p)
+        QUALIFY row_number() OVER (PARTITION BY p ORDER BY analyses DESC, pattern) <= $limit
+        ORDER BY p, analyses DESC, pattern""", params)
+    return [
+        {"period": period, "pattern": pattern, "category": cat, "analyses": int(n), "hits": int(hits),
+         "share": share}
+        for period, pattern, cat, n, hits, share in rows
+    ]
+
+
+if __name__ == "__main__":
+    import argparse
+
+    ap = argparse.ArgumentParser(description="Trend store maintenance.")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    c = sub.add_parser("compact", help="merge all parts and segments into one sorted file per table")
+    c.add_argument("path", nargs="?", default=config.data_path(getattr(config, "TRENDS_PATH", None)))
+    args = ap.parse_args()
+    if not args.path:
+        ap.error("no store path (set TRENDS_PATH or pass one)")
+    print("compacted" if compact(args.path, full=True) else "another process is compacting")
@@ -0,0 +1,250 @@
+# app/trust_index.py
+"""
+Precomputed trust-score index for well-known sites.
+
+An offline build runs the normal pipeline over a corpus of (url, text) pairs
+and writes the resulting signals (heuristics, Gemini, spaCy, evidence) into a
+compact file. Serving workers mmap it and answer /analyze straight from it
+when the submitted `url` and normalized text hash both match an entry;
+anything else falls through to live analysis. Preferences and scoring are
+still applied per request, so personalized results stay correct.
+
+File layout (little-endian):
+  header   b"PSIX" | u16 version | u16 0 | u32 entry count | u32 meta length
+  meta     JSON: build options + build time
+  entries  sorted by key hash, fixed size:
+           8s key hash | 16s text hash | u64 blob offset | u32 blob length
+  blobs    zlib-compressed JSON signals (shared by a site's URL and domain entries)
+
+Rebuilds are written to a temp file and os.replace()d into place; workers
+notice the new inode on their next periodic stat and swap without restarting.
+
+Build:
+  python -m backend.app.trust_index build corpus.jsonl trust_index.bin
+  (corpus lines: {"url": "...", "text": "..."})
+"""
+import hashlib
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+from typing import Any, Dict, Iterable, Optional, Tuple
+from urllib.parse import urlsplit
+
+from . import config, metrics
+from .hashing import text_hash
+
+MAGIC = b"PSIX"
+VERSION = 1
+_HEADER = struct.Struct("<4sHHII")
+_ENTRY = struct.Struct("<8s16sQI")
+
+
+def _domain(url: str) -> str:
+    parts = urlsplit(url if "//" in url else f"//{url}")
+    host = (parts.hostname or "").lower()
+    return host[4:] if host.startswith("www.") else host
+
+
+def url_keys(url: str) -> Tuple[str, ...]:
+    """Lookup keys for a URL, most specific first: host/path, then host."""
+    host = _domain(url)
+    if not host:
+        return ()
+    path = urlsplit(url if "//" in url else f"//{url}").path.rstrip("/")
+    return (f"{host}{path}", host) if path else (host,)
+
+
+def _key_hash(key: str) -> bytes:
+    return hashlib.sha256(key.encode("utf-8")).digest()[:8]
+
+
+def _text_digest(text: str) -> bytes:
+    return bytes.fromhex(text_hash(text))[:16]
+
+
+class TrustIndex:
+    """Read-only view over an index file (mmap'd, safe to share between threads)."""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as fh:
+            self._mm = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, _, count, meta_len = _HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path}: not a trust index (v{VERSION})")
+        self.count = count
+        self.meta = json.loads(self._mm[_HEADER.size:_HEADER.size + meta_len])
+        self._entries_at = _HEADER.size + meta_len
+
+    def _find(self, key_hash: bytes) -> int:
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            at = self._entries_at + mid * _ENTRY.size
+            if self._mm[at:at + 8] < key_hash:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def get(self, url: str, text_digest: bytes) -> Optional[Dict[str, Any]]:
+        """Signals for the first key of `url` whose entry matches `text_digest`."""
+        for key in url_keys(url):
+            kh = _key_hash(key)
+            i = self._find(kh)
+            while i < self.count:
+                entry_kh, entry_th, offset, length = _ENTRY.unpack_from(self._mm, self._entries_at + i * _ENTRY.size)
+                if entry_kh != kh:
+                    break
+                if entry_th == text_digest:
+                    return json.loads(zlib.decompress(self._mm[offset:offset + length]))
+                i += 1
+        return None
+
+
+def covers(meta: Dict[str, Any], options: Dict[str, Any]) -> bool:
+    """Whether signals built with meta["options"] can answer a request with `options`."""
+    built = meta.get("options") or {}
+    if options["return_snippets"] and (
+        not built.get("return_snippets") or options["snippets_top_k"] > built.get("snippets_top_k", 0)
+    ):
+        return False
+    if options["include_spacy_probs"] and not built.get("include_spacy_probs"):
+        return False
+    if options["return_general"] and not built.get("return_general"):
+        return False
+    return True
+
+
+def fit(signals: Dict[str, Any], options: Dict[str, Any]) -> Dict[str, Any]:
+    """Trim stored signals down to what a request asked for."""
+    top_k = options["snippets_top_k"]
+    return dict(
+        signals,
+        spacy=signals["spacy"] if options["include_spacy_probs"] else {},
+        evidence={cat: lines[:top_k] for cat, lines in (signals["evidence"] or {}).items()}
+        if options["return_snippets"] else {},
+        overview=signals["overview"] if options["return_general"] else None,
+    )
+
+
+# ---------------------------
+# Serving: one swappable index per process
+# ---------------------------
+_index: Optional[TrustIndex] = None
+_index_stat: Optional[Tuple[int, int, int]] = None
+_checked_at = float("-inf")
+_swap_lock = threading.Lock()
+
+
+def _current() -> Optional[TrustIndex]:
+    global _index, _index_stat, _checked_at
+    path = config.data_path(getattr(config, "TRUST_INDEX_PATH", None))
+    if not path:
+        return None
+    now = time.monotonic()
+    if now - _checked_at < config.TRUST_INDEX_CHECK_SECONDS:
+        return _index
+    with _swap_lock:
+        if now - _checked_at < config.TRUST_INDEX_CHECK_SECONDS:
+            return _index
+        _checked_at = now
+        try:
+            st = os.stat(path)
+        except OSError:
+            _index, _index_stat = None, None
+            return None
+        stat = (st.st_ino, st.st_mtime_ns, st.st_size)
+        if stat != _index_stat:
+            try:
+                # Readers holding the old object keep using its mmap until they drop it.
+                _index, _index_stat = TrustIndex(path), stat
+                metrics.incr("index.reloads")
+            except (OSError, ValueError):
+                _index, _index_stat = None, None
+    return _index
+
+
+def lookup(url: str, text: str, options: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Indexed signals for (url, text) fitted to `options`, or None to analyze live."""
+    return lookup_hash(url, _text_digest(text), options)
+
+
+def lookup_hash(url: str, text_digest: bytes, options: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    index = _current()
+    if index is None or not url:
+        return None
+    signals = index.get(url, text_digest) if covers(index.meta, options) else None
+    metrics.incr("index.hit" if signals is not None else "index.miss")
+    return fit(signals, options) if signals is not None else None
+
+
+# ---------------------------
+# Offline build
+# ---------------------------
+def write_index(path: str, records: Iterable[Tuple[str, str, Dict[str, Any]]], options: Dict[str, Any]) -> int:
+    """
+    Write (url, text, signals) records to `path` atomically. Later records for
+    the same key and text replace earlier ones. Returns the number of entries.
+    """
+    blobs = bytearray()
+    entries: Dict[Tuple[bytes, bytes], Tuple[int, int]] = {}
+    for url, text, signals in records:
+        blob = zlib.compress(json.dumps(signals, separators=(",", ":")).encode("utf-8"), 6)
+        ref = (len(blobs), len(blob))
+        blobs += blob
+        digest = _text_digest(text)
+        for key in url_keys(url):
+            entries[(_key_hash(key), digest)] = ref
+
+    meta = json.dumps({"options": options, "built_at": time.time()}).encode("utf-8")
+    blobs_at = _HEADER.size + len(meta) + len(entries) * _ENTRY.size
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as fh:
+        fh.write(_HEADER.pack(MAGIC, VERSION, 0, len(entries), len(meta)))
+        fh.write(meta)
+        for (kh, th), (offset, length) in sorted(entries.items()):
+            fh.write(_ENTRY.pack(kh, th, blobs_at + offset, length))
+        fh.write(blobs)
+        fh.flush()
+        os.fsync(fh.fileno())
+    os.replace(tmp, path)
+    return len(entries)
+
+
+def build(corpus_path: str, out_path: str, top_k: int = 5) -> int:
+    """Run the live pipeline over a JSONL corpus of {"url", "text"} and write the index."""
+    from .pipeline import compute_signals
+
+    options = {"return_general": True, "return_snippets": True,
+               "snippets_top_k": top_k, "include_spacy_probs": True}
+
+    def records():
+        with open(corpus_path, "r", encoding="utf-8") as fh:
+            for line in fh:
+                if not line.strip():
+                    continue
+                row = json.loads(line)
+                text = (row.get("text") or "").strip()
+                if row.get("url") and text:
+                    yield row["url"], text, compute_signals(text, options)
+
+    return write_index(out_path, records(), options)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    ap = argparse.ArgumentParser(description="Build the precomputed trust-score index.")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    b = sub.add_parser("build")
+    b.add_argument("corpus", help="JSONL with one {\"url\", \"text\"} per line")
+    b.add_argument("out", help="index file to (atomically) replace")
+    b.add_argument("--top-k", type=int, default=5, help="evidence lines stored per category")
+    args = ap.parse_args()
+    n = build(args.corpus, args.out, top_k=args.top_k)
+    print(f"wrote {n} entries to {args.out}")
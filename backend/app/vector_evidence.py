@@ -0,0 +1,158 @@
+# app/vector_evidence.py
+"""
+Embedding-based evidence retrieval: an alternative to the phrase/token
+matchers in nlp_spacy.py that also finds paraphrased clauses.
+
+Every sentence of the policy becomes one row of a contiguous float32 matrix
+(L2-normalized), every category phrase of the rule set's matcher section
+becomes a prototype row. One matrix multiply scores all sentences against all
+prototypes; a category's score for a sentence is its best prototype's cosine
+similarity, and a stable sort picks the top-k sentences per category. The
+per-sentence cost is one row of the product, however many phrases there are.
+
+Sentence vectors:
+  - the spaCy model's static word vectors when it has them (en_core_web_md/lg):
+    mean of content-token vectors, so "we pass your details to advertisers"
+    lands near "share with third parties";
+  - otherwise hashed lemma + character-trigram features (VECTOR_DIM wide),
+    which still tolerate inflection and word-order changes but not synonyms.
+
+Select it with EVIDENCE_RETRIEVAL = "vector" in config.py (or mode="vector"
+on spacy_extract_category_lines). The output shape is the same as the matcher
+mode; "matched" lists the nearest prototype phrase.
+"""
+import threading
+import zlib
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+
+from . import config
+
+VECTOR_DIM = 1 << 10
+
+# Prototypes for the Matcher's token patterns, which have no phrase list
+_PATTERN_PROTOTYPES: Dict[str, List[str]] = {
+    "DATA_COLLECTION_VERB": ["we collect information"],
+    "SELL_SHARE": ["we sell your data", "share with partners"],
+    "VAGUE_BASIS": ["legitimate interests"],
+}
+
+_protos: Dict[Tuple[int, str, str], Tuple[np.ndarray, np.ndarray, List[str]]] = {}
+_protos_lock = threading.Lock()
+
+
+def _has_static_vectors(nlp) -> bool:
+    return nlp.vocab.vectors.shape[0] > 0 and nlp.vocab.vectors.shape[1] > 0
+
+
+def _normalize_rows(m: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(m, axis=1, keepdims=True)
+    np.divide(m, norms, out=m, where=norms > 0)
+    return m
+
+
+def _content(tokens):
+    return [t for t in tokens if not (t.is_punct or t.is_space or t.is_stop)] or \
+           [t for t in tokens if not (t.is_punct or t.is_space)]
+
+
+# A whole lemma counts as much as this many of its character trigrams, so
+# shared word fragments ("inform-", "-tion") don't outweigh shared words
+_WORD_WEIGHT = 4.0
+
+
+def _hashed_features(token) -> List[Tuple[int, float]]:
+    word = (token.lemma_ or token.text).lower()
+    feats = [(word, _WORD_WEIGHT)] + [(f"#{word}#"[i:i + 3], 1.0) for i in range(len(word))]
+    return [(zlib.crc32(g.encode("utf-8")) & (VECTOR_DIM - 1), w) for g, w in feats]
+
+
+def sentence_matrix(nlp, spans) -> np.ndarray:
+    """(len(spans), dim) float32, L2-normalized rows; empty spans give zero rows."""
+    if _has_static_vectors(nlp):
+        dim = nlp.vocab.vectors.shape[1]
+        out = np.zeros((len(spans), dim), dtype=np.float32)
+        for i, span in enumerate(spans):
+            vecs = [t.vector for t in _content(span) if t.has_vector]
+            if vecs:
+                out[i] = np.mean(vecs, axis=0)
+        return _normalize_rows(out)
+
+    rows: List[int] = []
+    cols: List[int] = []
+    weights: List[float] = []
+    for i, span in enumerate(spans):
+        for tok in _content(span):
+            for col, w in _hashed_features(tok):
+                rows.append(i)
+                cols.append(col)
+                weights.append(w)
+    out = np.zeros((len(spans), VECTOR_DIM), dtype=np.float32)
+    if rows:
+        np.add.at(out, (np.asarray(rows), np.asarray(cols)), np.asarray(weights, dtype=np.float32))
+        np.sqrt(out, out=out)   # damp repeated words
+    return _normalize_rows(out)
+
+
+def _prototypes(nlp, ruleset, categories: List[str]) -> Tuple[np.ndarray, np.ndarray, List[str]]:
+    """
+    Prototype matrix (n_protos, dim) with rows grouped by category, the start
+    column of each category's group (for np.maximum.reduceat), and the phrases.
+    Built once per loaded model and matcher rule version.
+    """
+    key = (id(nlp), ruleset.versions["matcher"], "static" if _has_static_vectors(nlp) else "hashed")
+    cached = _protos.get(key)
+    if cached is not None:
+        return cached
+    with _protos_lock:
+        if key in _protos:
+            return _protos[key]
+        by_cat: Dict[str, List[str]] = {cat: [] for cat in categories}
+        for label, texts in list(ruleset.phrases.items()) + list(_PATTERN_PROTOTYPES.items()):
+            for cat in ruleset.pattern_categories.get(label, []):
+                by_cat[cat].extend(t for t in texts if t not in by_cat[cat])
+        texts: List[str] = []
+        starts: List[int] = []
+        for cat in categories:
+            starts.append(len(texts))
+            texts.extend(by_cat[cat] or [cat.lower()])
+        matrix = sentence_matrix(nlp, [nlp(t) for t in texts])
+        _protos.clear()   # prototypes of older rule versions are dead weight
+        _protos[key] = (np.ascontiguousarray(matrix), np.asarray(starts, dtype=np.intp), texts)
+        return _protos[key]
+
+
+def extract_category_lines(doc, nlp, ruleset, categories: List[str],
+                           top_k: int = 3) -> Dict[str, List[Dict[str, Any]]]:
+    """Vector-mode counterpart of nlp_spacy.spacy_extract_category_lines (same output)."""
+    sents = [s for s in doc.sents if s.text.strip()]
+    if not sents or (top_k is not None and top_k <= 0):
+        return {cat: [] for cat in categories}
+
+    protos, starts, proto_texts = _prototypes(nlp, ruleset, categories)
+    sims = sentence_matrix(nlp, sents) @ protos.T                  # (n_sents, n_protos)
+    cat_sims = np.maximum.reduceat(sims, starts, axis=1)           # (n_sents, n_cats)
+    ends = list(starts[1:]) + [protos.shape[0]]
+    min_sim = getattr(config, "EVIDENCE_MIN_SIMILARITY", 0.35)
+
+    out: Dict[str, List[Dict[str, Any]]] = {}
+    for c, cat in enumerate(categories):
+        col = cat_sims[:, c]
+        k = len(sents) if top_k is None else min(top_k, len(sents))
+        # Best first; ties go to the earlier sentence, as in the matcher mode. A
+        # stable sort rather than argpartition, which breaks ties arbitrarily at the k-th place
+        top = [i for i in np.lexsort((np.arange(len(sents)), -col))[:k] if col[i] >= min_sim]
+        lines = []
+        for i in top:
+            sent = sents[i]
+            best = starts[c] + int(np.argmax(sims[i, starts[c]:ends[c]]))
+            lines.append({
+                "text": sent.text.strip(),
+                "start": sent.start_char,
+                "end": sent.end_char,
+                "score": round(float(col[i]), 4),
+                "matched": [proto_texts[best]],
+            })
+        out[cat] = lines
+    return out
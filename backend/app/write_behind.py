@@ -0,0 +1,86 @@
+# app/write_behind.py
+"""
+Write-behind batching for side outputs of a request (trend rows, recorded
+signals): the request thread only appends to an in-memory list, and a
+background thread hands the accumulated items to a sink in batches.
+
+A batch is written once `max_batch` items are waiting or every `max_delay`
+seconds, whichever comes first. put() never blocks and never raises: past
+`max_pending` waiting items it drops the item (counter <name>.dropped), so a
+slow or broken sink costs data, not latency. A sink error is logged and
+counted (<name>.errors) and its batch dropped, items counted in
+<name>.dropped too; <name>.written counts items stored.
+
+Each process gets its own thread, started on first use (also in a forked
+worker, which discards anything inherited from its parent). Whatever is still
+buffered is flushed at interpreter exit.
+"""
+import atexit
+import logging
+import os
+import threading
+from typing import Any, Callable, List
+
+from . import metrics
+
+
+class WriteBehind:
+    def __init__(self, name: str, sink: Callable[[List[Any]], None], max_batch: int = 1000,
+                 max_delay: float = 5.0, max_pending: int = 100_000):
+        self.name = name
+        self.sink = sink
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.max_pending = max_pending
+        self._items: List[Any] = []
+        self._cond = threading.Condition()
+        self._write_lock = threading.Lock()   # one batch at a time reaches the sink
+        self._pid = None
+        atexit.register(self.flush)
+
+    def put(self, item: Any) -> bool:
+        with self._cond:
+            if self._pid != os.getpid():
+                self._items = []
+                self._pid = os.getpid()
+                threading.Thread(target=self._run, name=f"write-behind-{self.name}", daemon=True).start()
+            if len(self._items) >= self.max_pending:
+                metrics.incr(f"{self.name}.dropped")
+                return False
+            self._items.append(item)
+            if len(self._items) >= self.max_batch:
+                self._cond.notify()
+        return True
+
+    def pending(self) -> int:
+        with self._cond:
+            return len(self._items)
+
+    def _take(self) -> List[Any]:
+        with self._cond:
+            batch, self._items = self._items, []
+        return batch
+
+    def _write(self, batch: List[Any]) -> None:
+        if not batch:
+            return
+        with self._write_lock:
+            try:
+                self.sink(batch)
+            except Exception:   # never let the sink kill the writer thread
+                logging.exception("%s: sink failed, dropped %d items", self.name, len(batch))
+                metrics.incr(f"{self.name}.errors")
+                metrics.incr(f"{self.name}.dropped", len(batch))
+                return
+        metrics.incr(f"{self.name}.written", len(batch))
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: len(self._items) >= self.max_batch, timeout=self.max_delay)
+            self._write(self._take())
+
+    def flush(self) -> None:
+        """Write everything buffered so far, from the calling thread."""
+        if self._pid == os.getpid():
+            self._write(self._take())
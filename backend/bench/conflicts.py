@@ -0,0 +1,231 @@
+# bench/conflicts.py
+"""
+Conflict-detection scaling benchmark: the old nested-loop substring scan vs the
+compiled ConflictEngine, over synthetic preference schemas of growing size.
+
+  python -m backend.bench.conflicts [--sizes 8 100 200 400] [--keywords 6] [--repeat 200]
+  python -m backend.bench.conflicts --check-tags [--texts policies.jsonl]
+
+"engine" includes tagging fresh evidence; "cached" is the per-request cost once
+the engine remembers the tags of a shared (coalesced/indexed) result; "speedup" is legacy/engine.
+
+Both sides do what one /analyze request needs: penalties before scoring plus
+the final conflict list (the old code ran detect_conflicts twice for that).
+
+--check-tags is the differential check of the rule set's preference tags
+(lexicon, token-level) against the old substring scan, using each
+preference's terms with any "*" dropped as its keywords. Sentences are
+synthetic: every term, as is, in its plural and in capitals, inside filler
+text from bench/search. You can add the sentences of a {"text"} JSONL file.
+Differences the token matching makes on purpose are not counted:
+  - a keyword found inside a word ("sale" in "wholesale");
+  - case and punctuation ("TLS", "cross border").
+What remains is a word the old scan caught by extending the keyword at its
+end ("data brokers"), which needs a prefix term in the lexicon. Those are
+printed, and the check exits 1.
+"""
+import argparse
+import json
+import random
+import re
+import sys
+import time
+from typing import Any, Dict, List, Optional
+
+from backend.app.config import CATEGORY_WEIGHTS
+from backend.app import rules
+from backend.app.policy_conflicts import ConflictEngine, LOW_SCORE_FALLBACK
+
+CATEGORIES = list(CATEGORY_WEIGHTS.keys())
+_WORDS = [
+    "data", "personal", "information", "share", "partners", "third", "party", "location",
+    "retain", "period", "delete", "security", "encryption", "children", "transfer", "cookies",
+    "advertising", "collect", "purpose", "consent", "broker", "sale", "rights", "access",
+]
+# Policy-sized vocabulary so synthetic keywords hit about as rarely as real ones
+_SYLLABLES = ["ba", "co", "di", "fe", "go", "hu", "ki", "lo", "ma", "ne", "po", "ru", "sa", "te", "vi", "zo"]
+_VOCAB = _WORDS + [a + b + c for a in _SYLLABLES for b in _SYLLABLES for c in _SYLLABLES[:4]]
+
+
+def synthetic_schema(n_prefs: int, n_keywords: int, rng: random.Random) -> Dict[str, Dict[str, Any]]:
+    schema = dict(rules.current().preferences)
+    while len(schema) < n_prefs:
+        key = f"pref_{len(schema)}"
+        schema[key] = {
+            "categories": rng.sample(CATEGORIES, rng.randint(1, 2)),
+            "keywords": [" ".join(rng.sample(_VOCAB, rng.randint(1, 3))) for _ in range(n_keywords)],
+        }
+    return schema
+
+
+def synthetic_evidence(rng: random.Random, per_cat: int = 3, words: int = 30) -> Dict[str, List[Dict[str, Any]]]:
+    return {
+        cat: [{"text": " ".join(rng.choice(_VOCAB) for _ in range(words)).capitalize() + "."}
+              for _ in range(per_cat)]
+        for cat in CATEGORIES
+    }
+
+
+def legacy_detect(schema, preferences, categories, evidence):
+    """The pre-engine algorithm: lowercase + substring scan per preference."""
+    def contains_any(s, terms):
+        s_low = s.lower()
+        return any(t in s_low for t in terms)
+
+    conflicts = []
+    for pref_key, enabled in preferences.items():
+        spec = schema.get(pref_key)
+        if not enabled or not spec:
+            continue
+        matched = None
+        for cat in spec["categories"]:
+            ev_list = evidence.get(cat, []) or []
+            hit = next((ev for ev in ev_list if contains_any(ev["text"], spec["keywords"])), None)
+            if hit is not None:
+                matched = cat
+                break
+            if matched is not None:   # a fallback fired: the next category's keyword check was its last chance
+                break
+            if (categories.get(cat) or {}).get("score", 1.0) <= LOW_SCORE_FALLBACK and ev_list:
+                matched = cat
+        if matched is not None:
+            conflicts.append((pref_key, matched))
+    return conflicts
+
+
+_WORD = re.compile(r"\w+")
+
+
+def _norm(text: str) -> str:
+    return " " + " ".join(_WORD.findall(text.lower())) + " "
+
+
+def substring_tags(keywords: Dict[str, List[str]], sentence: str) -> set:
+    """
+    The old scan's tags for `sentence`, case and punctuation aside, for keywords
+    that start on a word boundary; keywords may still run on past a word's end.
+    """
+    text = _norm(sentence)
+    return {pref for pref, kws in keywords.items() if any(" " + _norm(kw).strip() in text for kw in kws)}
+
+
+# Last words with no plural worth checking (mass nouns, -ing forms, adverbs, numbers)
+_NO_PLURAL = {"data", "information", "necessary", "indefinitely", "third", "children", "coppa", "gps", "tls",
+              "border", "2", "27001"}
+
+
+def _plural(term: str) -> Optional[str]:
+    last = _WORD.findall(term)[-1]
+    if last in _NO_PLURAL or last.endswith(("s", "ing")):
+        return None
+    if last.endswith(("x", "sh")) or (last.endswith("ch") and not last.endswith("tech")):
+        return term + "es"
+    if last.endswith("y") and last[-2:-1] not in "aeiou":
+        return term[:-1] + "ies"
+    return term + "s"
+
+
+def tag_sentences(keywords: Dict[str, List[str]], extra: List[str], rng: random.Random) -> List[str]:
+    from backend.bench.search import OBJECTS, SUBJECTS, VERBS
+
+    out = list(extra)
+    fillers = [obj for obj in OBJECTS if not substring_tags(keywords, obj)]   # so no other term hides a miss
+    for kws in keywords.values():
+        for kw in kws:
+            for form in (kw, _plural(kw), kw.upper()):
+                if form:
+                    out.append(f"{rng.choice(SUBJECTS)} {rng.choice(VERBS)} {rng.choice(fillers)} and {form} here.")
+    return out
+
+
+def check_tags(texts_path: Optional[str], rng: random.Random) -> int:
+    """Differential check of preference tags vs the substring scan (see the module docstring)."""
+    ruleset = rules.current()
+    engine = ruleset.conflicts
+    keywords = {pref: [t.replace("*", "") for t in terms]
+                for pref, terms in engine.lexicon.terms("preferences").items()}
+    extra = []
+    if texts_path:
+        with open(texts_path, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    extra += [s for s in re.split(r"(?<=[.!?])\s+", json.loads(line).get("text") or "") if s]
+    sentences = tag_sentences(keywords, extra, rng)
+    missed = []
+    for sentence in sentences:
+        want = substring_tags(keywords, sentence)
+        got = engine.lexicon.labels(sentence, "preferences")
+        if want != got:
+            missed.append((sentence, sorted(want - got), sorted(got - want)))
+    for sentence, lost, extra_tags in missed[:20]:
+        print(f"  {sentence!r}: missing {lost}, extra {extra_tags}")
+    print(f"preference tags ({ruleset.name}@{ruleset.version}): {len(sentences)} sentences, "
+          f"{len(missed)} differ from the substring scan")
+    return 1 if missed else 0
+
+
+def _time(fn, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--sizes", type=int, nargs="+", default=[8, 100, 200, 400])
+    ap.add_argument("--keywords", type=int, default=6, help="keywords per synthetic preference")
+    ap.add_argument("--repeat", type=int, default=200)
+    ap.add_argument("--seed", type=int, default=7)
+    ap.add_argument("--check-tags", action="store_true", help="differential check of the rule set's preference tags")
+    ap.add_argument("--texts", help="with --check-tags: {\"text\"} JSONL whose sentences are checked too")
+    args = ap.parse_args()
+
+    rng = random.Random(args.seed)
+    if args.check_tags:
+        sys.exit(check_tags(args.texts, rng))
+    scores = {cat: {"score": rng.random()} for cat in CATEGORIES}
+    print(f"{'prefs':>6} {'keywords':>9} {'legacy ms':>10} {'engine ms':>10} {'cached ms':>10} "
+          f"{'compile ms':>11} {'speedup':>8}")
+    for n in args.sizes:
+        schema = synthetic_schema(n, args.keywords, rng)
+        prefs = {k: True for k in schema}
+        evidence = synthetic_evidence(rng)
+
+        def legacy():
+            legacy_detect(schema, prefs, {}, evidence)        # pre-scoring pass (penalties)
+            legacy_detect(schema, prefs, scores, evidence)    # post-scoring pass
+
+        t0 = time.perf_counter()
+        engine = ConflictEngine(schema)
+        compile_s = time.perf_counter() - t0
+
+        def compiled():
+            ev = {cat: [{"text": e["text"]} for e in lines] for cat, lines in evidence.items()}
+            engine.tag_evidence(ev, retag=True)   # tag from scratch, as the first request does
+            engine.penalties(prefs, ev)
+            engine.detect(prefs, scores, ev)
+
+        tagged = {cat: [{"text": e["text"]} for e in lines] for cat, lines in evidence.items()}
+        engine.tag_evidence(tagged)
+
+        def cached():
+            # Tags already remembered: what every request sharing a result pays
+            engine.penalties(prefs, tagged)
+            engine.detect(prefs, scores, tagged)
+
+        # Same answers, or the comparison is meaningless
+        ev = {cat: [{"text": e["text"]} for e in lines] for cat, lines in evidence.items()}
+        got = [(c["preference"], c["category"]) for c in engine.detect(prefs, scores, ev)]
+        assert got == legacy_detect(schema, prefs, scores, evidence), "engine disagrees with legacy scan"
+
+        t_legacy = _time(legacy, args.repeat)
+        t_engine = _time(compiled, args.repeat)
+        t_cached = _time(cached, args.repeat)
+        n_kw = sum(len(s["keywords"]) for s in schema.values())
+        print(f"{n:>6} {n_kw:>9} {t_legacy * 1e3:>10.3f} {t_engine * 1e3:>10.3f} {t_cached * 1e3:>10.3f} "
+              f"{compile_s * 1e3:>11.2f} {t_legacy / t_engine:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+# bench/fake_gemini.py
+"""
+Local stand-in for the Gemini generateContent REST endpoint, with injectable
+tail latency, plus a transport benchmark that runs against it.
+
+Serve only (point the backend at it with GEMINI_TRANSPORT = "pooled" and
+GEMINI_API_BASE=http://127.0.0.1:8765):
+
+  python -m backend.bench.fake_gemini serve [--port 8765] [--base-ms 40] [--tail-ms 1500]
+                                           [--tail-rate 0.05] [--ms-per-category 15]
+
+Benchmark the pooled transport, hedging off vs on, and category sharding:
+
+  python -m backend.bench.fake_gemini bench [--calls 300] [--concurrency 8]
+
+Responses look like Gemini's: category prompts get a JSON object with a score
+and reason for every category named in the prompt, overview prompts get an
+overview object. Latency per request is base_ms (+-20%) plus ms_per_category
+for each category it must score (output length drives real latency), or
+tail_ms with probability tail_rate. A client that hangs up mid-wait is simply dropped.
+"""
+import argparse
+import ast
+import json
+import random
+import re
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List, Tuple
+
+_CATEGORIES = re.compile(r"Categories \(exact keys\): (\[.*?\])")
+
+
+def fake_reply(prompt: str, rng: random.Random) -> Tuple[str, int]:
+    """(reply text, number of categories scored) for a prompt."""
+    m = _CATEGORIES.search(prompt)
+    if m:
+        cats = ast.literal_eval(m.group(1))
+        return json.dumps({c: {"score": round(rng.random(), 2), "reason": "fake"} for c in cats}), len(cats)
+    return json.dumps({"overall_rating": 55, "risk_level": "Medium", "summary": "Fake overview."}), 0
+
+
+def make_server(port: int, base_ms: float, tail_ms: float, tail_rate: float,
+                ms_per_category: float = 0.0, seed: int = 0):
+    rng = random.Random(seed)
+    rng_lock = threading.Lock()
+    stats = {"requests": 0, "tails": 0}
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"   # keep-alive, like the real endpoint
+
+        def log_message(self, *args):
+            pass
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            prompt = "".join(p.get("text", "") for c in body.get("contents", []) for p in c.get("parts", []))
+            with rng_lock:
+                stats["requests"] += 1
+                tail = rng.random() < tail_rate
+                stats["tails"] += tail
+                text, n_cats = fake_reply(prompt, rng)
+                delay = tail_ms if tail else base_ms * rng.uniform(0.8, 1.2) + ms_per_category * n_cats
+            time.sleep(delay / 1000.0)
+            out = json.dumps({"candidates": [{"content": {"role": "model", "parts": [{"text": text}]}}]}).encode()
+            try:
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(out)))
+                self.end_headers()
+                self.wfile.write(out)
+            except OSError:
+                pass   # client cancelled (hedge loser)
+
+    server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+    server.daemon_threads = True
+    server.stats = stats
+    return server
+
+
+def _percentiles(samples: List[float]) -> str:
+    qs = statistics.quantiles(samples, n=100, method="inclusive")
+    return f"p50 {qs[49] * 1e3:7.1f}  p95 {qs[94] * 1e3:7.1f}  p99 {qs[98] * 1e3:7.1f}  max {max(samples) * 1e3:7.1f} ms"
+
+
+def bench(args) -> None:
+    from backend.app import config, metrics, summarizer_gemini
+    from backend.app.gemini_transport import GeminiTransport
+
+    server = make_server(0, args.base_ms, args.tail_ms, args.tail_rate, args.ms_per_category, seed=args.seed)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+    prompt = f"Categories (exact keys): {list(config.CATEGORY_WEIGHTS)}\nTEXT: ..."
+
+    def run(transport: GeminiTransport, label: str) -> None:
+        for _ in range(30):    # warm up the latency window
+            transport.generate(prompt, config.GEMINI_MODEL)
+        metrics.reset()
+
+        def one(_):
+            t = time.perf_counter()
+            transport.generate(prompt, config.GEMINI_MODEL)
+            return time.perf_counter() - t
+
+        with ThreadPoolExecutor(args.concurrency) as ex:
+            lat = list(ex.map(one, range(args.calls)))
+        print(f"{label:<12} {_percentiles(lat)}  hedges {metrics.get('gemini.hedges'):.0f} "
+              f"(won {metrics.get('gemini.hedge_wins'):.0f})")
+
+    common = dict(base_url=base, api_key="fake", pool_size=args.concurrency, timeout=10.0,
+                  hedge_min_seconds=args.base_ms * 1.5 / 1000.0)
+    run(GeminiTransport(hedge=False, **common), "no hedge")
+    run(GeminiTransport(hedge=True, **common), "hedged")
+
+    # Sharding: the same categories in N parallel prompts through the pooled transport
+    import os
+    os.environ["GEMINI_API_BASE"] = base
+    config.GEMINI_TRANSPORT = "pooled"
+    for shards in (1, 2, 4):
+        config.GEMINI_CATEGORY_SHARDS = shards
+        lat = []
+        for _ in range(40):
+            t = time.perf_counter()
+            out = summarizer_gemini.llm_summary_categories("fake policy text")
+            lat.append(time.perf_counter() - t)
+            assert list(out) == list(config.CATEGORY_WEIGHTS), "sharded result lost categories"
+        print(f"shards={shards:<5} {_percentiles(lat)}")
+    print(f"server saw {server.stats['requests']} requests, {server.stats['tails']} tail-latency")
+    server.shutdown()
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    for name in ("serve", "bench"):
+        p = sub.add_parser(name)
+        p.add_argument("--base-ms", type=float, default=40.0)
+        p.add_argument("--tail-ms", type=float, default=1500.0)
+        p.add_argument("--tail-rate", type=float, default=0.05)
+        p.add_argument("--ms-per-category", type=float, default=15.0)
+        p.add_argument("--seed", type=int, default=7)
+        if name == "serve":
+            p.add_argument("--port", type=int, default=8765)
+        else:
+            p.add_argument("--calls", type=int, default=300)
+            p.add_argument("--concurrency", type=int, default=8)
+    args = ap.parse_args()
+
+    if args.cmd == "serve":
+        server = make_server(args.port, args.base_ms, args.tail_ms, args.tail_rate,
+                             args.ms_per_category, seed=args.seed)
+        print(f"fake Gemini on http://127.0.0.1:{args.port} (Ctrl-C to stop)")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+    else:
+        bench(args)
+
+
+if __name__ == "__main__":
+    main()
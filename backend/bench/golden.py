@@ -0,0 +1,346 @@
+# bench/golden.py
+"""
+Golden-corpus fidelity harness: records what the pipeline says about a fixed
+corpus, then diffs any engine or mode against that recording, so a speed-up to
+detect_flags, the spaCy matching or compute_score can't shift trust scores
+unnoticed.
+
+  python -m backend.bench.golden record golden.jsonl [--payloads FILE] [--synthetic 40] [--set KEY=VALUE ...]
+  python -m backend.bench.golden check golden.jsonl [--set KEY=VALUE ...] [tolerances]
+  python -m backend.bench.golden compare golden.jsonl --set KEY=VALUE ... [--base-set KEY=VALUE ...] [--repeat 3]
+
+The corpus is the payloads of a JSONL file (one /analyze body per line, the
+load test's format; lines without "text" are skipped) plus --synthetic
+generated policies. Gemini is replaced by a frozen stub: a category's score
+is a hash of (text, category), so it is the same however the categories are
+batched (cascade, shards). The recording keeps, per case, the heuristic hits
+and deltas, spaCy probs, evidence spans and scores, per-category and trust
+scores, risk level and conflicts, plus the text itself.
+
+--set KEY=VALUE overrides a config.py constant for the run (VALUE is JSON when
+it parses, else a string): EVIDENCE_RETRIEVAL=vector, CASCADE_ENABLED=true,
+REQUEST_MEMORY_BUDGET_MB=1, SPACY_THREADS=0, ...
+
+check exits 1 when any field drifts beyond its tolerance. compare times the
+base engine (config as is, plus --base-set) and the candidate (plus --set) on
+the same corpus and prints per-stage speed-up next to each side's drift from
+the recording; it also exits 1 when the candidate is out of tolerance.
+Recordings are only comparable under the same spaCy model and rule file.
+"""
+import argparse
+import ast
+import hashlib
+import json
+import os
+import random
+import re
+import statistics
+import sys
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, List, Tuple
+
+from backend.app import config, pipeline, rules, summarizer_gemini
+from backend.app.preferences import default_preferences
+from backend.bench.fake_gemini import _CATEGORIES
+from backend.bench.loadtest import load_payloads, synthetic_payloads
+
+_TEXT = re.compile(r'TEXT:\s*"""(.*)"""\s*$', re.S)
+STAGES = ("heuristics", "spacy", "score")
+
+
+# ---------------------------
+# Frozen LLM
+# ---------------------------
+def _frozen(text: str, key: str) -> float:
+    digest = hashlib.sha256(f"{key}\0{text}".encode("utf-8")).digest()
+    return round(int.from_bytes(digest[:4], "big") / 2 ** 32, 2)
+
+
+def frozen_gemini(prompt: str, system: str = None, retries: int = 2, model: str = None) -> str:
+    """Stand-in for summarizer_gemini._call_gemini: deterministic per (text, category)."""
+    m = _TEXT.search(prompt)
+    text = m.group(1) if m else prompt
+    cats = _CATEGORIES.search(prompt)
+    if cats:
+        return json.dumps({c: {"score": _frozen(text, c), "reason": "golden"} for c in ast.literal_eval(cats.group(1))})
+    rating = int(_frozen(text, "overall") * 100)
+    return json.dumps({"overall_rating": rating, "risk_level": "Medium", "summary": "Golden overview."})
+
+
+# ---------------------------
+# Running the corpus
+# ---------------------------
+def _parse_sets(pairs: List[str]) -> Dict[str, Any]:
+    out = {}
+    for pair in pairs or []:
+        key, sep, value = pair.partition("=")
+        if not sep or not hasattr(config, key):
+            raise SystemExit(f"--set {pair!r}: expected KEY=VALUE with KEY a config.py constant")
+        try:
+            out[key] = json.loads(value)
+        except ValueError:
+            out[key] = value
+    return out
+
+
+@contextmanager
+def overrides(values: Dict[str, Any]):
+    saved = {key: getattr(config, key) for key in values}
+    for key, value in values.items():
+        setattr(config, key, value)
+    try:
+        yield
+    finally:
+        for key, value in saved.items():
+            setattr(config, key, value)
+
+
+class _Timed:
+    """Wraps a pipeline function, adding its wall time to a per-stage total."""
+
+    def __init__(self, fn, stage: str, totals: Dict[str, float]):
+        self.fn, self.stage, self.totals = fn, stage, totals
+
+    def __call__(self, *args, **kwargs):
+        t = time.perf_counter()
+        try:
+            return self.fn(*args, **kwargs)
+        finally:
+            self.totals[self.stage] += time.perf_counter() - t
+
+
+def run_case(case: Dict[str, Any]) -> Tuple[Dict[str, Any], Dict[str, float]]:
+    """(recorded fields, per-stage seconds) for one corpus entry under the current config."""
+    payload = case["payload"]
+    text = case["text"]
+    options = pipeline.parse_options(payload)
+    timings = {stage: 0.0 for stage in STAGES}
+    heuristics, nlp_signals = pipeline._heuristics, pipeline._nlp_signals
+    pipeline._heuristics = _Timed(heuristics, "heuristics", timings)
+    pipeline._nlp_signals = _Timed(nlp_signals, "spacy", timings)
+    try:
+        signals = pipeline._compute_signals(text, options)
+    finally:
+        pipeline._heuristics, pipeline._nlp_signals = heuristics, nlp_signals
+    t = time.perf_counter()
+    result = pipeline.personalize(signals, payload.get("preferences", default_preferences()), options)
+    timings["score"] = time.perf_counter() - t
+
+    return {
+        "heuristics": {cat: {"delta": h["delta"], "hits": h["hits"]} for cat, h in signals["heuristics"].items()},
+        "spacy": signals["spacy"],
+        "evidence": {cat: [[ev["start"], ev["end"], ev["score"]] for ev in lines]
+                     for cat, lines in (signals["evidence"] or {}).items()},
+        "categories": {cat: c["score"] for cat, c in result["categories"].items()},
+        "trust_score": result["trust_score"],
+        "risk_level": result["risk_level"],
+        "conflicts": sorted([c["preference"], c["category"]] for c in result["personalized"]["conflicts"]),
+    }, timings
+
+
+def build_corpus(payloads: str, synthetic: int, seed: int) -> List[Dict[str, Any]]:
+    rows = [("payload", row) for row in (load_payloads(payloads) if payloads else [])]
+    rows += [("synthetic", row) for row in synthetic_payloads(synthetic, random.Random(seed))]
+    corpus = []
+    for i, (source, row) in enumerate(rows):
+        text = row["text"].strip()
+        payload = {k: v for k, v in row.items() if k not in ("text", "async", "session_id")}
+        corpus.append({"id": i, "source": source, "text": text, "payload": payload})
+    return corpus
+
+
+def run_corpus(cases: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], Dict[str, float]]:
+    """Results and per-stage total seconds of one pass over `cases`."""
+    totals = {stage: 0.0 for stage in STAGES}
+    results = []
+    for case in cases:
+        fields, timings = run_case(case)
+        results.append(fields)
+        for stage, took in timings.items():
+            totals[stage] += took
+    return results, totals
+
+
+# ---------------------------
+# Diffing
+# ---------------------------
+def diff_case(golden: Dict[str, Any], now: Dict[str, Any], tol: argparse.Namespace) -> List[str]:
+    """Fields of one case that drift beyond tolerance, as readable lines."""
+    out = []
+    if abs(now["trust_score"] - golden["trust_score"]) > tol.tol_score:
+        out.append(f"trust_score {golden['trust_score']} -> {now['trust_score']}")
+    if now["risk_level"] != golden["risk_level"]:
+        out.append(f"risk_level {golden['risk_level']} -> {now['risk_level']}")
+    for cat, score in golden["categories"].items():
+        if abs(now["categories"].get(cat, 0.0) - score) > tol.tol_category:
+            out.append(f"categories[{cat}] {score:.4f} -> {now['categories'].get(cat, 0.0):.4f}")
+    for cat, h in golden["heuristics"].items():
+        mine = now["heuristics"].get(cat, {"delta": 0.0, "hits": {}})
+        if abs(mine["delta"] - h["delta"]) > tol.tol_delta:
+            out.append(f"heuristics[{cat}].delta {h['delta']:.4f} -> {mine['delta']:.4f}")
+        for key in set(h["hits"]) | set(mine["hits"]):
+            if abs(mine["hits"].get(key, 0) - h["hits"].get(key, 0)) > tol.tol_hits:
+                out.append(f"heuristics[{cat}].hits[{key}] {h['hits'].get(key, 0)} -> {mine['hits'].get(key, 0)}")
+    for cat, prob in golden["spacy"].items():
+        if abs(now["spacy"].get(cat, 0.0) - prob) > tol.tol_prob:
+            out.append(f"spacy[{cat}] {prob:.4f} -> {now['spacy'].get(cat, 0.0):.4f}")
+    for cat, lines in golden["evidence"].items():
+        overlap = evidence_overlap(lines, now["evidence"].get(cat, []))
+        if overlap < tol.min_evidence_overlap:
+            out.append(f"evidence[{cat}] overlap {overlap:.2f}")
+    if now["conflicts"] != golden["conflicts"]:
+        out.append(f"conflicts {golden['conflicts']} -> {now['conflicts']}")
+    return out
+
+
+def evidence_overlap(a: List[list], b: List[list]) -> float:
+    """Jaccard overlap of two evidence lists' (start, end) spans (1.0 when both empty)."""
+    sa, sb = {(s, e) for s, e, _ in a}, {(s, e) for s, e, _ in b}
+    return len(sa & sb) / len(sa | sb) if sa | sb else 1.0
+
+
+def drift(golden: List[Dict[str, Any]], now: List[Dict[str, Any]], tol) -> Dict[str, Any]:
+    """Summary of how far `now` is from the recording, plus the per-case diffs."""
+    deltas = [abs(n["trust_score"] - g["trust_score"]) for g, n in zip(golden, now)]
+    overlaps = [evidence_overlap(g["evidence"].get(cat, []), n["evidence"].get(cat, []))
+                for g, n in zip(golden, now) for cat in g["evidence"]]
+    diffs = [(i, diff_case(g, n, tol)) for i, (g, n) in enumerate(zip(golden, now))]
+    return {
+        "max_trust_delta": max(deltas, default=0.0),
+        "mean_trust_delta": statistics.fmean(deltas) if deltas else 0.0,
+        "risk_changes": sum(g["risk_level"] != n["risk_level"] for g, n in zip(golden, now)),
+        "hit_changes": sum(g["heuristics"] != n["heuristics"] for g, n in zip(golden, now)),
+        "mean_evidence_overlap": statistics.fmean(overlaps) if overlaps else 1.0,
+        "failing": [(i, d) for i, d in diffs if d],
+    }
+
+
+# ---------------------------
+# Recording file
+# ---------------------------
+def _environment() -> Dict[str, Any]:
+    return {"rules": rules.current().version, "spacy_model": os.environ.get("SPACY_MODEL_DIR") or "en_core_web_sm"}
+
+
+def load_recording(path: str) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
+    with open(path, "r", encoding="utf-8") as f:
+        header = json.loads(f.readline())
+        cases = [json.loads(line) for line in f if line.strip()]
+    env = _environment()
+    for key in ("rules", "spacy_model"):
+        if header.get(key) != env[key]:
+            print(f"warning: recorded with {key} {header.get(key)!r}, now {env[key]!r}; expect drift")
+    return header, cases
+
+
+def print_failing(failing: List[Tuple[int, List[str]]], cases: List[Dict[str, Any]], limit: int = 10) -> None:
+    for i, lines in failing[:limit]:
+        print(f"  case {cases[i]['id']} ({cases[i]['source']}, {len(cases[i]['text']):,} chars):")
+        for line in lines[:8]:
+            print(f"    {line}")
+    if len(failing) > limit:
+        print(f"  ... and {len(failing) - limit} more cases")
+
+
+# ---------------------------
+# Commands
+# ---------------------------
+def cmd_record(args) -> int:
+    cases = build_corpus(args.payloads, args.synthetic, args.seed)
+    with overrides(_parse_sets(args.set)):
+        results, timings = run_corpus(cases)
+    with open(args.golden, "w", encoding="utf-8") as f:
+        f.write(json.dumps(dict(_environment(), golden=1, cases=len(cases), set=args.set or [])) + "\n")
+        for case, fields in zip(cases, results):
+            f.write(json.dumps(dict(case, result=fields), sort_keys=True) + "\n")
+    print(f"recorded {len(cases)} cases to {args.golden} "
+          f"({', '.join(f'{s} {t * 1e3:.0f} ms' for s, t in timings.items())})")
+    return 0
+
+
+def cmd_check(args) -> int:
+    _header, cases = load_recording(args.golden)
+    with overrides(_parse_sets(args.set)):
+        results, _timings = run_corpus(cases)
+    d = drift([c["result"] for c in cases], results, args)
+    print(f"{len(cases)} cases: max |trust delta| {d['max_trust_delta']:.2f}, {d['risk_changes']} risk level "
+          f"change(s), {d['hit_changes']} with changed heuristic hits, mean evidence overlap "
+          f"{d['mean_evidence_overlap']:.3f}; {len(d['failing'])} beyond tolerance")
+    print_failing(d["failing"], cases)
+    return 1 if d["failing"] else 0
+
+
+def cmd_compare(args) -> int:
+    _header, cases = load_recording(args.golden)
+    golden = [c["result"] for c in cases]
+    sides = {"base": _parse_sets(args.base_set), "candidate": _parse_sets((args.base_set or []) + (args.set or []))}
+    for sets in sides.values():
+        with overrides(sets):
+            run_corpus(cases[:3])   # warm up: models, matchers, prototypes
+    # Passes alternate between the sides, so drift in machine speed hits both alike
+    passes = {side: [] for side in sides}
+    results = {}
+    for _ in range(args.repeat):
+        for side, sets in sides.items():
+            with overrides(sets):
+                results[side], totals = run_corpus(cases)
+            passes[side].append(totals)
+    runs = {side: ({stage: statistics.median(t[stage] for t in passes[side]) for stage in STAGES},
+                   drift(golden, results[side], args))
+            for side in sides}
+
+    (tb, db), (tc, dc) = runs["base"], runs["candidate"]
+    print(f"{len(cases)} cases, median of {args.repeat} pass(es); candidate: {' '.join(args.set or []) or '(same)'}")
+    print(f"{'':28}{'base':>12}{'candidate':>12}{'speedup':>10}")
+    for stage in STAGES + ("total",):
+        b = sum(tb.values()) if stage == "total" else tb[stage]
+        c = sum(tc.values()) if stage == "total" else tc[stage]
+        print(f"  {stage + ' ms':<26}{b * 1e3:>12.1f}{c * 1e3:>12.1f}{(b / c if c else float('inf')):>9.2f}x")
+    print("drift from the recording")
+    for label, key, fmt in (("max |trust delta|", "max_trust_delta", "{:.2f}"),
+                            ("mean |trust delta|", "mean_trust_delta", "{:.3f}"),
+                            ("risk level changes", "risk_changes", "{}"),
+                            ("changed heuristic hits", "hit_changes", "{}"),
+                            ("mean evidence overlap", "mean_evidence_overlap", "{:.3f}")):
+        print(f"  {label:<26}{fmt.format(db[key]):>12}{fmt.format(dc[key]):>12}")
+    print(f"  {'cases beyond tolerance':<26}{len(db['failing']):>12}{len(dc['failing']):>12}")
+    if dc["failing"]:
+        print("candidate:")
+        print_failing(dc["failing"], cases)
+    return 1 if dc["failing"] else 0
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    rec = sub.add_parser("record", help="run the corpus and write the recording")
+    rec.add_argument("golden")
+    rec.add_argument("--payloads", help="JSONL of /analyze payloads to include")
+    rec.add_argument("--synthetic", type=int, default=40, help="generated policies to include")
+    rec.add_argument("--seed", type=int, default=1)
+    rec.add_argument("--set", action="append", metavar="KEY=VALUE")
+    for name, helptext in (("check", "diff the current engine against the recording"),
+                           ("compare", "time and diff a candidate engine against the base one")):
+        p = sub.add_parser(name, help=helptext)
+        p.add_argument("golden")
+        p.add_argument("--set", action="append", metavar="KEY=VALUE")
+        p.add_argument("--tol-score", type=float, default=0.0, help="trust score points")
+        p.add_argument("--tol-category", type=float, default=1e-9, help="per-category score")
+        p.add_argument("--tol-prob", type=float, default=1e-9, help="spaCy per-category prob")
+        p.add_argument("--tol-delta", type=float, default=1e-9, help="heuristic per-category delta")
+        p.add_argument("--tol-hits", type=int, default=0, help="heuristic hits per pattern")
+        p.add_argument("--min-evidence-overlap", type=float, default=1.0,
+                       help="Jaccard overlap of evidence spans per category")
+        if name == "compare":
+            p.add_argument("--base-set", action="append", metavar="KEY=VALUE")
+            p.add_argument("--repeat", type=int, default=3)
+    args = ap.parse_args()
+
+    summarizer_gemini._call_gemini = frozen_gemini
+    config.TRUST_INDEX_PATH = config.TRENDS_PATH = config.EVIDENCE_INDEX_PATH = config.SIGNAL_STORE_PATH = None
+    sys.exit({"record": cmd_record, "check": cmd_check, "compare": cmd_compare}[args.cmd](args))
+
+
+if __name__ == "__main__":
+    main()
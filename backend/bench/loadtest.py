@@ -0,0 +1,383 @@
+# bench/loadtest.py
+"""
+Load test for /analyze: starts the app under gunicorn (the production-style
+server; `pip install gunicorn`) with the pooled Gemini transport pointed at a
+local fake Gemini (bench/fake_gemini.py), replays /analyze payloads at a
+target arrival rate, and checks the result against SLO thresholds.
+
+  python -m backend.bench.loadtest --users 16 --duration 60
+  python -m backend.bench.loadtest --rate 20 --page-fraction 0.3 --payloads payloads.jsonl \\
+      --slo-p99-ms 2500 --slo-error-rate 0.01 --slo-rss-mb 600
+
+Arrivals: --rate R is open-loop (Poisson, R requests/s, at most --users in
+flight; requests that find no free slot count as errors). Without --rate,
+--users N closed-loop clients send back to back: "p99 at N concurrent users".
+
+Payloads: JSONL of /analyze bodies ({"text": ...} plus any options). Each
+request picks one at random and sends it in page mode (full text,
+"async": true, then long-polls /jobs/<id> like the extension) with
+probability --page-fraction, otherwise in selection mode (a few sentences,
+synchronous). Without --payloads a synthetic policy is used.
+
+Report: throughput, latency percentiles per mode, error rate, and CPU time and
+RSS per gunicorn worker (from /proc, so Linux only). Exits 1 if any SLO is
+violated, 2 if the server never came up. --json prints the report as JSON.
+"""
+import argparse
+import http.client
+import importlib.util
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+from backend.bench.fake_gemini import make_server
+
+_REPO = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+_CLK_TCK = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+
+_SENTENCES = [
+    "We collect your name, email address and device identifiers when you create an account.",
+    "We may share personal information with our partners and service providers.",
+    "We do not sell your personal data to data brokers.",
+    "Information is retained for as long as necessary to provide the service.",
+    "We use encryption and TLS to protect data in transit.",
+    "You may request access to or deletion of your data at any time.",
+    "Data may be transferred outside your country under standard contractual clauses.",
+    "Our services are not directed to children under 13.",
+    "We process data on the basis of our legitimate interests.",
+    "Cookies and similar technologies are used for advertising and analytics.",
+]
+
+
+def make_app():
+    """gunicorn entry point: create_app() with config overrides from PRIVASEE_LOADTEST_CONFIG."""
+    from backend.app import config, create_app
+
+    for key, value in json.loads(os.environ.get("PRIVASEE_LOADTEST_CONFIG", "{}")).items():
+        setattr(config, key, value)
+    return create_app()
+
+
+def synthetic_payloads(n: int, rng: random.Random) -> List[Dict[str, Any]]:
+    return [{"text": " ".join(rng.choice(_SENTENCES) for _ in range(rng.randint(60, 200)))} for _ in range(n)]
+
+
+def load_payloads(path: str) -> List[Dict[str, Any]]:
+    out = []
+    with open(path, "r", encoding="utf-8") as fh:
+        for line in fh:
+            if line.strip():
+                row = json.loads(line)
+                if isinstance(row, dict) and (row.get("text") or "").strip():
+                    out.append(row)
+    if not out:
+        raise SystemExit(f"{path}: no payloads with a non-empty \"text\"")
+    return out
+
+
+def selection_of(payload: Dict[str, Any], rng: random.Random) -> Dict[str, Any]:
+    """A few consecutive sentences of the payload's text, as a highlighted selection."""
+    sents = [s for s in payload["text"].replace("\n", " ").split(". ") if s.strip()]
+    start = rng.randrange(len(sents))
+    return dict(payload, text=". ".join(sents[start:start + rng.randint(2, 5)]), **{"async": False})
+
+
+# ---------------------------
+# Server + /proc sampling
+# ---------------------------
+def start_server(args, gemini_base: str, jobs_db: str) -> subprocess.Popen:
+    overrides = {
+        "GEMINI_TRANSPORT": "pooled",
+        "JOBS_DB_PATH": jobs_db,
+        "DEBUG": False,
+    }
+    overrides.update(json.loads(args.config or "{}"))
+    env = dict(os.environ, GEMINI_API_BASE=gemini_base, PRIVASEE_LOADTEST_CONFIG=json.dumps(overrides))
+    cmd = [sys.executable, "-m", "gunicorn", "--workers", str(args.workers), "--threads", str(args.threads),
+           "--bind", f"127.0.0.1:{args.port}", "--timeout", "120", "--log-level", "warning",
+           "backend.bench.loadtest:make_app()"]
+    return subprocess.Popen(cmd, cwd=_REPO, env=env)
+
+
+def wait_healthy(port: int, timeout: float) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=2)
+            conn.request("GET", "/health")
+            if conn.getresponse().status == 200:
+                return True
+        except OSError:
+            pass
+        time.sleep(0.2)
+    return False
+
+
+def worker_pids(master: int) -> List[int]:
+    pids = []
+    for name in os.listdir("/proc"):
+        if name.isdigit():
+            try:
+                with open(f"/proc/{name}/stat") as fh:
+                    fields = fh.read().rsplit(")", 1)[1].split()
+                if int(fields[1]) == master:
+                    pids.append(int(name))
+            except (OSError, IndexError, ValueError):
+                pass
+    return sorted(pids)
+
+
+def proc_sample(pid: int) -> Dict[str, float]:
+    """CPU seconds (user+sys), current and peak RSS in MB for one process."""
+    with open(f"/proc/{pid}/stat") as fh:
+        fields = fh.read().rsplit(")", 1)[1].split()
+    cpu = (int(fields[11]) + int(fields[12])) / _CLK_TCK
+    rss = hwm = 0.0
+    with open(f"/proc/{pid}/status") as fh:
+        for line in fh:
+            if line.startswith("VmRSS:"):
+                rss = int(line.split()[1]) / 1024
+            elif line.startswith("VmHWM:"):
+                hwm = int(line.split()[1]) / 1024
+    return {"cpu_s": cpu, "rss_mb": rss, "peak_rss_mb": hwm}
+
+
+# ---------------------------
+# Client
+# ---------------------------
+class Client:
+    """One connection per thread; reused across requests only with keepalive=True."""
+
+    def __init__(self, port: int, timeout: float, keepalive: bool = False):
+        self.port, self.timeout, self.keepalive = port, timeout, keepalive
+        self._local = threading.local()
+
+    def _request(self, method: str, path: str, body: Optional[bytes] = None) -> Tuple[int, bytes]:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = http.client.HTTPConnection("127.0.0.1", self.port, timeout=self.timeout)
+        try:
+            conn.request(method, path, body=body, headers={"Content-Type": "application/json"})
+            resp = conn.getresponse()
+            data = resp.read()
+            if not self.keepalive:
+                conn.close()
+                self._local.conn = None
+            return resp.status, data
+        except Exception:
+            conn.close()
+            self._local.conn = None
+            raise
+
+    def analyze(self, payload: Dict[str, Any], page: bool) -> None:
+        status, body = self._request("POST", "/analyze", json.dumps(payload).encode("utf-8"))
+        if page and status == 202:
+            poll = json.loads(body)["poll"]
+            while status == 202:
+                status, body = self._request("GET", f"{poll}?wait=25")
+        if status != 200:
+            raise RuntimeError(f"HTTP {status}")
+
+
+def run_load(args, payloads: List[Dict[str, Any]]) -> Dict[str, Any]:
+    rng = random.Random(args.seed)
+    rng_lock = threading.Lock()
+    client = Client(args.port, timeout=args.request_timeout, keepalive=args.keepalive)
+    results: List[Tuple[str, float, Optional[str]]] = []
+    res_lock = threading.Lock()
+
+    def one() -> None:
+        with rng_lock:
+            page = rng.random() < args.page_fraction
+            base = rng.choice(payloads)
+            payload = dict(base, **{"async": True}) if page else selection_of(base, rng)
+        mode = "page" if page else "selection"
+        t = time.perf_counter()
+        err = None
+        try:
+            client.analyze(payload, page)
+        except Exception as e:
+            err = f"{type(e).__name__}: {e}"
+        with res_lock:
+            results.append((mode, time.perf_counter() - t, err))
+
+    start = time.monotonic()
+    stop = start + args.duration
+    if args.rate:
+        slots = threading.BoundedSemaphore(args.users)
+        dropped = 0
+
+        def slot_run():
+            try:
+                one()
+            finally:
+                slots.release()
+
+        with ThreadPoolExecutor(args.users) as ex:
+            next_at = start
+            while True:
+                next_at += rng.expovariate(args.rate)
+                if next_at >= stop:
+                    break
+                time.sleep(max(0.0, next_at - time.monotonic()))
+                if slots.acquire(blocking=False):
+                    ex.submit(slot_run)
+                else:
+                    dropped += 1
+        with res_lock:
+            results.extend(("dropped", 0.0, "no free client slot") for _ in range(dropped))
+    else:
+        def user():
+            while time.monotonic() < stop:
+                one()
+
+        threads = [threading.Thread(target=user, daemon=True) for _ in range(args.users)]
+        for th in threads:
+            th.start()
+        for th in threads:
+            th.join()
+    return {"elapsed": time.monotonic() - start, "results": results}
+
+
+# ---------------------------
+# Report
+# ---------------------------
+def _pcts(samples: List[float]) -> Dict[str, float]:
+    if not samples:
+        return {}
+    if len(samples) == 1:
+        ms = samples[0] * 1e3
+        return {"p50": ms, "p90": ms, "p95": ms, "p99": ms, "max": ms}
+    qs = statistics.quantiles(samples, n=100, method="inclusive")
+    return {"p50": qs[49] * 1e3, "p90": qs[89] * 1e3, "p95": qs[94] * 1e3, "p99": qs[98] * 1e3,
+            "max": max(samples) * 1e3}
+
+
+def build_report(run: Dict[str, Any], workers: Dict[int, Dict[str, float]], args) -> Dict[str, Any]:
+    results = run["results"]
+    ok = [(m, s) for m, s, e in results if e is None]
+    errors = [e for _, _, e in results if e is not None]
+    total = len(results)
+    report = {
+        "requests": total,
+        "throughput_rps": len(ok) / run["elapsed"] if run["elapsed"] else 0.0,
+        "error_rate": len(errors) / total if total else 0.0,
+        "errors": sorted(set(errors))[:5],
+        "latency_ms": {
+            "all": _pcts([s for _, s in ok]),
+            "selection": _pcts([s for m, s in ok if m == "selection"]),
+            "page": _pcts([s for m, s in ok if m == "page"]),
+        },
+        "workers": {str(pid): w for pid, w in workers.items()},
+    }
+    violations = []
+    p99 = report["latency_ms"]["all"].get("p99")
+    if args.slo_p99_ms is not None and (p99 is None or p99 > args.slo_p99_ms):
+        violations.append(f"p99 {p99 or float('nan'):.0f} ms > {args.slo_p99_ms:.0f} ms")
+    if args.slo_error_rate is not None and report["error_rate"] > args.slo_error_rate:
+        violations.append(f"error rate {report['error_rate']:.3%} > {args.slo_error_rate:.3%}")
+    if args.slo_min_rps is not None and report["throughput_rps"] < args.slo_min_rps:
+        violations.append(f"throughput {report['throughput_rps']:.1f}/s < {args.slo_min_rps:.1f}/s")
+    for pid, w in workers.items():
+        if args.slo_rss_mb is not None and w["peak_rss_mb"] > args.slo_rss_mb:
+            violations.append(f"worker {pid} peak RSS {w['peak_rss_mb']:.0f} MB > {args.slo_rss_mb:.0f} MB")
+    report["slo_violations"] = violations
+    return report
+
+
+def print_report(report: Dict[str, Any], args) -> None:
+    load = f"{args.rate}/s open-loop, <= {args.users} in flight" if args.rate else f"{args.users} users closed-loop"
+    print(f"\n{load}, {args.workers} workers x {args.threads} threads, page fraction {args.page_fraction}")
+    print(f"requests {report['requests']}  throughput {report['throughput_rps']:.1f}/s  "
+          f"errors {report['error_rate']:.2%}")
+    for err in report["errors"]:
+        print(f"  error: {err}")
+    for mode, p in report["latency_ms"].items():
+        if p:
+            print(f"  {mode:<10} " + "  ".join(f"{k} {v:8.1f}" for k, v in p.items()) + " ms")
+    for pid, w in report["workers"].items():
+        print(f"  worker {pid:>7}  cpu {w['cpu_s']:6.2f} s ({w['cpu_pct']:5.1f}%)  "
+              f"rss {w['rss_mb']:6.1f} MB  peak {w['peak_rss_mb']:6.1f} MB")
+    if report["slo_violations"]:
+        print("SLO VIOLATED:\n  " + "\n  ".join(report["slo_violations"]))
+    else:
+        print("SLOs met")
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--payloads", help="JSONL of /analyze bodies (default: synthetic policies)")
+    ap.add_argument("--users", type=int, default=8, help="concurrent clients (closed-loop) / max in flight")
+    ap.add_argument("--rate", type=float, help="open-loop Poisson arrivals per second")
+    ap.add_argument("--duration", type=float, default=30.0, help="seconds of load")
+    ap.add_argument("--page-fraction", type=float, default=0.2, help="share of page-mode (async) requests")
+    ap.add_argument("--workers", type=int, default=2)
+    ap.add_argument("--threads", type=int, default=4, help="gunicorn threads per worker")
+    ap.add_argument("--port", type=int, default=5081)
+    ap.add_argument("--config", help='JSON config overrides for the app, e.g. \'{"CASCADE_ENABLED": true}\'')
+    ap.add_argument("--request-timeout", type=float, default=60.0)
+    ap.add_argument("--keepalive", action="store_true",
+                    help="reuse each client's connection (pins a client to one worker)")
+    ap.add_argument("--seed", type=int, default=7)
+    # Fake Gemini latency (see bench/fake_gemini.py)
+    ap.add_argument("--gemini-base-ms", type=float, default=600.0)
+    ap.add_argument("--gemini-ms-per-category", type=float, default=60.0)
+    ap.add_argument("--gemini-tail-ms", type=float, default=4000.0)
+    ap.add_argument("--gemini-tail-rate", type=float, default=0.02)
+    # SLOs
+    ap.add_argument("--slo-p99-ms", type=float)
+    ap.add_argument("--slo-error-rate", type=float, default=0.01)
+    ap.add_argument("--slo-min-rps", type=float)
+    ap.add_argument("--slo-rss-mb", type=float)
+    ap.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = ap.parse_args()
+
+    if importlib.util.find_spec("gunicorn") is None:
+        raise SystemExit("the load test runs the app under gunicorn: pip install gunicorn")
+    payloads = load_payloads(args.payloads) if args.payloads else synthetic_payloads(50, random.Random(args.seed))
+
+    gemini = make_server(0, args.gemini_base_ms, args.gemini_tail_ms, args.gemini_tail_rate,
+                         args.gemini_ms_per_category, seed=args.seed)
+    threading.Thread(target=gemini.serve_forever, daemon=True).start()
+    gemini_base = f"http://127.0.0.1:{gemini.server_address[1]}"
+
+    with tempfile.TemporaryDirectory(prefix="privasee-loadtest-") as tmp:
+        server = start_server(args, gemini_base, os.path.join(tmp, "jobs.sqlite3"))
+        try:
+            if not wait_healthy(args.port, timeout=60.0):
+                print("server did not become healthy", file=sys.stderr)
+                sys.exit(2)
+            pids = worker_pids(server.pid)
+            before = {pid: proc_sample(pid) for pid in pids}
+            run = run_load(args, payloads)
+            workers = {}
+            for pid in pids:
+                try:
+                    after = proc_sample(pid)
+                except OSError:
+                    continue   # worker was recycled mid-run
+                cpu = after["cpu_s"] - before[pid]["cpu_s"]
+                workers[pid] = dict(after, cpu_s=cpu, cpu_pct=100.0 * cpu / run["elapsed"])
+        finally:
+            server.terminate()
+            server.wait(timeout=30)
+            gemini.shutdown()
+
+    report = build_report(run, workers, args)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report, args)
+    sys.exit(1 if report["slo_violations"] else 0)
+
+
+if __name__ == "__main__":
+    main()
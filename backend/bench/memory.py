@@ -0,0 +1,119 @@
+# bench/memory.py
+"""
+Memory regression check for /analyze: peak Python-heap allocation per request
+(tracemalloc) at several text sizes, one request at a time, through the real
+route with Gemini answered in-process by bench/fake_gemini's reply builder.
+
+  python -m backend.bench.memory [--sizes 10000 60000 120000] [--budget-mb 64]
+                                 [--baseline memory.json [--save]] [--tolerance 0.10] [--slack-mb 0.5]
+
+Prints per size the request peak, its cost per character of text and each
+stage's peak (memory.py). The budget is off for the unchunked pass ("bytes/char"
+is what SPACY_BYTES_PER_CHAR in config.py should be for the loaded model),
+then each size runs again under --budget-mb to show the chunked fallback.
+
+With --baseline, exits 1 when any size's peak (either pass) grew by more than
+--tolerance (and --slack-mb) over the saved numbers; --save writes the
+current ones instead. Baselines are only comparable for the same spaCy model
+and version, which the file records: a missing baseline, one saved with
+another model or one without some measured size exits 2 instead of passing.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tracemalloc
+
+from backend.app import config, memory, metrics
+from backend.app import summarizer_gemini
+from backend.bench.fake_gemini import fake_reply
+from backend.bench.spacy_threads import synthetic_texts
+
+_MB = 2 ** 20
+
+
+def _fake_gemini(prompt, system=None, retries=2, model=None):
+    return fake_reply(prompt, random.Random(len(prompt)))[0]
+
+
+def measure(client, text: str, budget_mb) -> dict:
+    """
+    One uncached /analyze request's heap peak (its "request" stage, which folds
+    in the peaks of the stages nested in it) and per-stage peaks.
+    """
+    config.REQUEST_MEMORY_BUDGET_MB = budget_mb
+    metrics.reset()
+    resp = client.post("/analyze", json={"text": text, "snippets_top_k": 3})
+    if resp.status_code != 200:
+        raise SystemExit(f"/analyze answered {resp.status_code}: {resp.get_data(as_text=True)[:200]}")
+    stages = {name[len("memory."):-len(".peak_mb_max")]: value
+              for name, value in metrics.snapshot().items() if name.endswith(".peak_mb_max")}
+    return {"peak_mb": stages.pop("request", 0.0), "chunked": metrics.get("memory.budget_chunked") > 0,
+            "stages": stages}
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--sizes", type=int, nargs="+", default=[10_000, 60_000, 120_000])
+    ap.add_argument("--budget-mb", type=float, default=config.REQUEST_MEMORY_BUDGET_MB or 64)
+    ap.add_argument("--baseline", help="JSON file of per-size peaks to compare with (or --save to)")
+    ap.add_argument("--save", action="store_true", help="write this run's peaks to --baseline")
+    ap.add_argument("--tolerance", type=float, default=0.10, help="allowed growth over the baseline")
+    ap.add_argument("--slack-mb", type=float, default=0.5, help="growth below this is noise, whatever the ratio")
+    args = ap.parse_args()
+
+    summarizer_gemini._call_gemini = _fake_gemini
+    config.TRUST_INDEX_PATH = config.TRENDS_PATH = config.EVIDENCE_INDEX_PATH = config.SIGNAL_STORE_PATH = None
+    from backend.app import create_app, pipeline
+    pipeline._cache.capacity = 0   # every request computes
+    client = create_app().test_client()
+    corpus = " ".join(synthetic_texts(max(80, max(args.sizes) // 1000)))
+    client.post("/analyze", json={"text": corpus[:2000]})   # load spaCy and the rules outside the measurement
+
+    from backend.app.nlp_spacy import _get_nlp
+    meta = _get_nlp().meta
+    model = f"{meta.get('lang', '')}_{meta.get('name', '')}-{meta.get('version', '')}"
+
+    tracemalloc.start()
+    current = {}
+    print(f"spaCy model: {os.environ.get('SPACY_MODEL_DIR') or 'en_core_web_sm'} ({model})")
+    for size in args.sizes:
+        passes = (("unchunked", None), (f"budget {args.budget_mb:g} MB", args.budget_mb))
+        for i, (label, budget) in enumerate(passes):
+            # A different text per pass: nothing (lexicon scans, sessions) is reused
+            out = measure(client, corpus[i * size:(i + 1) * size], budget)
+            current[f"{size}/{'budget' if budget else 'full'}"] = round(out["peak_mb"], 2)
+            stages = "  ".join(f"{k} {v:.1f}" for k, v in sorted(out["stages"].items()))
+            print(f"{size:>8,} chars  {label:<18} peak {out['peak_mb']:7.1f} MB  "
+                  f"{out['peak_mb'] * _MB / size:6.0f} bytes/char{'  (chunked)' if out['chunked'] else ''}"
+                  f"\n{'':18}stage peaks MB: {stages}")
+    tracemalloc.stop()
+
+    if not args.baseline:
+        return
+    if args.save:
+        with open(args.baseline, "w") as f:
+            json.dump({"model": model, "peaks": current}, f, indent=2, sort_keys=True)
+        print(f"baseline written to {args.baseline}")
+        return
+    if not os.path.exists(args.baseline):
+        ap.exit(2, f"no baseline at {args.baseline}: save one with --save on a known-good tree\n")
+    with open(args.baseline) as f:
+        saved = json.load(f)
+    if saved.get("model") != model:
+        ap.exit(2, f"baseline was saved with spaCy model {saved.get('model')!r}, this run uses {model!r}\n")
+    baseline = saved["peaks"]
+    missing = sorted(set(current) - set(baseline))
+    if missing:
+        ap.exit(2, f"baseline has no peaks for {', '.join(missing)}: save one for these --sizes\n")
+    grown = [(key, baseline[key], mb) for key, mb in current.items()
+             if mb > baseline[key] * (1 + args.tolerance) and mb - baseline[key] > args.slack_mb]
+    for key, was, now in grown:
+        print(f"REGRESSION {key}: {was:.1f} MB -> {now:.1f} MB (+{(now / was - 1) * 100:.0f}%)")
+    print("ok: no peak grew beyond tolerance" if not grown else f"{len(grown)} regression(s)")
+    sys.exit(1 if grown else 0)
+
+
+if __name__ == "__main__":
+    main()
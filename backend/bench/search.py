@@ -0,0 +1,96 @@
+# bench/search.py
+"""
+/search latency at corpus scale. Fills an evidence index with N synthetic
+policies (sentences assembled from policy-like clauses, about 40 per policy,
+evidence and heuristic rows), then times representative queries:
+
+  python -m backend.bench.search [--policies 50000] [--keep evidence.sqlite3 [--reuse]]
+"""
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from backend.app import config
+from backend.app.evidence_index import EvidenceIndex
+
+SUBJECTS = ["We", "Our partners", "Third parties", "Service providers", "Advertisers", "Affiliates"]
+VERBS = ["collect", "share", "sell", "retain", "process", "disclose", "transfer", "use"]
+OBJECTS = ["precise location", "your email address", "device identifiers", "browsing history",
+           "health information", "payment details", "contacts", "biometric data", "IP addresses"]
+TAILS = ["with data brokers", "for targeted advertising", "for as long as necessary", "to improve our services",
+         "outside the European Economic Area", "unless you opt out", "with your consent",
+         "to comply with legal obligations", "using encryption", "for children under 13"]
+
+QUERIES = [
+    ("phrase", dict(q='"data brokers"')),
+    ("AND, one sentence", dict(q='"data brokers" AND "precise location"')),
+    ("AND, one policy", dict(q='"data brokers" AND "precise location"', scope="policy")),
+    ("category + score", dict(q="sell* OR share", categories=["Third-Party Sharing/Selling"], min_score=0.6)),
+    ("AND, policy, ranked", dict(q='"data brokers" AND "precise location"', scope="policy", order="relevance")),
+    ("NOT, one policy", dict(q='biometric NOT consent', scope="policy")),
+    ("policy + category", dict(q='"data brokers" AND biometric', scope="policy", categories=["Data Collection"])),
+    ("rare term", dict(q='"payment details" AND "European Economic Area"')),
+    ("phrase, ranked", dict(q='"data brokers"', order="relevance")),
+]
+
+
+def fill(index: EvidenceIndex, policies: int, seed: int = 1) -> None:
+    rng = random.Random(seed)
+    cats = list(config.CATEGORY_WEIGHTS)
+    batch = []
+    for p in range(policies):
+        evidence = {c: [] for c in cats}
+        units = []
+        pos = 0
+        for _ in range(rng.randint(25, 55)):
+            text = f"{rng.choice(SUBJECTS)} {rng.choice(VERBS)} {rng.choice(OBJECTS)} {rng.choice(TAILS)}."
+            if rng.random() < 0.7:
+                evidence[rng.choice(cats)].append({"text": text, "start": pos, "end": pos + len(text),
+                                                   "score": round(rng.random(), 2)})
+            else:
+                units.append({"pattern": "SYNTH", "category": rng.choice(cats), "start": pos,
+                              "end": pos + len(text), "text": text})
+            pos += len(text) + 1
+        batch.append({"text_hash": f"{p:032x}", "url": f"https://site{p}.com/privacy", "rules": "bench",
+                      "top_k": None, "evidence": evidence, "heuristic_units": units})
+        if len(batch) == 1000:
+            index.add(batch)
+            batch = []
+    index.add(batch)
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--policies", type=int, default=50_000)
+    ap.add_argument("--keep", help="write the index here and keep it")
+    ap.add_argument("--reuse", action="store_true", help="query the --keep index as is, without filling it")
+    args = ap.parse_args()
+
+    path = args.keep or os.path.join(tempfile.mkdtemp(prefix="search-bench-"), "evidence.sqlite3")
+    index = EvidenceIndex(path)
+    t = time.perf_counter()
+    if not (args.reuse and args.keep):
+        fill(index, args.policies)
+    took = time.perf_counter() - t
+    stats = index.stats()
+    print(f"{stats['policies']:,} policies / {sum(stats['sentences'].values()):,} sentences "
+          f"({os.path.getsize(path) / 2**20:.0f} MiB)" + ("" if args.reuse else f", indexed in {took:.1f}s"))
+
+    for name, kw in QUERIES:
+        index.search(**kw)   # warm the page cache
+        lat, out = [], None
+        for _ in range(10):
+            t = time.perf_counter()
+            out = index.search(**kw)
+            lat.append(time.perf_counter() - t)
+        print(f"  {name:<22} {out['total']:>8,}{'' if out['exact'] else '+'} hits  median {statistics.median(lat) * 1e3:7.1f} ms  "
+              f"max {max(lat) * 1e3:7.1f} ms")
+    if not args.keep:
+        os.unlink(path)
+
+
+if __name__ == "__main__":
+    main()
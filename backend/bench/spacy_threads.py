@@ -0,0 +1,132 @@
+# bench/spacy_threads.py
+"""
+Concurrency stress test for the shared spaCy model (nlp_spacy.py) under a
+threaded server:
+
+  python -m backend.bench.spacy_threads [--threads 16] [--rounds 5] [--pool 4] [--texts 48]
+
+1. cold start: --threads threads hit an unloaded model at once (behind a
+   barrier); the model must load once and the Matcher build once.
+2. determinism: every text is analysed serially on one thread first
+   (SPACY_THREADS = 0), then --rounds times from --threads threads through the
+   pool while another thread keeps forcing Matcher rebuilds, as a rule reload
+   does; each result must equal the serial one.
+3. throughput: texts/s serial vs threaded.
+
+Exits 1 on any extra load/build or any differing result. Point SPACY_MODEL_DIR
+at a model directory to test something other than en_core_web_sm.
+"""
+import argparse
+import json
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import spacy
+
+from backend.app import config, nlp_spacy, rules
+from backend.bench.search import OBJECTS, SUBJECTS, TAILS, VERBS
+
+
+def synthetic_texts(n: int, seed: int = 7):
+    rng = random.Random(seed)
+    return [" ".join(f"{rng.choice(SUBJECTS)} {rng.choice(VERBS)} {rng.choice(OBJECTS)} {rng.choice(TAILS)}."
+                     for _ in range(rng.randint(20, 400)))
+            for _ in range(n)]
+
+
+def analyse(text: str) -> str:
+    """One request's spaCy work, serialized for comparison."""
+    return json.dumps([nlp_spacy.spacy_extract_category_lines(text, top_k=3),
+                       nlp_spacy.spacy_scores(text)], sort_keys=True)
+
+
+class Counted:
+    """Wraps a function and counts calls (spacy.load, Matcher builds)."""
+
+    def __init__(self, fn):
+        self.fn, self.calls = fn, 0
+        self._lock = threading.Lock()
+
+    def __call__(self, *args, **kwargs):
+        with self._lock:
+            self.calls += 1
+        return self.fn(*args, **kwargs)
+
+
+def cold_start(threads: int, text: str) -> tuple:
+    loads, builds = Counted(spacy.load), Counted(nlp_spacy._build_matchers)
+    spacy.load, nlp_spacy._build_matchers = loads, builds
+    nlp_spacy._nlp = nlp_spacy._MATCHERS = None
+    barrier = threading.Barrier(threads)
+
+    def first_request():
+        barrier.wait()
+        return analyse(text)
+
+    try:
+        with ThreadPoolExecutor(threads) as ex:
+            results = set(ex.map(lambda _: first_request(), range(threads)))
+    finally:
+        spacy.load, nlp_spacy._build_matchers = loads.fn, builds.fn
+    return loads.calls, builds.calls, len(results)
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--threads", type=int, default=16, help="concurrent request threads")
+    ap.add_argument("--rounds", type=int, default=5, help="threaded passes over the texts")
+    ap.add_argument("--pool", type=int, default=4, help="SPACY_THREADS for the threaded passes")
+    ap.add_argument("--texts", type=int, default=48)
+    args = ap.parse_args()
+
+    texts = synthetic_texts(args.texts)
+    failed = False
+
+    config.SPACY_THREADS = args.pool
+    loads, builds, distinct = cold_start(args.threads, texts[0])
+    print(f"cold start, {args.threads} threads: {loads} model load(s), {builds} matcher build(s), "
+          f"{distinct} distinct result(s)")
+    failed |= (loads, builds, distinct) != (1, 1, 1)
+
+    config.SPACY_THREADS = 0
+    t = time.perf_counter()
+    expected = [analyse(text) for text in texts]
+    serial = time.perf_counter() - t
+
+    config.SPACY_THREADS = args.pool
+    stop = threading.Event()
+    rebuilds = 0
+
+    def churn():
+        # What the rules watcher does after a reload, as often as possible
+        nonlocal rebuilds
+        while not stop.is_set():
+            nlp_spacy._MATCHERS = None
+            nlp_spacy._warm_matchers(rules.current())
+            rebuilds += 1
+            time.sleep(0.005)
+
+    churner = threading.Thread(target=churn, daemon=True)
+    churner.start()
+    jobs = [i for _ in range(args.rounds) for i in range(len(texts))]
+    random.Random(1).shuffle(jobs)
+    t = time.perf_counter()
+    with ThreadPoolExecutor(args.threads) as ex:
+        got = list(ex.map(lambda i: (i, analyse(texts[i])), jobs))
+    threaded = time.perf_counter() - t
+    stop.set()
+    churner.join()
+
+    mismatches = sum(1 for i, out in got if out != expected[i])
+    print(f"determinism: {len(got)} threaded results ({args.threads} threads, pool {args.pool}, "
+          f"{rebuilds} matcher rebuilds meanwhile), {mismatches} differ from serial")
+    failed |= mismatches > 0
+    print(f"throughput: serial {len(texts) / serial:.1f} texts/s, threaded {len(jobs) / threaded:.1f} texts/s")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
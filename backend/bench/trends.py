@@ -0,0 +1,106 @@
+# bench/trends.py
+"""
+Trend-store query latency at scale. Generates a synthetic history (N analyses
+over M domains and two years, with category scores and flags) straight into
+Parquet parts, compacts it like the live writer does, then times the /trends
+queries:
+
+  python -m backend.bench.trends [--analyses 2000000] [--domains 20000] [--parts 64] [--keep DIR]
+
+Also times write_batch() for one live-sized batch, i.e. what the write-behind
+thread spends per flush.
+"""
+import argparse
+import os
+import shutil
+import statistics
+import tempfile
+import time
+
+import duckdb
+
+from backend.app import config, rules, trends
+
+
+def generate(path: str, analyses: int, domains: int, parts: int) -> None:
+    categories = list(config.CATEGORY_WEIGHTS)
+    patterns = [(key, spec["cat"]) for key, spec in rules.current().patterns.items()]
+    con = duckdb.connect()
+    con.execute(f"CREATE TABLE cats AS SELECT * FROM (VALUES {', '.join(f'({i}, {c!r})' for i, c in enumerate(categories))}) t(i, category)")
+    con.execute(f"CREATE TABLE pats AS SELECT * FROM (VALUES {', '.join(f'({i}, {k!r}, {c!r})' for i, (k, c) in enumerate(patterns))}) t(i, pattern, category)")
+    per_part = analyses // parts
+    start = time.time() - 730 * 86400
+    for part in range(parts):
+        lo = part * per_part
+        con.execute(f"""
+            CREATE OR REPLACE TABLE a AS
+            SELECT make_timestamp(CAST(({start} + (i / {analyses}) * 730 * 86400) * 1e6 AS BIGINT)) AS ts,
+                   'site' || (hash(i) % {domains}) || '.com' AS domain,
+                   NULL::VARCHAR AS url, md5(i::VARCHAR)[:32] AS text_hash,
+                   round(30 + random() * 60, 1) AS trust_score, NULL::VARCHAR AS risk_level,
+                   round(30 + random() * 60, 1) AS base_score, NULL::VARCHAR AS base_risk, 'live' AS source
+            FROM range({lo}, {lo + per_part}) r(i)""")
+        con.execute("UPDATE a SET risk_level = CASE WHEN trust_score <= 39 THEN 'High' WHEN trust_score <= 69 THEN 'Medium' ELSE 'Low' END, base_risk = CASE WHEN base_score <= 39 THEN 'High' WHEN base_score <= 69 THEN 'Medium' ELSE 'Low' END")
+        for table, sql in (
+            ("analyses", "SELECT * FROM a"),
+            ("category_scores", "SELECT ts, domain, text_hash, category, round(random(), 3) AS score FROM a, cats"),
+            ("flags", f"SELECT ts, domain, text_hash, pattern, category, CAST(1 + random() * 3 AS INTEGER) AS hits "
+                      f"FROM a, pats WHERE random() < 3.0 / {len(patterns)}"),
+        ):
+            os.makedirs(os.path.join(path, table), exist_ok=True)
+            trends._copy_to_parquet(con, sql, os.path.join(path, table, trends._part_name("part")))
+    con.close()
+
+
+def timed(fn, runs: int = 15) -> str:
+    fn()   # warm (file metadata)
+    lat = []
+    for _ in range(runs):
+        t = time.perf_counter()
+        fn()
+        lat.append(time.perf_counter() - t)
+    return f"median {statistics.median(lat) * 1e3:7.1f} ms   max {max(lat) * 1e3:7.1f} ms"
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--analyses", type=int, default=2_000_000)
+    ap.add_argument("--domains", type=int, default=20_000)
+    ap.add_argument("--parts", type=int, default=64)
+    ap.add_argument("--keep", help="write the store here and keep it")
+    args = ap.parse_args()
+
+    path = args.keep or tempfile.mkdtemp(prefix="trends-bench-")
+    try:
+        t = time.perf_counter()
+        generate(path, args.analyses, args.domains, args.parts)
+        print(f"generated {args.analyses:,} analyses in {args.parts} parts: {time.perf_counter() - t:.1f}s")
+
+        probes = [
+            ("domain history, month", lambda: trends.domain_history(path, "site42.com")),
+            ("domain history, week, 1y", lambda: trends.domain_history(path, "site42.com", "week", since="2025-10-01")),
+            ("flag frequency, month", lambda: trends.flag_frequency(path)),
+            ("flag frequency, one domain", lambda: trends.flag_frequency(path, domain="site42.com")),
+        ]
+        for label in ("uncompacted", "compacted"):
+            if label == "compacted":
+                t = time.perf_counter()
+                trends.compact(path, full=True)
+                print(f"compacted in {time.perf_counter() - t:.1f}s")
+            for name, fn in probes:
+                print(f"  {label:<12} {name:<28} {timed(fn)}")
+
+        signals = {"heuristics": {c: {"delta": -0.1, "hits": {"SELL_DATA": 2}} for c in config.CATEGORY_WEIGHTS},
+                   "llm": {c: {"score": 0.6} for c in config.CATEGORY_WEIGHTS}, "spacy": {}}
+        batch = [(time.time(), f"https://site{i}.com/privacy", "0" * 32, signals, 55.0, "Medium", None, "live")
+                 for i in range(config.TRENDS_FLUSH_ROWS)]
+        t = time.perf_counter()
+        trends.write_batch(path, batch)
+        print(f"write_batch({len(batch)} analyses): {(time.perf_counter() - t) * 1e3:.0f} ms (writer thread)")
+    finally:
+        if not args.keep:
+            shutil.rmtree(path, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -69,19 +69,17 @@ async function handleAnalysisRequest(message) {
       });
     });
 
-    let result;
+    let transformed;
     
     if (USE_MOCK_DATA) {
       // Use mock data for testing without backend
-      result = await getMockAnalysis(text, url);
+      transformed = transformBackendResponse(await getMockAnalysis(text, url));
     } else {
-      // Call real backend with user preferences
-      result = await analyzeWithBackend(text, url, userPreferences);
+      // Reuse a prior analysis of the same text when the backend says it's current,
+      // else call the real backend with user preferences
+      transformed = await analyzeWithReuse(text, url, userPreferences);
     }
     
-    // Transform to frontend format
-    const transformed = transformBackendResponse(result);
-    
     // Cache the result
     await cacheAnalysis(transformed);
     
@@ -226,17 +224,19 @@ async function analyzeWithBackend(text, url, userPreferences = {}) {
   console.log(`Text length: ${text.length} chars`);
   console.log(`User preferences:`, userPreferences);
   
-  const requestBody = {
+  const requestBody = buildRequestBody({
     text: text,
-    mode: text.length > 10000 ? 'page' : 'selection',
-    return_snippets: true,
-    snippets_top_k: 3,
-    include_spacy_probs: true
-  };
+    url: url,
+    session_id: await getAnalysisSessionId(url),
+    mode: text.length > 10000 ? 'page' : 'selection'
+  }, userPreferences);
   
-  // Only include preferences if they exist and are not empty
-  if (userPreferences && Object.keys(userPreferences).length > 0) {
-    requestBody.preferences = userPreferences;
+  // Page-mode analyses can outlive proxy timeouts: run them as a backend job and poll
+  if (requestBody.mode === 'page') {
+    requestBody.async = true;
+  }
+  
+  if (requestBody.preferences) {
     console.log('Including user preferences in request:', userPreferences);
   } else {
     console.log('No user preferences to send');
@@ -255,10 +255,161 @@ async function analyzeWithBackend(text, url, userPreferences = {}) {
     throw new Error(`Backend error (${response.status}): ${errorText}`);
   }
   
-  const result = await response.json();
+  let result = await response.json();
+  // Names the result by its inputs; a 202 carries the tag of the job's result
+  const etag = response.headers.get('ETag');
+  
+  if (response.status === 202 && result.job_id) {
+    result = await pollAnalysisJob(result.job_id);
+  }
   console.log('Backend analysis complete:', result);
   
-  return result;
+  return { result, etag };
+}
+
+// Options and preferences sent with every analysis. A hash-only probe must send
+// the same ones as the full request: the backend's ETag depends on them.
+function buildRequestBody(fields, userPreferences) {
+  const requestBody = {
+    ...fields,
+    return_snippets: true,
+    snippets_top_k: 3,
+    include_spacy_probs: true
+  };
+  
+  // Only include preferences if they exist and are not empty
+  if (userPreferences && Object.keys(userPreferences).length > 0) {
+    requestBody.preferences = userPreferences;
+  }
+  return requestBody;
+}
+
+// Same id for every analysis of one page from this install, so the backend can
+// rescan only what changed when a selection is expanded or switched to page mode
+async function getAnalysisSessionId(url) {
+  const installId = await new Promise((resolve) => {
+    chrome.storage.local.get(['installId'], (data) => {
+      if (data.installId) {
+        resolve(data.installId);
+        return;
+      }
+      const id = crypto.randomUUID();
+      chrome.storage.local.set({ installId: id }, () => resolve(id));
+    });
+  });
+  return `${installId}:${url || ''}`;
+}
+
+async function pollAnalysisJob(jobId, maxAttempts = 20) {
+  // Long-poll: each request waits up to 25s server-side for the job to finish
+  const endpoint = `${BACKEND_URL}/jobs/${jobId}?wait=25`;
+  
+  for (let attempt = 0; attempt < maxAttempts; attempt++) {
+    const response = await fetch(endpoint, { method: 'GET' });
+    const body = await response.json();
+    
+    if (response.status === 200) {
+      if (body.status === 'done') {
+        return body.result;
+      }
+      throw new Error(`Backend job ${body.status}: ${body.error || 'unknown error'}`);
+    }
+    if (response.status !== 202) {
+      throw new Error(`Backend error (${response.status}): ${body.message || ''}`);
+    }
+    console.log(`Job ${jobId} still ${body.status}...`);
+  }
+  throw new Error(`Backend job ${jobId} did not finish in time`);
+}
+
+// ============================================
+// RESULT REUSE (content-hash LRU + conditional requests)
+// ============================================
+
+const ANALYSIS_CACHE_SIZE = 25; // prior analyses kept, keyed by text hash
+
+async function analyzeWithReuse(text, url, userPreferences) {
+  const hash = await textHash(text);
+  const cached = await getCachedByHash(hash);
+  
+  // Probe with the hash alone: 304 if our copy is current, 200 if the backend
+  // still has the text's analysis, 404 if it needs the full text
+  const probe = await probeBackend(hash, url, userPreferences, cached?.etag);
+  if (probe.status === 304 && cached) {
+    console.log('Backend: cached analysis is current (304), nothing uploaded');
+    await putCachedByHash(hash, cached.result, cached.etag);
+    return cached.result;
+  }
+  
+  let result, etag;
+  if (probe.status === 200) {
+    console.log('Backend: answered from the text hash, nothing uploaded');
+    ({ result, etag } = probe);
+  } else {
+    ({ result, etag } = await analyzeWithBackend(text, url, userPreferences));
+  }
+  
+  // Transform to frontend format
+  const transformed = transformBackendResponse(result);
+  await putCachedByHash(hash, transformed, etag);
+  return transformed;
+}
+
+async function probeBackend(hash, url, userPreferences, etag) {
+  const headers = { 'Content-Type': 'application/json' };
+  if (etag) {
+    headers['If-None-Match'] = etag;
+  }
+  try {
+    const response = await fetch(`${BACKEND_URL}/analyze`, {
+      method: 'POST',
+      headers: headers,
+      body: JSON.stringify(buildRequestBody({ text_hash: hash, url: url }, userPreferences))
+    });
+    if (response.status === 304) {
+      return { status: 304 };
+    }
+    if (response.ok) {
+      return { status: 200, result: await response.json(), etag: response.headers.get('ETag') };
+    }
+  } catch (error) {
+    console.warn('Hash probe failed, sending the text:', error.message);
+  }
+  return { status: 404 };
+}
+
+// SHA-256 hex of the text as the backend hashes it (app/hashing.py):
+// whitespace runs collapsed to one space, ends trimmed
+async function textHash(text) {
+  const normalized = text.replace(/\s+/g, ' ').trim();
+  const digest = await crypto.subtle.digest('SHA-256', new TextEncoder().encode(normalized));
+  return Array.from(new Uint8Array(digest), b => b.toString(16).padStart(2, '0')).join('');
+}
+
+function readAnalysisCache() {
+  return new Promise((resolve) => {
+    chrome.storage.local.get(['analysisCache'], (data) => {
+      resolve(data.analysisCache || { order: [], entries: {} });
+    });
+  });
+}
+
+async function getCachedByHash(hash) {
+  const cache = await readAnalysisCache();
+  return cache.entries[hash] || null;
+}
+
+async function putCachedByHash(hash, result, etag) {
+  const cache = await readAnalysisCache();
+  cache.entries[hash] = { result, etag, time: Date.now() };
+  // Most recently used last; evict from the front
+  cache.order = cache.order.filter(h => h !== hash).concat(hash);
+  while (cache.order.length > ANALYSIS_CACHE_SIZE) {
+    delete cache.entries[cache.order.shift()];
+  }
+  return new Promise((resolve) => {
+    chrome.storage.local.set({ analysisCache: cache }, () => resolve());
+  });
 }
 
 // ============================================
@@ -373,7 +524,7 @@ async function getCachedAnalysis() {
 
 async function clearCache() {
   return new Promise((resolve) => {
-    chrome.storage.local.remove(['lastAnalysis', 'lastAnalysisTime'], () => {
+    chrome.storage.local.remove(['lastAnalysis', 'lastAnalysisTime', 'analysisCache'], () => {
       console.log('Cache cleared');
       resolve();
     });